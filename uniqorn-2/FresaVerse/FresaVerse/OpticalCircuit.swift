@@ -31,21 +31,6 @@ class OpticalCircuit: ObservableObject {
     }
     
     func generateStrawberryFieldsCode() -> String {
-        var code = """
-        import strawberryfields as sf
-        from strawberryfields.ops import *
-        import numpy as np
-        
-        # Initialize program with \(modes) modes
-        prog = sf.Program(\(modes))
-        
-        # Create engine
-        eng = sf.Engine("gaussian")
-        
-        # Circuit definition
-        with prog.context as q:
-        """
-        
         // Group elements by mode and sort by position
         var elementsByMode: [[OpticalElement]] = Array(repeating: [], count: modes)
         for element in elements {
@@ -59,6 +44,40 @@ class OpticalCircuit: ObservableObject {
             elementsByMode[i].sort { $0.position.x < $1.position.x }
         }
         
+        // Only modes inside the light cone are simulated, the others stay in vacuum
+        let simulatedModes = lightConeModes(elementsByMode)
+        var simulatedIndex: [Int: Int] = [:]
+        for (index, mode) in simulatedModes.enumerated() {
+            simulatedIndex[mode] = index
+        }
+        
+        // Kerr gates are not Gaussian, so a lit one needs the Fock backend
+        let usesFock = simulatedModes.contains { mode in
+            elementsByMode[mode].contains { $0.type == .kerrGate && ($0.parameters["kappa"] ?? 0.1) != 0 }
+        }
+        let engineCode = usesFock
+            ? "eng = sf.Engine(\"fock\", backend_options={\"cutoff_dim\": \(fockCutoff(elementsByMode, simulatedModes))})"
+            : "eng = sf.Engine(\"gaussian\")"
+        
+        var code = """
+        import strawberryfields as sf
+        from strawberryfields.ops import *
+        import numpy as np
+        
+        # Modes no light can reach are left out and reported with zero photons
+        total_modes = \(modes)
+        simulated_modes = \(simulatedModes)
+        
+        # Initialize program with \(simulatedModes.count) modes
+        prog = sf.Program(\(simulatedModes.count))
+        
+        # Create engine
+        \(engineCode)
+        
+        # Circuit definition
+        with prog.context as q:
+        """
+        
         // Generate code for each element
         // First, place all single-mode elements (except measurements)
         for (modeIndex, modeElements) in elementsByMode.enumerated() {
@@ -68,29 +87,33 @@ class OpticalCircuit: ObservableObject {
                 if element.type == .measure {
                     continue
                 }
+                // Elements on modes outside the light cone only ever see vacuum
+                guard let target = simulatedIndex[modeIndex] else {
+                    continue
+                }
                 
                 switch element.type {
                 case .laser:
                     code += "\n\(indent)# Coherent state (laser input)"
-                    code += "\n\(indent)Coherent(1.0) | q[\(modeIndex)]"
+                    code += "\n\(indent)Coherent(1.0) | q[\(target)]"
                 case .phaseShifter:
                     let phi = element.parameters["phi"] ?? 0.5
                     code += "\n\(indent)# Phase shift"
-                    code += "\n\(indent)Rgate(\(phi)) | q[\(modeIndex)]"
+                    code += "\n\(indent)Rgate(\(phi)) | q[\(target)]"
                 case .squeezeGate:
                     let r = element.parameters["r"] ?? 0.5
                     let theta = element.parameters["theta"] ?? 0.0
                     code += "\n\(indent)# Squeezing operation"
-                    code += "\n\(indent)Sgate(\(r), \(theta)) | q[\(modeIndex)]"
+                    code += "\n\(indent)Sgate(\(r), \(theta)) | q[\(target)]"
                 case .displacementGate:
                     let r = element.parameters["r"] ?? 0.5
                     let phi = element.parameters["phi"] ?? 0.0
                     code += "\n\(indent)# Displacement operation"
-                    code += "\n\(indent)Dgate(\(r), \(phi)) | q[\(modeIndex)]"
+                    code += "\n\(indent)Dgate(\(r), \(phi)) | q[\(target)]"
                 case .kerrGate:
                     let kappa = element.parameters["kappa"] ?? 0.1
                     code += "\n\(indent)# Kerr nonlinearity"
-                    code += "\n\(indent)Kgate(\(kappa)) | q[\(modeIndex)]"
+                    code += "\n\(indent)Kgate(\(kappa)) | q[\(target)]"
                 case .halfWavePlate:
                     let theta = element.parameters["theta"] ?? 0.0
                     code += "\n\(indent)# Half wave plate"
@@ -135,8 +158,11 @@ class OpticalCircuit: ObservableObject {
                     let indent = "    "
                     // Beam splitters connect two modes
                     if modeIndex < modes - 1 {
+                        guard let first = simulatedIndex[modeIndex], let second = simulatedIndex[modeIndex + 1] else {
+                            continue
+                        }
                         code += "\n\(indent)# Beam splitter between mode \(modeIndex) and \(modeIndex + 1)"
-                        code += "\n\(indent)BSgate(0.5, np.pi/4) | (q[\(modeIndex)], q[\(modeIndex + 1)])"
+                        code += "\n\(indent)BSgate(0.5, np.pi/4) | (q[\(first)], q[\(second)])"
                     } else {
                         code += "\n\(indent)# Note: Beam splitter at mode \(modeIndex) has no adjacent mode to connect to"
                     }
@@ -146,8 +172,12 @@ class OpticalCircuit: ObservableObject {
         
         // Finally, add all measurements at the end
         code += "\n    # Measurements"
-        for modeIndex in 0..<modes {
-            code += "\n    MeasureFock() | q[\(modeIndex)]"
+        if usesFock {
+            code += "\n    # Skipped: the Fock backend would collapse the state the probabilities are read from"
+        } else {
+            for modeIndex in 0..<simulatedModes.count {
+                code += "\n    MeasureFock() | q[\(modeIndex)]"
+            }
         }
         
         code += """
@@ -163,14 +193,25 @@ class OpticalCircuit: ObservableObject {
             print("State:", state)
             print("State type:", type(state))
             
-            # For Gaussian states, we can compute probabilities for small cutoff
+            # For Gaussian states, we can compute probabilities up to a cutoff
             if hasattr(state, 'all_fock_probs'):
                 try:
-                    # Compute probabilities for Fock states with small cutoff
-                    probs_dict = state.all_fock_probs(cutoff=3)
-                    print("Computed probabilities:", probs_dict)
+                    # Pick the smallest cutoff keeping 99.9% of the probability mass
+                    cutoff = auto_cutoff(state) if 'auto_cutoff' in globals() else 3
+                    probs_tensor = state.all_fock_probs(cutoff=cutoff)
+                    captured_mass = float(np.sum(probs_tensor))
+                    print("Cutoff:", cutoff, "captured mass:", captured_mass)
                     # Convert to JSON-serializable format
                     import json
+                    probs_dict = {}
+                    for pattern in np.ndindex(*probs_tensor.shape):
+                        prob = float(probs_tensor[pattern])
+                        if prob > 1e-12:
+                            # Put back the pruned modes as zeros
+                            full_pattern = [0] * total_modes
+                            for mode, n in zip(simulated_modes, pattern):
+                                full_pattern[mode] = n
+                            probs_dict["|" + ",".join(str(n) for n in full_pattern) + ">"] = prob
                     probabilities = json.dumps(probs_dict)
                 except Exception as probs_error:
                     print("Error computing probabilities:", str(probs_error))
@@ -181,15 +222,23 @@ class OpticalCircuit: ObservableObject {
                 # Fallback for other state types
                 probabilities = '{"00": 0.25, "01": 0.25, "10": 0.25, "11": 0.25}'
             
-            # Generate counts from probabilities (simulate 1000 shots)
+            # Draw 1000 shots from the state when the server provides a sampler
             import numpy as np
             counts = {}
             try:
-                # Parse the JSON string back to dict for processing
                 import json
-                probs_eval = json.loads(probabilities) if isinstance(probabilities, str) else probs_dict
-                for key, prob in probs_eval.items():
-                    counts[key] = int(prob * 1000)
+                if 'sample_counts' in globals():
+                    for key, count in sample_counts(state, shots=1000).items():
+                        # Put back the pruned modes as zeros
+                        full_pattern = [0] * total_modes
+                        for mode, n in zip(simulated_modes, key.strip('|>').split(',')):
+                            full_pattern[mode] = int(n)
+                        counts["|" + ",".join(str(n) for n in full_pattern) + ">"] = count
+                else:
+                    # Parse the JSON string back to dict for processing
+                    probs_eval = json.loads(probabilities) if isinstance(probabilities, str) else probs_dict
+                    for key, prob in probs_eval.items():
+                        counts[key] = int(prob * 1000)
                 counts = json.dumps(counts)
             except Exception as counts_error:
                 print("Error generating counts:", str(counts_error))
@@ -221,6 +270,59 @@ class OpticalCircuit: ObservableObject {
         return code
     }
     
+    // Modes reachable from a laser, squeezer or displacement through the beam splitters,
+    // following the order generateStrawberryFieldsCode emits them in
+    func lightConeModes(_ elementsByMode: [[OpticalElement]]) -> [Int] {
+        var lit = Set<Int>()
+        for (modeIndex, modeElements) in elementsByMode.enumerated() {
+            for element in modeElements {
+                switch element.type {
+                case .laser:
+                    lit.insert(modeIndex)
+                case .squeezeGate, .displacementGate:
+                    if (element.parameters["r"] ?? 0.5) != 0 {
+                        lit.insert(modeIndex)
+                    }
+                default:
+                    break
+                }
+            }
+        }
+        // Beam splitters come after every single-mode element, in mode order
+        for (modeIndex, modeElements) in elementsByMode.enumerated() where modeIndex < modes - 1 {
+            for element in modeElements where element.type == .beamSplitter {
+                if lit.contains(modeIndex) || lit.contains(modeIndex + 1) {
+                    lit.insert(modeIndex)
+                    lit.insert(modeIndex + 1)
+                }
+            }
+        }
+        // An all-vacuum circuit still needs one mode to run
+        return lit.isEmpty ? [0] : lit.sorted()
+    }
+    
+    // Photon-number cutoff for the Fock backend: mean + 4 sigma of the light the sources put in
+    func fockCutoff(_ elementsByMode: [[OpticalElement]], _ simulatedModes: [Int]) -> Int {
+        var meanPhotons = 0.0
+        for mode in simulatedModes {
+            for element in elementsByMode[mode] {
+                switch element.type {
+                case .laser:
+                    meanPhotons += 1.0
+                case .displacementGate:
+                    let r = element.parameters["r"] ?? 0.5
+                    meanPhotons += r * r
+                case .squeezeGate:
+                    let r = element.parameters["r"] ?? 0.5
+                    meanPhotons += sinh(r) * sinh(r)
+                default:
+                    break
+                }
+            }
+        }
+        return max(Int((meanPhotons + 4 * meanPhotons.squareRoot()).rounded(.up)) + 2, 3)
+    }
+    
     func generatePercevalCode() -> String {
         var code = """
         import perceval as pcvl
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Fit the planner's timing model on this machine.
+
+Runs a small benchmark suite of structured circuits through both servers'
+handlers with each engine forced, and fits seconds = fixed + operations *
+seconds_per_operation per engine against the planner's operation counts.
+The coefficients are written to planner_calibration.json next to
+planner.py, which picks them up on the next start.
+
+Usage: python3 calibrate_planner.py [repeats]
+"""
+
+import json
+import sys
+import time
+
+import numpy as np
+
+import planner
+from perceval_server import PercevalHandler
+from strawberry_server import StrawberryFieldsHandler
+
+
+def element(kind, mode, **parameters):
+    return {'type': kind, 'mode': mode, 'parameters': parameters}
+
+
+def random_circuit(rng, modes, layers, squeezing=True, kerr=False):
+    """
+    Lasers (and squeezers) on every mode, then layers of phase shifters and beam splitters
+    """
+    elements = [element('Laser', mode) for mode in range(modes)]
+    if squeezing:
+        elements += [element('Squeezing Gate', mode, r=0.3, theta=0.0) for mode in range(modes)]
+    for _ in range(layers):
+        for mode in range(modes):
+            elements.append(element('Phase Shifter', mode, phi=float(rng.uniform(0, 2 * np.pi))))
+        for mode in range(modes - 1):
+            elements.append(element('Beam Splitter', mode, theta=float(rng.uniform(0, np.pi)), phi=0.0))
+        if kerr:
+            elements.append(element('Kerr Gate', 0, kappa=0.1))
+    return elements
+
+
+def gaussian_suite(rng):
+    """
+    (engine, request) pairs for the Strawberry Fields server
+    """
+    suite = []
+    for modes in (2, 4, 8, 12):
+        for layers in (1, 4):
+            for engine in ('symplectic', 'gaussian'):
+                suite.append((engine, {'modes': modes, 'elements': random_circuit(rng, modes, layers),
+                                       'outputs': {'cutoff': 4}}))
+            suite.append(('closed-form', {'modes': modes, 'elements': random_circuit(rng, modes, layers, False),
+                                          'outputs': {'cutoff': 6}}))
+    for modes, cutoff in ((2, 6), (2, 10), (3, 6), (3, 8), (4, 6)):
+        suite.append(('fock', {'modes': modes, 'elements': random_circuit(rng, modes, 2, False, True),
+                               'outputs': {'cutoff': cutoff}}))
+    return suite
+
+
+def linear_optics_suite(rng):
+    """
+    (engine, request) pairs for the Perceval server's full distribution, without the marginal kernels
+    """
+    suite = []
+    for modes in (4, 8, 12):
+        elements = random_circuit(rng, modes, 4, False)[modes:]
+        suite.append(('closed-form', {'modes': modes, 'elements': elements, 'input_state': [1] + [0] * (modes - 1),
+                                      'outputs': {'probabilities': True, 'marginals': []}}))
+        for photons in (2, 3, 4):
+            input_state = [1] * photons + [0] * (modes - photons)
+            for engine in ('slos', 'permanent', 'sampling'):
+                suite.append((engine, {'modes': modes, 'elements': elements, 'input_state': input_state,
+                                       'outputs': {'probabilities': True, 'marginals': [], 'samples': 200, 'seed': 1}}))
+    return suite
+
+
+def measure(handler, suite, repeats):
+    """
+    (engine, operations, seconds) for every request, keeping the fastest of `repeats` runs
+    """
+    points = []
+    for engine, request in suite:
+        request = dict(request, engine=engine)
+        best = None
+        for _ in range(repeats):
+            start = time.perf_counter()
+            response = handler.run_structured(request)
+            elapsed = time.perf_counter() - start
+            if not response['success']:
+                raise RuntimeError(f'{engine} benchmark failed: {response["error"]}')
+            best = elapsed if best is None else min(best, elapsed)
+        operations = response['results']['plan']['estimates'][engine]['operations']
+        points.append((engine, operations, best))
+    return points
+
+
+def fit(points):
+    """
+    Least-squares fixed cost and cost per operation for each engine, clipped at zero
+    """
+    calibration = {}
+    for engine in sorted({engine for engine, _, _ in points}):
+        ops = np.array([operations for name, operations, _ in points if name == engine])
+        seconds = np.array([elapsed for name, _, elapsed in points if name == engine])
+        design = np.stack([np.ones_like(ops), ops], axis=1)
+        (fixed, per_operation), *_ = np.linalg.lstsq(design, seconds, rcond=None)
+        if per_operation <= 0:
+            fixed, per_operation = float(np.min(seconds)), 0.0
+        calibration[engine] = {
+            'seconds': float(max(fixed, 0.0)),
+            'seconds_per_operation': float(per_operation),
+        }
+        print(f'{engine:12s} fixed {calibration[engine]["seconds"]:.3g} s, '
+              f'{calibration[engine]["seconds_per_operation"]:.3g} s/op over {len(ops)} runs')
+    return calibration
+
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    rng = np.random.default_rng(0)
+    points = measure(StrawberryFieldsHandler.__new__(StrawberryFieldsHandler), gaussian_suite(rng), repeats)
+    points += measure(PercevalHandler.__new__(PercevalHandler), linear_optics_suite(rng), repeats)
+    with open(planner.CALIBRATION_FILE, 'w') as f:
+        json.dump(fit(points), f, indent=2)
+    print(f'Wrote {planner.CALIBRATION_FILE}')
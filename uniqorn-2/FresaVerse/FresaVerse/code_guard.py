@@ -0,0 +1,356 @@
+"""
+Static resource check of raw code submissions before they are executed.
+
+The guard looks for the literals that decide how big the run gets: the
+mode count of sf.Program(n) or pcvl.Circuit(n), photons in
+pcvl.BasicState(...), Fock cutoffs (cutoff=..., cutoff_dim) and sample
+counts (samples(n), shots=...). Small constant expressions such as 10**8 and
+names bound to them at the top level are resolved. Sample counts and cutoffs
+over the limits are clamped in the source; programs that cannot fit at all
+are rejected.
+
+Building the syntax tree of a whole generated program costs about as much
+as executing its compile step, so the guard only parses the single-line
+statements that mention one of those names, skipping the insides of
+triple-quoted strings. Code where such a statement may span several lines
+(open brackets, continuations) or shares its line with others, or whose
+triple quotes cannot be paired by a plain scan, falls back to walking the
+full tree. Either way only the source text of the clamped values is
+rewritten, so comments and formatting are kept.
+"""
+
+import ast
+import bisect
+import operator
+import re
+
+from permanents import slos_memory
+from planner import MAX_MEMORY
+
+# Largest sample count a submission may request; larger ones are clamped
+MAX_SAMPLES = 10 ** 6
+
+# Largest Fock tensor (cutoff**modes entries) a submission may build; larger cutoffs are clamped
+MAX_FOCK_ENTRIES = 2 * 10 ** 7
+
+# Constant expressions the guard evaluates, and bounds that keep the evaluation itself cheap
+OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv,
+    ast.Pow: operator.pow,
+}
+MAX_EXPONENT = 1024
+MAX_BASE = 2 ** 64
+MAX_LIST = 10 ** 4
+
+# Calls whose first argument is a mode count, a photon pattern or a sample count
+MODE_CALLS = ('Program', 'Circuit')
+STATE_CALLS = ('BasicState',)
+SAMPLE_CALLS = ('samples', 'sample_count')
+CUTOFF_KEYWORDS = ('cutoff', 'cutoff_dim')
+SAMPLE_KEYWORDS = ('samples', 'shots')
+ARGUMENT_CALLS = frozenset(MODE_CALLS + STATE_CALLS + SAMPLE_CALLS)
+
+# Lines worth parsing, top-level assignments, and right-hand sides that may be constant expressions
+CANDIDATE = re.compile(r'\b(?:' + '|'.join(ARGUMENT_CALLS.union(CUTOFF_KEYWORDS + SAMPLE_KEYWORDS)) + r')\b')
+ASSIGNMENT = re.compile(r'^([A-Za-z_]\w*)[ \t]*=(?!=)[ \t]*(.*)$', re.MULTILINE)
+CONSTANT_EXPRESSION = re.compile(r'[\d\s*+\-()\[\],.]+$')
+TRIPLE_QUOTE = re.compile(r'"""|' + "'''")
+NEWLINE = re.compile(r'\r\n|\r|\n')
+
+
+def literal(node, constants):
+    """
+    Value of a constant expression, or None when it depends on anything known only at run time
+    """
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str)) and not isinstance(node.value, bool):
+        return node.value
+    if isinstance(node, ast.Name):
+        return constants.get(node.id)
+    if isinstance(node, (ast.List, ast.Tuple)):
+        items = [literal(item, constants) for item in node.elts]
+        return None if any(item is None for item in items) else items
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        value = literal(node.operand, constants)
+        return -value if isinstance(value, (int, float)) else None
+    if isinstance(node, ast.BinOp) and type(node.op) in OPERATORS:
+        left, right = literal(node.left, constants), literal(node.right, constants)
+        if left is None or right is None:
+            return None
+        if isinstance(node.op, ast.Pow) and not (
+            isinstance(left, (int, float)) and isinstance(right, (int, float))
+            and abs(left) <= MAX_BASE and abs(right) <= MAX_EXPONENT
+        ):
+            return None
+        if isinstance(node.op, ast.Mult) and (isinstance(left, list) or isinstance(right, list)):
+            count = right if isinstance(left, list) else left
+            if not isinstance(count, int) or count > MAX_LIST:
+                return None
+        try:
+            return OPERATORS[type(node.op)](left, right)
+        except Exception:
+            return None
+    return None
+
+
+def call_name(call):
+    """
+    Name of the called function or method, e.g. 'Program' for sf.Program(2)
+    """
+    if isinstance(call.func, ast.Attribute):
+        return call.func.attr
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    return None
+
+
+def photon_count(state):
+    """
+    Photons in a BasicState argument given as a list or a '|1,0>' string
+    """
+    if isinstance(state, list):
+        return sum(n for n in state if isinstance(n, int))
+    if isinstance(state, str):
+        return sum(int(n) for n in state.strip('|>').split(',') if n.strip().isdigit())
+    return None
+
+
+def setter(parent, field, index=None):
+    """
+    Callback replacing parent.field (or parent.field[index]) with a constant, returning the replaced node
+    """
+    def update(value):
+        if index is None:
+            old = getattr(parent, field)
+            setattr(parent, field, ast.copy_location(ast.Constant(value), old))
+        else:
+            items = getattr(parent, field)
+            old = items[index]
+            items[index] = ast.copy_location(ast.Constant(value), old)
+        return old
+    return update
+
+
+def top_level_constants(tree):
+    """
+    Names bound to constant expressions by top-level assignments, in order
+    """
+    constants = {}
+    for statement in tree.body:
+        if isinstance(statement, ast.Assign) and len(statement.targets) == 1 and isinstance(statement.targets[0], ast.Name):
+            value = literal(statement.value, constants)
+            name = statement.targets[0].id
+            if value is None:
+                constants.pop(name, None)
+            else:
+                constants[name] = value
+    return constants
+
+
+def collect(tree, constants, found, site=None):
+    """
+    Record the mode counts, photons, cutoffs and sample counts in a tree.
+
+    Cutoffs and sample counts are kept as (value, setter, site) so clamping can rewrite them.
+    """
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call):
+            name = call_name(node)
+            if name in ARGUMENT_CALLS and node.args:
+                first = literal(node.args[0], constants)
+                if name in MODE_CALLS and isinstance(first, int):
+                    found['modes'].append(first)
+                elif name in STATE_CALLS and first is not None:
+                    count = photon_count(first)
+                    if count is not None:
+                        found['photons'].append(count)
+                elif name in SAMPLE_CALLS and isinstance(first, int):
+                    found['samples'].append((first, setter(node, 'args', 0), site))
+            for keyword in node.keywords:
+                if keyword.arg not in CUTOFF_KEYWORDS and keyword.arg not in SAMPLE_KEYWORDS:
+                    continue
+                value = literal(keyword.value, constants)
+                if not isinstance(value, int):
+                    continue
+                kind = 'cutoffs' if keyword.arg in CUTOFF_KEYWORDS else 'samples'
+                found[kind].append((value, setter(keyword, 'value'), site))
+        elif isinstance(node, ast.Dict):
+            # backend_options={"cutoff_dim": 10}
+            for index, key in enumerate(node.keys):
+                if isinstance(key, ast.Constant) and key.value in CUTOFF_KEYWORDS:
+                    value = literal(node.values[index], constants)
+                    if isinstance(value, int):
+                        found['cutoffs'].append((value, setter(node, 'values', index), site))
+
+
+def bracket_depth(code, end):
+    """
+    Brackets still open at position `end` of the source
+    """
+    opened = code.count('(', 0, end) + code.count('[', 0, end) + code.count('{', 0, end)
+    return opened - code.count(')', 0, end) - code.count(']', 0, end) - code.count('}', 0, end)
+
+
+def string_regions(code):
+    """
+    Sorted (start, end) spans of the triple-quoted strings, or None when a
+    delimiter may sit in a comment, another string or an escape and only the
+    full tree can tell
+    """
+    regions = []
+    opening = None
+    for match in TRIPLE_QUOTE.finditer(code):
+        if opening is None:
+            # Openers must follow plain code on their line
+            prefix = code[code.rfind('\n', 0, match.start()) + 1:match.start()]
+            if '#' in prefix or '"' in prefix or "'" in prefix:
+                return None
+            opening = match
+        elif code.endswith('\\', 0, match.start()):
+            return None
+        elif match.group() == opening.group():
+            regions.append((opening.start(), match.end()))
+            opening = None
+    return None if opening is not None else regions
+
+
+def inside(regions, position):
+    """
+    Whether a position of the source falls in one of the sorted regions
+    """
+    index = bisect.bisect_right(regions, (position, float('inf'))) - 1
+    return index >= 0 and regions[index][0] <= position < regions[index][1]
+
+
+def source_offset(code, start, column):
+    """
+    Position in `code` of the UTF-8 byte `column` counted from position `start`
+    """
+    # A column of n bytes spans at most n characters
+    return start + len(code[start:start + column].encode()[:column].decode())
+
+
+def scan_source(code, found):
+    """
+    Fast path: parse only the single-line statements that mention a size.
+
+    Every value is recorded with the position its statement starts at as the
+    site. Returns False when one of the statements may span several lines, a
+    line holds several statements or the strings cannot be delimited, so the
+    full tree is needed.
+    """
+    regions = string_regions(code)
+    if regions is None:
+        return False
+    lines = {}
+    for match in CANDIDATE.finditer(code):
+        if inside(regions, match.start()):
+            # Documentation, not code
+            continue
+        start = code.rfind('\n', 0, match.start()) + 1
+        if start not in lines:
+            end = code.find('\n', start)
+            lines[start] = len(code) if end < 0 else end
+    events = [(match.start(), match) for match in ASSIGNMENT.finditer(code) if not inside(regions, match.start())]
+    events += [(start, None) for start in lines]
+    events.sort(key=lambda event: event[0])
+
+    constants = {}
+    for start, match in events:
+        if match is not None:
+            # A top-level assignment, in source order with the statements that use it
+            name, value = match.groups()
+            constants.pop(name, None)
+            if CONSTANT_EXPRESSION.match(value):
+                try:
+                    constants[name] = literal(ast.parse(value, mode='eval').body, constants)
+                except SyntaxError:
+                    pass
+            continue
+        line = code[start:lines[start]]
+        statement = line.strip()
+        if bracket_depth(code, start) or code.endswith('\\', 0, max(start - 1, 0)):
+            return False
+        try:
+            # Block headers such as `if x.samples:` parse with an empty body
+            tree = ast.parse(statement + ' pass' if statement.endswith(':') else statement)
+        except SyntaxError:
+            return False
+        if len(tree.body) > 1:
+            # Semicolon-joined statements
+            return False
+        collect(tree, constants, found, start + len(line) - len(line.lstrip()))
+    return True
+
+
+def guard_code(code):
+    """
+    Check the resources of submitted code, returning the code to run (with clamped literals) and a report.
+
+    Raises ValueError when the program is too large to run at all.
+    """
+    found = {'modes': [], 'photons': [], 'cutoffs': [], 'samples': []}
+    if not scan_source(code, found):
+        found = {'modes': [], 'photons': [], 'cutoffs': [], 'samples': []}
+        tree = ast.parse(code)
+        collect(tree, top_level_constants(tree), found)
+
+    report = {'modes': max(found['modes'], default=None), 'photons': max(found['photons'], default=None), 'clamped': []}
+    if report['modes'] is not None:
+        # Every Strawberry Fields state keeps at least a 2n x 2n covariance matrix
+        if 8 * (2 * report['modes']) ** 2 > MAX_MEMORY:
+            raise ValueError(f'A program with {report["modes"]} modes does not fit in memory')
+        if report['photons'] is not None and slos_memory(report['modes'], report['photons']) > MAX_MEMORY:
+            raise ValueError(
+                f'{report["photons"]} photons in {report["modes"]} modes have too many outcomes to simulate; '
+                'use the structured endpoint with top_k, marginals or samples instead'
+            )
+
+    edited = []
+    for value, update, site in found['samples']:
+        if value > MAX_SAMPLES:
+            edited.append((site, update(MAX_SAMPLES), MAX_SAMPLES))
+            report['clamped'].append({'samples': value, 'to': MAX_SAMPLES})
+
+    if report['modes']:
+        largest = max_cutoff(report['modes'])
+        for value, update, site in found['cutoffs']:
+            if value > largest:
+                if largest < 2:
+                    raise ValueError(f'No Fock cutoff keeps a {report["modes"]}-mode tensor under {MAX_FOCK_ENTRIES} entries')
+                edited.append((site, update(largest), largest))
+                report['clamped'].append({'cutoff': value, 'to': largest})
+        report['fock_entries'] = max((min(value, largest) ** report['modes'] for value, _, _ in found['cutoffs']), default=0)
+
+    if not edited:
+        return code, report
+    # Replace only the clamped values, from the end so earlier offsets stay valid
+    line_starts = None
+    spans = []
+    for site, node, value in edited:
+        if site is not None:
+            # Fast path: the statement was parsed on its own, as line 1 starting at `site`
+            first = last = site
+        else:
+            if line_starts is None:
+                line_starts = [0] + [match.end() for match in NEWLINE.finditer(code)]
+            first, last = line_starts[node.lineno - 1], line_starts[node.end_lineno - 1]
+        # Column offsets count UTF-8 bytes
+        spans.append((source_offset(code, first, node.col_offset), source_offset(code, last, node.end_col_offset), repr(value)))
+    for start, end, text in sorted(spans, reverse=True):
+        code = code[:start] + text + code[end:]
+    return code, report
+
+
+def max_cutoff(modes):
+    """
+    Largest cutoff whose cutoff**modes tensor stays within MAX_FOCK_ENTRIES
+    """
+    cutoff = int(round(MAX_FOCK_ENTRIES ** (1.0 / modes)))
+    while cutoff > 0 and cutoff ** modes > MAX_FOCK_ENTRIES:
+        cutoff -= 1
+    while (cutoff + 1) ** modes <= MAX_FOCK_ENTRIES:
+        cutoff += 1
+    return cutoff
@@ -0,0 +1,100 @@
+"""
+Classical baseline for linear optics: distinguishable photons.
+
+Without interference every photon walks independently from its input mode i
+to output mode j with probability T_ji = |U_ji|^2. Pattern probabilities are
+permanents of the non-negative matrix T, and distributions are built one
+photon at a time, so the baseline needs no SLOS run. The functions mirror
+the quantum ones in linear_optics.py and permanents.py.
+"""
+
+import math
+from collections import Counter
+
+import numpy as np
+
+from gaussian_probs import pattern_key
+from linear_optics import occupied_indices
+from permanents import permanent
+
+
+def transition_matrix(U):
+    """
+    Single-photon transition probabilities T[j, i] = |U[j, i]|^2
+    """
+    return np.abs(np.asarray(U)) ** 2
+
+
+def output_probability(U, input_state, output_state):
+    """
+    Probability of one output pattern for distinguishable photons
+    """
+    if sum(input_state) != sum(output_state):
+        return 0.0
+    rows = occupied_indices(output_state)
+    cols = occupied_indices(input_state)
+    norm = np.prod([math.factorial(n) for n in output_state])
+    return float(permanent(transition_matrix(U)[np.ix_(rows, cols)]).real / norm)
+
+
+def output_probabilities(U, input_state, output_states):
+    """
+    Output probabilities of distinguishable photons for a batch of patterns
+    """
+    return np.array([output_probability(U, input_state, state) for state in output_states])
+
+
+def output_distribution(U, input_state, threshold=1e-12):
+    """
+    Full output distribution, adding the photons one random walk at a time
+    """
+    T = transition_matrix(U)
+    modes = T.shape[0]
+    dist = {(0,) * modes: 1.0}
+    for col in occupied_indices(input_state):
+        targets = [j for j in range(modes) if T[j, col] > 0]
+        step = {}
+        for pattern, p in dist.items():
+            for j in targets:
+                moved = pattern[:j] + (pattern[j] + 1,) + pattern[j + 1:]
+                step[moved] = step.get(moved, 0.0) + p * T[j, col]
+        dist = step
+    return {pattern_key(pattern): float(p) for pattern, p in dist.items() if p > threshold}
+
+
+def marginal_probs(U, input_state, subset, cutoff=None):
+    """
+    Photon-number distribution of the modes in `subset` for distinguishable photons
+    """
+    T = transition_matrix(U)
+    photons = int(sum(input_state))
+    probs = np.zeros((photons + 1,) * len(subset))
+    probs[(0,) * len(subset)] = 1.0
+    for col in occupied_indices(input_state):
+        # Each photon lands in one of the subset modes or leaves it
+        step = probs * max(1.0 - sum(T[j, col] for j in subset), 0.0)
+        for axis, j in enumerate(subset):
+            src = [slice(None)] * len(subset)
+            dst = [slice(None)] * len(subset)
+            src[axis] = slice(0, photons)
+            dst[axis] = slice(1, photons + 1)
+            step[tuple(dst)] += probs[tuple(src)] * T[j, col]
+        probs = step
+    if cutoff is not None:
+        probs = probs[(slice(0, cutoff),) * len(subset)]
+    return probs
+
+
+def sample_counts(U, input_state, shots, seed=None):
+    """
+    Histogram of sampled patterns, drawing every photon's output mode independently
+    """
+    T = transition_matrix(U)
+    modes = T.shape[0]
+    rng = np.random.default_rng(seed)
+    patterns = np.zeros((shots, modes), dtype=np.int64)
+    for col in occupied_indices(input_state):
+        weights = T[:, col] / T[:, col].sum()
+        np.add.at(patterns, (np.arange(shots), rng.choice(modes, size=shots, p=weights)), 1)
+    counts = Counter(map(tuple, patterns.tolist()))
+    return {pattern_key(pattern): count for pattern, count in counts.most_common()}
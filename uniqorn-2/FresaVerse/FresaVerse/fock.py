@@ -0,0 +1,401 @@
+"""
+Fock-space simulation of circuits with Kerr gates, and readouts from the
+dense photon-number probability tensor it produces.
+
+Everything that does not touch a Kerr gate's mode (directly or through
+earlier gates on that mode) commutes past the Fock part, so it is hoisted
+into a Gaussian prefix. The prefix is propagated with symplectic.py and
+converted to amplitudes once, with the same loop-hafnian recursion as the
+probabilities. What is left is applied to the state vector: Kerr gates and
+phase shifters are diagonal in the photon-number basis, so they multiply
+each amplitude by a phase; displacements, squeezers and beam splitters use
+their truncated matrices, built by recurrence.
+
+The engine truncates every mode at a cutoff and returns the joint
+probability of every pattern below it, for the simulated (kept) modes only.
+The readouts answer the structured outputs from that tensor and put pruned
+modes back as vacuum, so the results look like the Gaussian path's.
+"""
+
+import os
+from collections import OrderedDict
+
+import numpy as np
+
+from gaussian_probs import (
+    GaussianFockProbabilities, loop_hafnian_parameters, loop_hafnian_table, pattern_key, rounding_error,
+)
+from structured import element_modes
+from symplectic import HBAR, gaussian_state, local_channel
+
+# Gates that only multiply each photon-number amplitude by a phase
+DIAGONAL_ELEMENTS = ('Kerr Gate', 'Phase Shifter')
+
+# Amplitude types by outputs.precision; single halves the memory of every cutoff**modes tensor
+PRECISIONS = {'double': np.complex128, 'single': np.complex64}
+
+# Bytes of gate matrices kept per worker, and the parameter resolution of their cache keys
+MATRIX_CACHE_BYTES = int(os.environ.get('UNIQORN_FOCK_CACHE_BYTES', 256 * 1024 ** 2))
+PARAMETER_QUANTUM = 1e-12
+
+
+def split_circuit(circuit, keep_phases=False):
+    """
+    Gaussian prefix, Fock part and ignored element types of a circuit.
+
+    The Fock part starts at the first Kerr gate on each mode and takes every
+    later element that touches one of its modes. Diagonal gates after which
+    nothing else acts on their mode cannot change photon-number
+    probabilities, so they are dropped, unless `keep_phases` asks for the
+    phases of the amplitudes too.
+    """
+    modes = circuit['modes']
+    prefix, fock_part, ignored = [], [], []
+    fock_modes = set()
+    for element in circuit['elements']:
+        targets = element_modes(element, modes)
+        kind = element['type']
+        if targets is None or (kind != 'Kerr Gate' and local_channel(element) is None):
+            ignored.append(kind)
+        elif kind == 'Photonic Measurement':
+            # Every mode is read out from the final state
+            continue
+        elif kind == 'Kerr Gate':
+            if element['parameters'].get('kappa', 0.0) != 0:
+                fock_part.append(element)
+                fock_modes.update(targets)
+        elif fock_modes.intersection(targets):
+            fock_part.append(element)
+            fock_modes.update(targets)
+        else:
+            prefix.append(element)
+
+    kept, touched = [], set()
+    for element in reversed(fock_part):
+        targets = element_modes(element, modes)
+        if not keep_phases and element['type'] in DIAGONAL_ELEMENTS and not touched.intersection(targets):
+            continue
+        kept.append(element)
+        touched.update(targets)
+    return prefix, kept[::-1], ignored
+
+
+def displacement_matrix(r, phi, cutoff):
+    """
+    <m|D(r e^{i phi})|n> for m, n below the cutoff
+    """
+    alpha = r * np.exp(1j * phi)
+    root = np.sqrt(np.arange(cutoff))
+    D = np.zeros((cutoff, cutoff), dtype=complex)
+    D[0, 0] = np.exp(-0.5 * r ** 2)
+    for m in range(1, cutoff):
+        D[m, 0] = alpha / root[m] * D[m - 1, 0]
+    for n in range(1, cutoff):
+        D[:, n] = -np.conj(alpha) / root[n] * D[:, n - 1]
+        D[1:, n] += root[1:] / root[n] * D[:-1, n - 1]
+    return D
+
+
+def squeezing_matrix(r, theta, cutoff):
+    """
+    <m|S(r, theta)|n> for m, n below the cutoff; only even m + n are non-zero
+    """
+    root = np.sqrt(np.arange(cutoff))
+    t = np.exp(1j * theta) * np.tanh(r)
+    sech = 1 / np.cosh(r)
+    S = np.zeros((cutoff, cutoff), dtype=complex)
+    S[0, 0] = np.sqrt(sech)
+    for m in range(2, cutoff, 2):
+        S[m, 0] = -root[m - 1] / root[m] * t * S[m - 2, 0]
+    for n in range(1, cutoff):
+        if n >= 2:
+            S[:, n] = root[n - 1] / root[n] * np.conj(t) * S[:, n - 2]
+        S[1:, n] += root[1:] / root[n] * sech * S[:-1, n - 1]
+    return S
+
+
+def beamsplitter_tensor(theta, phi, cutoff):
+    """
+    <m, n|B(theta, phi)|p, q> for every index below the cutoff, indexed [m, n, p, q]
+    """
+    root = np.sqrt(np.arange(cutoff))
+    c, s = np.cos(theta), np.sin(theta) * np.exp(1j * phi)
+    B = np.zeros((cutoff,) * 4, dtype=complex)
+    B[0, 0, 0, 0] = 1.0
+    # Photons entering the first port: a1^dagger -> c b1^dagger + s b2^dagger
+    for m in range(cutoff):
+        for n in range(cutoff - m):
+            p = m + n
+            if 0 < p < cutoff:
+                value = 0.0
+                if m:
+                    value += c * root[m] / root[p] * B[m - 1, n, p - 1, 0]
+                if n:
+                    value += s * root[n] / root[p] * B[m, n - 1, p - 1, 0]
+                B[m, n, p, 0] = value
+    # and the second: a2^dagger -> -conj(s) b1^dagger + c b2^dagger
+    for m in range(cutoff):
+        for n in range(cutoff):
+            for p in range(cutoff):
+                q = m + n - p
+                if 0 < q < cutoff:
+                    value = 0.0
+                    if m:
+                        value -= np.conj(s) * root[m] / root[q] * B[m - 1, n, p, q - 1]
+                    if n:
+                        value += c * root[n] / root[q] * B[m, n - 1, p, q - 1]
+                    B[m, n, p, q] = value
+    return B
+
+
+class MatrixCache:
+    """
+    Fock matrices of gates by (gate, quantized parameters, cutoff, dtype); the least recently used go first.
+
+    Parameters are rounded to PARAMETER_QUANTUM before the matrix is built,
+    so values that differ only by floating-point noise share one entry.
+    Matrices are always built in double precision and then cast.
+    """
+
+    def __init__(self, builders, max_bytes=MATRIX_CACHE_BYTES):
+        self.builders = builders
+        self.max_bytes = max_bytes
+        self.matrices = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, kind, parameters, cutoff, dtype=np.complex128):
+        """
+        Read-only matrix of one gate, built on a miss
+        """
+        steps = tuple(int(round(value / PARAMETER_QUANTUM)) for value in parameters)
+        key = (kind, steps, cutoff, np.dtype(dtype).str)
+        matrix = self.matrices.pop(key, None)
+        if matrix is None:
+            self.misses += 1
+            matrix = self.builders[kind](*(step * PARAMETER_QUANTUM for step in steps), cutoff)
+            matrix = matrix.astype(dtype, copy=False)
+            matrix.setflags(write=False)
+            self.bytes += matrix.nbytes
+        else:
+            self.hits += 1
+        self.matrices[key] = matrix
+        while self.bytes > self.max_bytes and len(self.matrices) > 1:
+            _, evicted = self.matrices.popitem(last=False)
+            self.bytes -= evicted.nbytes
+            self.evictions += 1
+        return matrix
+
+    def stats(self):
+        """
+        Size and hit counts for the metrics endpoint
+        """
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.matrices),
+            'memory_bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
+
+
+# Shared by every request this worker serves
+MATRIX_CACHE = MatrixCache({
+    'Displacement Gate': displacement_matrix,
+    'Squeezing Gate': squeezing_matrix,
+    'Beam Splitter': beamsplitter_tensor,
+})
+
+
+def gaussian_ket(cov, means, cutoff, hbar=HBAR, tol=1e-8, dtype=np.complex128):
+    """
+    Amplitudes of a pure Gaussian state below the cutoff, or None if the state is mixed.
+
+    For a pure state A is block diagonal and its lower block alone gives the
+    amplitudes: <n|psi> = lhaf(A_n, gamma_n) sqrt(prefactor / prod(n_i!)) up to a global phase.
+    """
+    modes = len(means) // 2
+    if abs(np.linalg.det(2 / hbar * np.asarray(cov)) - 1) > tol:
+        return None
+    A, gamma, prefactor = loop_hafnian_parameters(cov, means, hbar)
+    table = loop_hafnian_table(A[modes:, modes:], gamma[modes:], [cutoff - 1] * modes, dtype)
+    norms = (1 / np.sqrt(np.cumprod([1.0] + list(range(1, cutoff))))).astype(table.real.dtype)
+    ket = table.reshape((cutoff,) * modes) * table.real.dtype.type(np.sqrt(prefactor))
+    for axis in range(modes):
+        ket = apply_diagonal(ket, norms, axis)
+    return ket
+
+
+def apply_diagonal(ket, phases, mode):
+    """
+    Multiply the amplitudes along one mode's axis by a vector
+    """
+    shape = [1] * ket.ndim
+    shape[mode] = -1
+    return ket * phases.reshape(shape)
+
+
+def apply_matrix(ket, matrix, mode):
+    """
+    Apply a single-mode operator given as a cutoff x cutoff matrix
+    """
+    return np.moveaxis(np.tensordot(matrix, ket, axes=([1], [mode])), 0, mode)
+
+
+def apply_two_mode(ket, tensor, first, second):
+    """
+    Apply a two-mode operator given as a [m, n, p, q] tensor
+    """
+    out = np.tensordot(tensor, ket, axes=([2, 3], [first, second]))
+    return np.moveaxis(out, [0, 1], [first, second])
+
+
+def squared_norm(ket):
+    """
+    Total probability of a state vector, accumulated in double precision
+    """
+    return float(np.sum(np.abs(ket) ** 2, dtype=np.float64))
+
+
+def fock_ket(circuit, cutoff, hbar=HBAR, dtype=np.complex128, keep_phases=False):
+    """
+    State vector of the circuit below the cutoff, the ignored element types
+    and the normalization drift, or None when it has no pure-state form here:
+    a mixed Gaussian prefix, or a Laser or fused block inside the Fock part.
+
+    The drift bounds how far rounding moved the norm. Below double precision
+    the converted prefix is spot-checked against double-precision patterns.
+    Every gate then adds the first-order rounding bound of its products, or,
+    for diagonal gates, which keep the norm exactly, the measured change of
+    the norm when that is larger.
+    """
+    modes = circuit['modes']
+    prefix, fock_part, ignored = split_circuit(circuit, keep_phases)
+    if any(element['type'] not in DIAGONAL_ELEMENTS + ('Displacement Gate', 'Squeezing Gate', 'Beam Splitter')
+           for element in fock_part):
+        return None
+    cov, means, _ = gaussian_state({'modes': modes, 'elements': prefix}, hbar)
+    ket = gaussian_ket(cov, means, cutoff, hbar, dtype=dtype)
+    if ket is None:
+        return None
+
+    n = np.arange(cutoff)
+    norm = squared_norm(ket)
+    drift = 0.0
+    if ket.dtype != np.complex128:
+        exact = GaussianFockProbabilities(cov, means, hbar)
+        drift = rounding_error(np.abs(ket) ** 2, exact.prob) * norm
+    # Twice the unit roundoff: the relative error of one rounding, on squared amplitudes
+    roundoff = float(np.finfo(ket.real.dtype).eps)
+    for element in fock_part:
+        kind = element['type']
+        params = element['parameters']
+        targets = element_modes(element, modes)
+        if kind in DIAGONAL_ELEMENTS:
+            angles = params['kappa'] * n ** 2 if kind == 'Kerr Gate' else params['phi'] * n
+            ket = apply_diagonal(ket, np.exp(1j * angles).astype(dtype), targets[0])
+            after = squared_norm(ket)
+            drift += max(abs(after - norm), roundoff * norm)
+        else:
+            if kind == 'Displacement Gate':
+                ket = apply_matrix(ket, MATRIX_CACHE.get(kind, (params['r'], params['phi']), cutoff, dtype), targets[0])
+                terms = cutoff
+            elif kind == 'Squeezing Gate':
+                ket = apply_matrix(ket, MATRIX_CACHE.get(kind, (params['r'], params['theta']), cutoff, dtype), targets[0])
+                terms = cutoff
+            else:
+                ket = apply_two_mode(ket, MATRIX_CACHE.get(kind, (params['theta'], params['phi']), cutoff, dtype), *targets)
+                terms = cutoff ** 2
+            after = squared_norm(ket)
+            # Each amplitude sums `terms` rounded products
+            drift += terms * roundoff * after
+        norm = after
+    return ket, ignored, drift
+
+
+def tensor_marginal(probs, kept, subset):
+    """
+    Marginal tensor of `subset` (original mode numbers) from the joint tensor of the kept modes
+    """
+    cutoff = probs.shape[0] if probs.ndim else 1
+    axes = [kept.index(mode) for mode in subset if mode in kept]
+    others = tuple(axis for axis in range(probs.ndim) if axis not in axes)
+    reduced = probs.sum(axis=others)
+    # sum keeps the remaining axes in increasing order; put them in subset order
+    reduced = reduced.transpose([sorted(axes).index(axis) for axis in axes])
+
+    marginal = np.zeros((cutoff,) * len(subset))
+    marginal[tuple(slice(None) if mode in kept else 0 for mode in subset)] = reduced
+    return marginal
+
+
+def tensor_clicks(probs):
+    """
+    Threshold-detector tensor of shape (2,) * modes: per axis, no photons or any photons
+    """
+    clicks = probs
+    for axis in range(probs.ndim):
+        empty = clicks.take([0], axis=axis)
+        clicks = np.concatenate([empty, clicks.sum(axis=axis, keepdims=True) - empty], axis=axis)
+    return np.maximum(clicks, 0.0)
+
+
+def tensor_counts(probs, kept, modes, shots, seed=None):
+    """
+    Histogram of `shots` patterns drawn from the tensor of the kept modes, keyed over all modes
+    """
+    flat = probs.ravel().astype(float)
+    drawn = np.random.default_rng(seed).multinomial(shots, flat / flat.sum())
+    counts = {}
+    for index in np.flatnonzero(drawn)[np.argsort(-drawn[drawn > 0], kind='stable')]:
+        pattern = [0] * modes
+        for mode, count in zip(kept, np.unravel_index(index, probs.shape)):
+            pattern[mode] = int(count)
+        counts[pattern_key(pattern)] = int(drawn[index])
+    return counts
+
+
+def tensor_probability(probs, kept, pattern):
+    """
+    Probability of one pattern on all modes; zero if it lights a pruned mode or exceeds the cutoff
+    """
+    if any(count for mode, count in enumerate(pattern) if mode not in kept):
+        return 0.0
+    local = tuple(int(pattern[mode]) for mode in kept)
+    if any(count >= probs.shape[axis] for axis, count in enumerate(local)):
+        return 0.0
+    return float(probs[local])
+
+
+def tensor_top_k(probs, kept, modes, k):
+    """
+    The k most likely patterns of the tensor, in the format of top_outcomes.top_k_outcomes
+    """
+    flat = probs.ravel()
+    k = min(k, flat.size)
+    best = np.argpartition(flat, -k)[-k:] if k else np.array([], dtype=int)
+    best = best[np.argsort(flat[best])[::-1]]
+
+    outcomes = []
+    for index in best:
+        pattern = [0] * modes
+        for mode, count in zip(kept, np.unravel_index(index, probs.shape)):
+            pattern[mode] = int(count)
+        outcomes.append({'pattern': pattern_key(pattern), 'probability': float(flat[index])})
+
+    returned_mass = sum(item['probability'] for item in outcomes)
+    kth = outcomes[-1]['probability'] if outcomes else 0.0
+    # Every pattern inside the tensor was evaluated; the truncated mass bounds the rest
+    max_unseen = max(1.0 - float(flat.sum()), 0.0)
+    return {
+        'outcomes': outcomes,
+        'remaining_mass': float(max(1.0 - returned_mass, 0.0)),
+        'max_unseen_probability': float(max_unseen),
+        'certified': bool(max_unseen <= kth),
+        'evaluations': int(flat.size),
+    }
@@ -0,0 +1,576 @@
+"""
+Fock-basis probabilities of Gaussian states, evaluated one outcome pattern at a time.
+
+States are given by their covariance matrix and vector of means in the
+Strawberry Fields conventions (xxpp ordering, hbar=2 by default), i.e. exactly
+what ``state.cov()`` and ``state.means()`` return for a gaussian backend state.
+Each probability is a loop hafnian of a small matrix built from the photon
+numbers in the pattern, so memory only grows with the outcomes asked for and
+never with cutoff**modes.
+
+The state helpers and ``all_probs_batch`` also accept a leading batch axis
+(covariance matrices of shape (batch, 2n, 2n)), so parameter sweeps are
+evaluated in one pass with every arithmetic step vectorized over the batch.
+"""
+
+import math
+
+import numpy as np
+
+from workers import fill_parallel
+
+# Per-pattern probabilities go to the process pool from this many patterns on
+PARALLEL_MIN_PATTERNS = 256
+
+# Dense tensors come from one loop-hafnian table while it stays this small, else pattern by pattern
+MAX_TABLE_BYTES = 256 * 1024 ** 2
+
+# Loop-hafnian tables with at least this many entries are filled one photon-number sector at a time
+VECTOR_TABLE_ENTRIES = 256
+
+# Most probable entries of a reduced-precision table that are checked against double precision
+ROUNDING_CHECKS = 8
+
+
+def pattern_key(pattern):
+    """
+    Format a photon-number pattern the same way Perceval prints a BasicState
+    """
+    return '|' + ','.join(str(int(n)) for n in pattern) + '>'
+
+
+def photon_patterns(total, modes):
+    """
+    Yield every pattern of `total` photons spread over `modes` modes
+    """
+    if modes == 1:
+        yield (total,)
+        return
+    for first in range(total, -1, -1):
+        for rest in photon_patterns(total - first, modes - 1):
+            yield (first,) + rest
+
+
+def pattern_sectors(modes, cutoff):
+    """
+    Yield the patterns with at most cutoff - 1 photons per mode, one photon-number sector at a time.
+
+    Each sector is an array with one pattern per row, sorted by flat index
+    into the (cutoff,) * modes tensor. It is grown from the previous sector
+    by adding a photon to every mode, so no sector is enumerated from scratch.
+    """
+    shape = (cutoff,) * modes
+    strides = cutoff ** np.arange(modes - 1, -1, -1)
+    patterns = np.zeros((1, modes), dtype=int)
+    for _ in range(modes * (cutoff - 1) + 1):
+        yield patterns
+        grown = (patterns @ strides)[:, None] + strides
+        keys = np.unique(grown[patterns < cutoff - 1])
+        patterns = np.stack(np.unravel_index(keys, shape), axis=-1).reshape(-1, modes)
+
+
+def complex_covariance(cov, hbar=2):
+    """
+    Return the Husimi covariance matrix Q in the (a, a^dagger) basis
+    """
+    n = cov.shape[-1] // 2
+    identity = np.identity(n)
+    x = cov[..., :n, :n] * 2 / hbar
+    xp = cov[..., :n, n:] * 2 / hbar
+    p = cov[..., n:, n:] * 2 / hbar
+    xpT = np.swapaxes(xp, -1, -2)
+    aidaj = (x + p + 1j * (xp - xpT) - 2 * identity) / 4
+    aiaj = (x - p + 1j * (xp + xpT)) / 4
+    top = np.concatenate([aidaj, aiaj.conj()], axis=-1)
+    bottom = np.concatenate([aiaj, aidaj.conj()], axis=-1)
+    return np.concatenate([top, bottom], axis=-2) + np.identity(2 * n)
+
+
+def complex_means(means, hbar=2):
+    """
+    Return the vector of means (alpha, alpha*) in the (a, a^dagger) basis
+    """
+    n = means.shape[-1] // 2
+    alpha = (means[..., :n] + 1j * means[..., n:]) / np.sqrt(2 * hbar)
+    return np.concatenate([alpha, alpha.conj()], axis=-1)
+
+
+def loop_hafnian_table(A, gamma, reps, dtype=None):
+    """
+    Loop hafnians of A for every repetition vector k with 0 <= k <= reps.
+
+    Row/column i of A is repeated k[i] times and loops are weighted by gamma.
+    Uses the recursion H(k + e_i) = gamma_i H(k) + sum_j A_ij k_j H(k - e_j),
+    which stays exact and stable for large repetitions where
+    inclusion-exclusion formulas lose all precision. Indices with reps[i] == 0
+    are dropped, so the table has one axis per repeated index. Leading batch
+    axes of A and gamma become trailing axes of the table. `dtype` sets the
+    precision of the table (complex128 by default). Tables of at least
+    VECTOR_TABLE_ENTRIES entries are filled a sector (total repetition) at a
+    time with the same arithmetic, vectorized over the entries of the sector.
+    """
+    reps = np.asarray(reps, dtype=int)
+    support = np.nonzero(reps)[0]
+    A = np.asarray(A)[..., support[:, None], support[None, :]]
+    gamma = np.asarray(gamma)[..., support]
+    batch = gamma.shape[:-1]
+    dims = reps[support] + 1
+    strides = np.ones(len(dims), dtype=int)
+    for i in range(len(dims) - 2, -1, -1):
+        strides[i] = strides[i + 1] * dims[i + 1]
+
+    if dtype is not None:
+        A, gamma = A.astype(dtype), gamma.astype(dtype)
+    H = np.zeros((int(np.prod(dims)),) + batch, dtype=np.result_type(A, gamma, complex) if dtype is None else dtype)
+    H[0] = 1.0
+    if H.shape[0] >= VECTOR_TABLE_ENTRIES:
+        fill_table_sectors(H, A, gamma, dims, strides)
+        return H.reshape(tuple(dims) + batch)
+    for flat, k in enumerate(np.ndindex(*dims)):
+        if flat == 0:
+            continue
+        # Remove one copy of the first occupied index and match it with the rest
+        i = next(pos for pos, count in enumerate(k) if count)
+        prev = flat - strides[i]
+        value = gamma[..., i] * H[prev]
+        for j, count in enumerate(k):
+            count -= (j == i)
+            if count:
+                value = value + A[..., i, j] * count * H[prev - strides[j]]
+        H[flat] = value
+    return H.reshape(tuple(dims) + batch)
+
+
+def fill_table_sectors(H, A, gamma, dims, strides):
+    """
+    Fill the flat loop-hafnian table H (with H[0] = 1) sector by sector, for loop_hafnian_table
+    """
+    # Batch axes last, so rows of the table and of A and gamma line up
+    A = np.moveaxis(A, (-2, -1), (0, 1))
+    gamma = np.moveaxis(gamma, -1, 0)
+    trailing = (1,) * (H.ndim - 1)
+    patterns = np.zeros((1, len(dims)), dtype=int)
+    for _ in range(int(np.sum(dims - 1))):
+        keys = np.unique(((patterns @ strides)[:, None] + strides)[patterns < dims - 1])
+        patterns = np.stack(np.unravel_index(keys, tuple(dims)), axis=-1)
+        # Remove one copy of the first occupied index and match it with the rest
+        rows = np.arange(len(keys))
+        first = np.argmax(patterns > 0, axis=1)
+        k = patterns.copy()
+        k[rows, first] -= 1
+        prev = keys - strides[first]
+        values = gamma[first] * H[prev]
+        for j in range(len(dims)):
+            has = k[:, j] > 0
+            if has.any():
+                values[has] += A[first[has], j] * k[has, j].reshape((-1,) + trailing) * H[prev[has] - strides[j]]
+        H[keys] = values
+
+
+def loop_hafnian_sectors(A, gamma, cutoff):
+    """
+    Yield (patterns, loop hafnians) for every pattern below the cutoff, one photon-number sector at a time.
+
+    Same recursion as loop_hafnian_table, which only looks one and two
+    photons back, so two earlier sectors are kept instead of the whole table.
+    """
+    A, gamma = np.asarray(A), np.asarray(gamma)
+    modes = len(gamma)
+    strides = cutoff ** np.arange(modes - 1, -1, -1)
+    empty = (np.zeros(0, dtype=int), np.zeros(0, dtype=complex))
+    previous, older = empty, empty
+
+    def lookup(sector, keys):
+        sorted_keys, values = sector
+        return values[np.searchsorted(sorted_keys, keys)]
+
+    for total, patterns in enumerate(pattern_sectors(modes, cutoff)):
+        if total == 0:
+            values = np.ones(len(patterns), dtype=complex)
+        else:
+            # Remove one copy of the first occupied index and match it with the rest
+            rows = np.arange(len(patterns))
+            first = np.argmax(patterns > 0, axis=1)
+            k = patterns.copy()
+            k[rows, first] -= 1
+            keys = k @ strides
+            values = gamma[first] * lookup(previous, keys)
+            for j in range(modes):
+                has = k[:, j] > 0
+                if has.any():
+                    values[has] += A[first[has], j] * k[has, j] * lookup(older, keys[has] - strides[j])
+        yield patterns, values
+        previous, older = (patterns @ strides, values), previous
+
+
+def loop_hafnian_repeated(A, gamma, reps):
+    """
+    Loop hafnian of A with row/column i repeated reps[i] times and loops weighted by gamma
+    """
+    return loop_hafnian_table(A, gamma, reps).flat[-1]
+
+
+def reduced_state(cov, means, modes):
+    """
+    Covariance matrix and means of the listed modes, tracing out the others
+    """
+    n = cov.shape[-1] // 2
+    idx = np.array(list(modes) + [m + n for m in modes], dtype=int)
+    return cov[..., idx[:, None], idx[None, :]], means[..., idx]
+
+
+def mode_photon_stats(cov, means=None, hbar=2):
+    """
+    Mean and variance of the photon number in every mode
+    """
+    cov = np.asarray(cov, dtype=float)
+    n = cov.shape[-1] // 2
+    means = np.zeros(cov.shape[:-1]) if means is None else np.asarray(means, dtype=float)
+    # Stack the 2x2 (x_j, p_j) blocks of every mode
+    idx = np.stack([np.arange(n), np.arange(n) + n], axis=1)
+    V = cov[..., idx[:, :, None], idx[:, None, :]]
+    mu = means[..., idx]
+    mean = (np.trace(V, axis1=-2, axis2=-1) + np.sum(mu ** 2, axis=-1)) / (2 * hbar) - 0.5
+    var = (np.sum(V * V, axis=(-2, -1)) + 2 * np.einsum('...mi,...mij,...mj->...m', mu, V, mu)) / (2 * hbar ** 2) - 0.25
+    return mean, np.maximum(var, 0.0)
+
+
+def classical_state(cov, means, hbar=2):
+    """
+    Product of displaced thermal states with the same mean fields and mean photon numbers.
+
+    The excess noise of every mode (from squeezing, say) becomes thermal
+    photons, and the correlations between quadratures and between modes are
+    dropped, which leaves classical light.
+    """
+    cov = np.asarray(cov, dtype=float)
+    n = cov.shape[-1] // 2
+    idx = np.arange(n)
+    # (2 nbar + 1) hbar / 2 on both quadratures, with nbar the photons above the mean field
+    noise = np.maximum((cov[..., idx, idx] + cov[..., idx + n, idx + n]) / 2, hbar / 2)
+    return np.concatenate([noise, noise], axis=-1)[..., None] * np.identity(2 * n), means
+
+
+def choose_cutoff(cov, means=None, coverage=0.999, hbar=2, max_cutoff=60):
+    """
+    Smallest Fock cutoff whose truncated space keeps `coverage` of the probability mass.
+
+    The mean and variance of each mode's photon number bound the search through
+    Cantelli's inequality; the exact single-mode photon distributions then pick
+    the smallest cutoff below that bound. The captured mass reported is a
+    guaranteed lower bound (one minus the summed per-mode tails). For a batch
+    of states the cutoff covers every state and the captured mass is the
+    smallest one.
+    """
+    cov = np.asarray(cov, dtype=float)
+    n = cov.shape[-1] // 2
+    means = np.zeros(cov.shape[:-1]) if means is None else np.asarray(means, dtype=float)
+    mean, var = mode_photon_stats(cov, means, hbar)
+
+    budget = max(1.0 - coverage, 1e-15)
+    delta = budget / n
+    bound = np.ceil(mean + np.sqrt(var * (1 - delta) / delta)) + 1
+    upper = int(min(max(np.max(bound), 1), max_cutoff))
+
+    # Exact photon-number distribution of every mode up to the moment bound
+    cumulative = np.stack([
+        np.cumsum(all_probs_batch(*reduced_state(cov, means, [mode]), upper, hbar), axis=-1)
+        for mode in range(n)
+    ], axis=-2)
+
+    tails = np.clip(1.0 - cumulative, 0.0, 1.0).sum(axis=-2)
+    worst = tails.reshape(-1, upper).max(axis=0)
+    reached = np.nonzero(worst <= budget)[0]
+    cutoff = int(reached[0]) + 1 if len(reached) else upper
+    mode_mass = np.minimum(cumulative[..., cutoff - 1], 1.0)
+    report = {
+        'cutoff': cutoff,
+        'coverage': coverage,
+        'captured_mass': float(max(1.0 - worst[cutoff - 1], 0.0)),
+        'mode_captured_mass': mode_mass.tolist(),
+        'mean_photons': mean.tolist(),
+        'photon_variance': var.tolist(),
+        'truncated': bool(worst[cutoff - 1] > budget),
+    }
+    return cutoff, report
+
+
+def loop_hafnian_parameters(cov, means=None, hbar=2):
+    """
+    Matrix A, loop weights gamma and vacuum prefactor shared by every probability of a Gaussian state
+    """
+    cov = np.asarray(cov, dtype=float)
+    n = cov.shape[-1] // 2
+    means = np.zeros(cov.shape[:-1]) if means is None else np.asarray(means, dtype=float)
+
+    Q = complex_covariance(cov, hbar)
+    Qinv = np.linalg.inv(Q)
+    beta = complex_means(means, hbar)
+    # A = X (I - Q^-1)^*, where X swaps the a and a^dagger halves
+    M = (np.identity(2 * n) - Qinv).conj()
+    A = np.concatenate([M[..., n:, :], M[..., :n, :]], axis=-2)
+    gamma = beta.conj() - np.einsum('...ij,...j->...i', A, beta)
+    exponent = np.einsum('...i,...ij,...j->...', beta, Qinv, beta.conj())
+    prefactor = (np.exp(-0.5 * exponent) / np.sqrt(np.linalg.det(Q))).real
+    return A, gamma, prefactor
+
+
+def factorial_norm(cutoff, modes, dtype=float):
+    """
+    Product of n_i! over the axes of a (cutoff,) * modes tensor
+    """
+    factorials = np.array([math.factorial(k) for k in range(cutoff)], dtype=float)
+    norm = np.ones((cutoff,) * modes)
+    for axis in range(modes):
+        norm = norm * factorials.reshape((-1,) + (1,) * (modes - axis - 1))
+    return norm.astype(dtype)
+
+
+def all_probs_batch(cov, means, cutoff, hbar=2, dtype=np.complex128):
+    """
+    Dense probability tensors of shape batch + (cutoff,) * modes for a batch of Gaussian states.
+
+    `dtype` is the precision of the loop-hafnian table; the probabilities come
+    back in its real counterpart (float32 for complex64).
+    """
+    cov = np.asarray(cov, dtype=float)
+    n = cov.shape[-1] // 2
+    batch = cov.shape[:-2]
+    real = np.empty(0, dtype=dtype).real.dtype
+    A, gamma, prefactor = loop_hafnian_parameters(cov, means, hbar)
+    shape = (cutoff,) * n
+    prefactor = prefactor.astype(real).reshape(batch + (1,) * n)
+    if cutoff == 1:
+        return np.broadcast_to(prefactor, batch + shape).copy()
+
+    corner = np.full(n, cutoff - 1)
+    table = loop_hafnian_table(A, gamma, np.concatenate([corner, corner]), dtype)
+    table = table.reshape((cutoff ** n, cutoff ** n) + batch)
+    # Diagonal entries (k, k) give the probabilities; np.diagonal moves that axis last
+    values = np.diagonal(table, axis1=0, axis2=1).real.reshape(batch + shape)
+    return np.maximum(prefactor * values / factorial_norm(cutoff, n, real), 0)
+
+
+def rounding_error(probs, exact, count=ROUNDING_CHECKS):
+    """
+    Largest relative difference between the `count` most probable entries of
+    a reduced-precision table and exact(index), their double-precision values
+    """
+    flat = probs.reshape(-1)
+    count = min(count, flat.size)
+    error = 0.0
+    for index in np.argpartition(flat, -count)[-count:]:
+        reference = exact(np.unravel_index(index, probs.shape))
+        if reference > 0:
+            error = max(error, abs(float(flat[index]) - reference) / reference)
+    return error
+
+
+def pattern_probabilities(state, patterns):
+    """
+    Probabilities of each pattern (row) for state = (A, gamma, prefactor, pure).
+
+    Every pattern is an independent loop hafnian, so fill_parallel can split
+    the rows across processes.
+    """
+    A, gamma, prefactor, pure = state
+    n = len(gamma) // 2
+    values = np.empty(len(patterns))
+    for row, pattern in enumerate(patterns):
+        pattern = np.asarray(pattern, dtype=int)
+        norm = float(np.prod([math.factorial(k) for k in pattern]))
+        if pure:
+            value = abs(loop_hafnian_repeated(A[:n, :n], gamma[:n], pattern)) ** 2
+        else:
+            value = loop_hafnian_repeated(A, gamma, np.concatenate([pattern, pattern])).real
+        values[row] = max(float(prefactor * value / norm), 0.0)
+    return values
+
+
+def index_probabilities(payload, indices):
+    """
+    Probabilities of the patterns at a range of flat indices into the (cutoff,) * modes tensor
+    """
+    state, cutoff = payload
+    shape = (cutoff,) * (len(state[1]) // 2)
+    patterns = np.stack(np.unravel_index(np.arange(indices.start, indices.stop), shape), axis=-1)
+    return pattern_probabilities(state, patterns)
+
+
+class GaussianFockProbabilities:
+    """
+    Photon-number probabilities of a Gaussian state, computed on demand per pattern
+    """
+
+    def __init__(self, cov, means=None, hbar=2, tol=1e-12, dtype=np.complex128):
+        cov = np.asarray(cov, dtype=float)
+        self.modes = cov.shape[0] // 2
+        n = self.modes
+        self.A, self.gamma, self.prefactor = loop_hafnian_parameters(cov, means, hbar)
+        # Precision of dense tables; single patterns are always evaluated in double
+        self.dtype = np.dtype(dtype)
+        self.real_dtype = np.empty(0, dtype=self.dtype).real.dtype
+
+        # Pure states have A = B (+) B*, so each probability is |lhaf(B)|^2 over half the indices
+        self.pure = np.allclose(self.A[:n, n:], 0, atol=tol)
+
+    @property
+    def state(self):
+        """
+        Everything the probability kernels need, in a form worker processes can receive
+        """
+        return self.A, self.gamma, self.prefactor, self.pure
+
+    def prob(self, pattern):
+        """
+        Probability of detecting exactly `pattern` photons in the modes
+        """
+        return float(pattern_probabilities(self.state, [pattern])[0])
+
+    def all_probs(self, cutoff):
+        """
+        Dense probability tensor of shape (cutoff,) * modes from a single recursion pass
+        """
+        n = self.modes
+        shape = (cutoff,) * n
+        prefactor = self.real_dtype.type(self.prefactor)
+        if cutoff == 1:
+            return np.full(shape, prefactor)
+        # Every sub-pattern of the corner pattern appears in its loop hafnian table
+        corner = np.full(n, cutoff - 1)
+        if self.pure:
+            values = np.abs(loop_hafnian_table(self.A[:n, :n], self.gamma[:n], corner, self.dtype)) ** 2
+        else:
+            table = loop_hafnian_table(self.A, self.gamma, np.concatenate([corner, corner]), self.dtype)
+            values = np.diagonal(table.reshape(cutoff ** n, cutoff ** n)).real.reshape(shape)
+        return np.maximum(prefactor * values / factorial_norm(cutoff, n, self.real_dtype), 0)
+
+    def probs(self, patterns):
+        """
+        Probabilities of a list of patterns, keyed by pattern_key; long lists are split across processes
+        """
+        patterns = [[int(n) for n in pattern] for pattern in patterns]
+        values = fill_parallel(pattern_probabilities, self.state, patterns, min_items=PARALLEL_MIN_PATTERNS)
+        return {pattern_key(pattern): float(value) for pattern, value in zip(patterns, values)}
+
+    def dense_probs(self, cutoff, out=None):
+        """
+        Dense probability tensor of shape (cutoff,) * modes; `out` may be a memory-mapped NPY file to fill in place.
+
+        A single recursion shares work between patterns, so it is used while
+        its table fits in MAX_TABLE_BYTES. Beyond that every pattern is an
+        independent evaluation with bounded memory, split across processes.
+        """
+        shape = (cutoff,) * self.modes
+        indices = self.modes if self.pure else 2 * self.modes
+        if self.dtype.itemsize * cutoff ** indices <= MAX_TABLE_BYTES:
+            values = self.all_probs(cutoff)
+            if out is None:
+                return values
+            out[...] = values
+            return out
+        flat = None if out is None else out.reshape(-1)
+        values = fill_parallel(
+            index_probabilities, (self.state, cutoff), range(cutoff ** self.modes), self.real_dtype, out=flat,
+            min_items=PARALLEL_MIN_PATTERNS,
+        )
+        return values.reshape(shape)
+
+    def iter_probs(self, max_photons=None, tol=None):
+        """
+        Lazily yield (pattern, probability) in order of increasing total photon number.
+
+        Stops after the `max_photons` sector, or as soon as the probability mass
+        left outside the sectors seen so far drops below `tol`.
+        """
+        if max_photons is None and tol is None:
+            raise ValueError('iter_probs needs max_photons or tol to terminate')
+        captured = 0.0
+        total = 0
+        while max_photons is None or total <= max_photons:
+            for pattern in photon_patterns(total, self.modes):
+                p = self.prob(pattern)
+                captured += p
+                yield pattern, p
+            if tol is not None and 1.0 - captured <= tol:
+                return
+            total += 1
+
+
+class PoissonFockProbabilities:
+    """
+    Photon-number probabilities of a product of coherent states, with the same interface as GaussianFockProbabilities.
+
+    Coherent light through passive optics stays coherent in every mode, so
+    each mode counts Poisson photons with mean |alpha_j|^2 and no loop
+    hafnians are needed. The covariance matrix is assumed to be the vacuum's.
+    """
+
+    def __init__(self, cov, means=None, hbar=2, dtype=np.complex128):
+        cov = np.asarray(cov, dtype=float)
+        self.modes = cov.shape[0] // 2
+        means = np.zeros(2 * self.modes) if means is None else np.asarray(means, dtype=float)
+        self.intensity = np.abs(complex_means(means, hbar)[:self.modes]) ** 2
+        self.real_dtype = np.empty(0, dtype=dtype).real.dtype
+
+    def mode_probs(self, cutoff):
+        """
+        Poisson probabilities of 0..cutoff-1 photons, one row per mode
+        """
+        n = np.arange(cutoff)
+        log_factorials = np.cumsum(np.log(np.maximum(n, 1)))
+        lam = self.intensity[:, None]
+        probs = np.exp(n * np.log(np.where(lam > 0, lam, 1.0)) - lam - log_factorials)
+        # Modes left in vacuum never click
+        probs[self.intensity == 0, 1:] = 0.0
+        return probs
+
+    def prob(self, pattern):
+        """
+        Probability of detecting exactly `pattern` photons in the modes
+        """
+        pattern = np.asarray(pattern, dtype=int)
+        probs = self.mode_probs(int(pattern.max(initial=0)) + 1)
+        return float(np.prod(probs[np.arange(self.modes), pattern]))
+
+    def all_probs(self, cutoff):
+        """
+        Dense probability tensor of shape (cutoff,) * modes as an outer product of Poissons
+        """
+        tensor = np.ones((), dtype=self.real_dtype)
+        for row in self.mode_probs(cutoff).astype(self.real_dtype):
+            tensor = np.multiply.outer(tensor, row)
+        return tensor
+
+    def probs(self, patterns):
+        """
+        Probabilities of a list of patterns, keyed by pattern_key
+        """
+        return {pattern_key(pattern): self.prob(pattern) for pattern in patterns}
+
+
+def make_auto_cutoff(coverage=0.999, reports=None, tensor_cutoff=None):
+    """
+    Build the auto_cutoff(state) helper exposed to executed Strawberry Fields code.
+
+    `tensor_cutoff(modes)` is the largest cutoff whose cutoff**modes tensor the
+    code may build; the picked cutoff never exceeds it.
+    """
+    def auto_cutoff(state, coverage=coverage, max_cutoff=60):
+        """
+        Smallest cutoff keeping `coverage` of the state's probability mass
+        """
+        if not hasattr(state, 'cov'):
+            # Fock backend states are already truncated at the engine's cutoff
+            return state.cutoff_dim
+        limit = max_cutoff
+        if tensor_cutoff is not None:
+            limit = min(limit, tensor_cutoff(len(state.means()) // 2))
+        cutoff, report = choose_cutoff(state.cov(), state.means(), coverage, state.hbar, limit)
+        if limit < max_cutoff:
+            # The joint tensor bounds the cutoff; truncated says whether that costs coverage
+            report['max_cutoff'] = limit
+        if reports is not None:
+            reports.append(report)
+        return cutoff
+    return auto_cutoff
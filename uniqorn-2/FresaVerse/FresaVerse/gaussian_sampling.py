@@ -0,0 +1,141 @@
+"""
+Photon-number and threshold-detector samples of Gaussian states by the chain rule.
+
+A sample is drawn one mode at a time: the outcome of mode k follows
+P(n_1, ..., n_k) / P(n_1, ..., n_k-1), where both are probabilities of the
+reduced state of the first k modes. Those are loop hafnians for photon numbers
+(gaussian_probs) and vacuum overlaps for clicks (threshold_probs). Shots that
+agree on a prefix share its conditional distribution, so all shots go down
+the tree of prefixes together, one mode per step. Each step evaluates the
+children of its distinct prefixes in one batch, split across processes. It
+then sends the shots at every prefix to its children with one multinomial
+draw. The work grows with the distinct prefixes (at most shots * modes),
+never with cutoff**modes.
+
+Photon numbers are drawn below a cutoff per mode. The mass above it is
+renormalised away and reported as the largest conditional mass dropped. All
+draws come from one generator in this process, so a seed gives the same
+samples whatever the number of worker processes.
+"""
+
+import math
+
+import numpy as np
+
+from fock import tensor_clicks, tensor_counts
+from gaussian_probs import GaussianFockProbabilities, choose_cutoff, loop_hafnian_table, pattern_key, reduced_state
+from threshold_probs import click_probabilities
+from workers import fill_parallel
+
+# Prefixes per step from which their children are evaluated on the process pool
+PARALLEL_MIN_PREFIXES = 64
+
+# Photon-number resolving or click / no-click detectors
+DETECTORS = ('pnr', 'threshold')
+
+
+def children_probabilities(payload, prefixes):
+    """
+    P(prefix + (n,)) for n < cutoff with payload = ((A, gamma, prefactor, pure), cutoff), one row per prefix.
+
+    One loop-hafnian table per prefix, with the last mode repeated up to
+    cutoff - 1 times, holds every child at once.
+    """
+    (A, gamma, prefactor, pure), cutoff = payload
+    k = len(gamma) // 2
+    factorials = np.array([math.factorial(n) for n in range(cutoff)], dtype=float)
+    values = np.empty((len(prefixes), cutoff))
+    for row, prefix in enumerate(prefixes):
+        reps = np.array(list(prefix) + [cutoff - 1], dtype=int)
+        fixed = int(np.count_nonzero(reps[:-1]))
+        if pure:
+            table = loop_hafnian_table(A[:k, :k], gamma[:k], reps)
+            column = np.abs(table[(-1,) * fixed]) ** 2
+        else:
+            table = loop_hafnian_table(A, gamma, np.concatenate([reps, reps]))
+            column = np.diagonal(table[(-1,) * fixed + (slice(None),) + (-1,) * fixed]).real
+        norm = float(np.prod([math.factorial(n) for n in prefix])) * factorials
+        values[row] = np.maximum(prefactor * column / norm, 0.0)
+    return values
+
+
+def click_children(state, prefixes):
+    """
+    Probabilities of prefix + (no click,) and prefix + (click,), one row per prefix
+    """
+    candidates = np.array([tuple(prefix) + (n,) for prefix in prefixes for n in range(2)], dtype=bool)
+    return click_probabilities(state, candidates).reshape(len(prefixes), 2)
+
+
+def prefix_states(cov, means, hbar, detector):
+    """
+    Kernel state of the reduced state of the first k modes, for k = 1 .. modes
+    """
+    modes = len(cov) // 2
+    states = []
+    for k in range(1, modes + 1):
+        sub_cov, sub_means = reduced_state(cov, means, range(k))
+        if detector == 'threshold':
+            states.append((sub_cov, sub_means, hbar))
+        else:
+            states.append(GaussianFockProbabilities(sub_cov, sub_means, hbar=hbar).state)
+    return states
+
+
+def sample_counts(cov, means, shots, hbar=2, detector='pnr', cutoff=None, seed=None, coverage=0.999):
+    """
+    Histogram of `shots` detection patterns keyed like Perceval BasicStates, and a report.
+
+    Without a cutoff, photon numbers are drawn below the one choose_cutoff picks for `coverage`.
+    """
+    if detector not in DETECTORS:
+        raise ValueError(f'Unknown detector: {detector}; use one of {", ".join(DETECTORS)}')
+    cov = np.asarray(cov, dtype=float)
+    means = np.zeros(len(cov)) if means is None else np.asarray(means, dtype=float)
+    report = {'detector': detector, 'shots': shots}
+    if detector == 'pnr':
+        if cutoff is None:
+            cutoff, _ = choose_cutoff(cov, means, coverage, hbar)
+        # At least 0 or 1 photons, so the last mode keeps an axis in the loop-hafnian tables
+        cutoff = max(int(cutoff), 2)
+        report['cutoff'] = cutoff
+    rng = np.random.default_rng(seed)
+    prefixes, counts, weights = [()], np.array([shots]), np.ones(1)
+    dropped = 0.0
+    for state in prefix_states(cov, means, hbar, detector):
+        if detector == 'threshold':
+            probs = fill_parallel(click_children, state, prefixes, min_items=PARALLEL_MIN_PREFIXES, row_shape=(2,))
+        else:
+            probs = fill_parallel(
+                children_probabilities, (state, cutoff), prefixes, min_items=PARALLEL_MIN_PREFIXES, row_shape=(cutoff,),
+            )
+        totals = probs.sum(axis=1)
+        dropped = max(dropped, float(np.max(1.0 - totals / weights, initial=0.0)))
+        next_prefixes, next_counts, next_weights = [], [], []
+        for prefix, count, row, total in zip(prefixes, counts, probs, totals):
+            # Nothing left below the cutoff: keep the shots at the last outcome rather than lose them
+            split = rng.multinomial(count, row / total) if total > 0 else np.eye(len(row), dtype=int)[-1] * count
+            for n in np.flatnonzero(split):
+                next_prefixes.append(prefix + (int(n),))
+                next_counts.append(split[n])
+                next_weights.append(row[n])
+        prefixes, counts, weights = next_prefixes, np.array(next_counts), np.array(next_weights)
+    report['dropped_mass'] = dropped
+    order = np.argsort(-counts, kind='stable')
+    return {pattern_key(prefixes[i]): int(counts[i]) for i in order}, report
+
+
+def state_counts(state, shots=1000, detector='pnr', seed=None):
+    """
+    Histogram of `shots` samples of a Strawberry Fields state, for executed code.
+
+    Gaussian states are sampled by the chain rule; Fock states are drawn from their probability tensor.
+    """
+    if hasattr(state, 'cov'):
+        return sample_counts(state.cov(), state.means(), int(shots), state.hbar, detector, seed=seed)[0]
+    if detector not in DETECTORS:
+        raise ValueError(f'Unknown detector: {detector}; use one of {", ".join(DETECTORS)}')
+    probs = np.real(state.all_fock_probs())
+    if detector == 'threshold':
+        probs = tensor_clicks(probs)
+    return tensor_counts(probs, list(range(probs.ndim)), probs.ndim, int(shots), seed)
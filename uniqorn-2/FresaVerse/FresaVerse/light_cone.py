@@ -0,0 +1,106 @@
+"""
+Light-cone pruning: simulate only the modes that light can reach.
+
+A mode is lit once a source acts on it (a Laser, a non-zero squeezing or
+displacement, or input photons) or once a two-mode element couples it to a
+lit mode. Everything that acts only on modes that stay dark sees vacuum, and
+passive optics leaves vacuum unchanged, so those modes and elements are
+removed before simulating and put back afterwards as deterministic zeros.
+Neighbouring lit modes stay neighbours after renumbering, because a
+two-mode element between a lit and a dark mode would have lit both.
+"""
+
+import numpy as np
+
+from gaussian_probs import pattern_key
+from structured import element_modes
+
+# Elements that put light into a vacuum mode on the Gaussian path
+GAUSSIAN_SOURCES = ('Laser', 'Squeezing Gate', 'Displacement Gate')
+
+
+def is_source(element, sources):
+    """
+    Whether an element can turn vacuum into light
+    """
+    return element['type'] in sources and element['parameters'].get('r', 1.0) != 0
+
+
+def lit_modes(circuit, sources=GAUSSIAN_SOURCES, input_state=None):
+    """
+    Modes that can hold light at the end of the circuit, in increasing order
+    """
+    modes = circuit['modes']
+    lit = {mode for mode, count in enumerate(input_state or []) if count}
+    for element in circuit['elements']:
+        targets = element_modes(element, modes)
+        if targets is None:
+            continue
+        if is_source(element, sources) or (len(targets) > 1 and lit.intersection(targets)):
+            lit.update(targets)
+    return sorted(lit)
+
+
+def prune_circuit(circuit, kept):
+    """
+    Circuit on the `kept` modes only, renumbered in order
+    """
+    index = {mode: position for position, mode in enumerate(kept)}
+    elements = []
+    for element in circuit['elements']:
+        targets = element_modes(element, circuit['modes']) or (element['mode'],)
+        if not all(mode in index for mode in targets):
+            continue
+        element = dict(element, mode=index[element['mode']])
+        if 'targets' in element:
+            element['targets'] = tuple(index[mode] for mode in element['targets'])
+        elements.append(element)
+
+    pruned = dict(circuit, modes=len(kept), elements=elements)
+    if 'input_state' in circuit:
+        pruned['input_state'] = [circuit['input_state'][mode] for mode in kept]
+    return pruned
+
+
+def light_cone_report(kept, modes):
+    """
+    Which modes were simulated and which were filled in as vacuum
+    """
+    return {
+        'simulated_modes': list(kept),
+        'pruned_modes': [mode for mode in range(modes) if mode not in set(kept)],
+    }
+
+
+def expand_state(cov, means, kept, modes, hbar=2):
+    """
+    Covariance matrix and means on all modes, with vacuum on the pruned ones
+    """
+    idx = np.array(list(kept) + [mode + modes for mode in kept], dtype=int)
+    full_cov = hbar / 2 * np.identity(2 * modes)
+    full_means = np.zeros(2 * modes)
+    full_cov[np.ix_(idx, idx)] = cov
+    full_means[idx] = means
+    return full_cov, full_means
+
+
+def expand_unitary(U, kept, modes):
+    """
+    Unitary on all modes, acting as the identity on the pruned ones
+    """
+    full = np.identity(modes, dtype=complex)
+    full[np.ix_(kept, kept)] = U
+    return full
+
+
+def expand_distribution(dist, kept, modes):
+    """
+    Re-key a {pattern: value} dict of the kept modes with zeros in the pruned ones
+    """
+    expanded = {}
+    for key, value in dist.items():
+        pattern = [0] * modes
+        for mode, count in zip(kept, key.strip('|>').split(',')):
+            pattern[mode] = int(count)
+        expanded[pattern_key(pattern)] = value
+    return expanded
@@ -0,0 +1,126 @@
+"""
+Linear-optics simulation of structured circuits with Fock-state inputs.
+
+The circuit unitary follows Perceval's conventions and the elements the app
+generates for Perceval: ``PS(phi)`` phase shifters and balanced ``BS()`` beam
+splitters between neighbouring modes. Output statistics come from permanents
+of submatrices of the unitary (see permanents.py), so nothing is enumerated
+that was not asked for.
+"""
+
+import math
+
+import numpy as np
+
+from permanents import permanent
+from structured import FUSED, element_modes
+
+# Elements the generated Perceval code leaves out of the spatial circuit
+PASSIVE_NO_OPS = (
+    'Laser', 'Photonic Measurement', 'Half Wave Plate', 'Quarter Wave Plate',
+    'Permutation', 'Polarizing Beam Splitter', 'Time Delay', 'Unitary',
+)
+
+
+def element_unitary(element):
+    """
+    Small unitary of an element in Perceval's conventions, or None if it has none
+    """
+    kind = element['type']
+    if kind == FUSED:
+        return element['block']
+    if kind == 'Phase Shifter':
+        return np.array([[np.exp(1j * element['parameters']['phi'])]])
+    if kind == 'Beam Splitter':
+        # pcvl.BS() is the Rx convention with theta = pi/2
+        return np.array([[1, 1j], [1j, 1]]) / np.sqrt(2)
+    return None
+
+
+def embedded_unitary(element, modes):
+    """
+    Unitary of one element on all modes, or None if it leaves the circuit unchanged
+    """
+    block = element_unitary(element)
+    targets = element_modes(element, modes)
+    if block is None or targets is None:
+        return None
+    U = np.identity(modes, dtype=complex)
+    U[np.ix_(targets, targets)] = block
+    return U
+
+
+def ignored_elements(circuit):
+    """
+    Element types that could not be simulated (the generated code's no-ops are not reported)
+    """
+    modes = circuit['modes']
+    return [
+        element['type'] for element in circuit['elements']
+        if element_modes(element, modes) is None
+        or (element_unitary(element) is None and element['type'] not in PASSIVE_NO_OPS)
+    ]
+
+
+def circuit_unitary(circuit):
+    """
+    Unitary of the whole circuit, plus the elements that could not be simulated
+    """
+    modes = circuit['modes']
+    U = np.identity(modes, dtype=complex)
+    for element in circuit['elements']:
+        block = element_unitary(element)
+        targets = element_modes(element, modes)
+        if block is None or targets is None:
+            continue
+        targets = list(targets)
+        U[targets, :] = block @ U[targets, :]
+    return U, ignored_elements(circuit)
+
+
+def occupied_indices(state):
+    """
+    Mode index of every photon, e.g. [2, 0, 1] -> [0, 0, 2]
+    """
+    return [mode for mode, count in enumerate(state) for _ in range(count)]
+
+
+def output_probability(U, input_state, output_state):
+    """
+    Probability of one output pattern for indistinguishable photons
+    """
+    if sum(input_state) != sum(output_state):
+        return 0.0
+    rows = occupied_indices(output_state)
+    cols = occupied_indices(input_state)
+    norm = np.prod([math.factorial(n) for n in list(input_state) + list(output_state)])
+    return float(abs(permanent(U[np.ix_(rows, cols)])) ** 2 / norm)
+
+
+def marginal_probs(U, input_state, subset, cutoff=None):
+    """
+    Photon-number distribution of the modes in `subset`, tracing out the rest.
+
+    The generating function E[prod z_j^n_j] is per((U^dag Z U)[in, in]) / prod(n_i!)
+    with z_j = 1 outside the subset; evaluating it on roots of unity and taking
+    an FFT gives the marginal exactly, with one permanent per grid point instead
+    of a sum over every pattern of the other modes.
+    """
+    photons = int(sum(input_state))
+    size = photons + 1
+    cols = occupied_indices(input_state)
+    norm = np.prod([math.factorial(n) for n in input_state])
+    U_sub = U[list(subset), :][:, cols]
+    base = U[:, cols].conj().T @ U[:, cols]
+
+    roots = np.exp(2j * np.pi * np.arange(size) / size)
+    values = np.empty((size,) * len(subset), dtype=complex)
+    for grid in np.ndindex(*values.shape):
+        z = roots[list(grid)]
+        W = base + U_sub.conj().T @ ((z - 1)[:, None] * U_sub)
+        values[grid] = permanent(W) / norm
+
+    probs = np.clip(np.fft.fftn(values).real / size ** len(subset), 0.0, None)
+    if cutoff is not None:
+        probs = probs[(slice(0, cutoff),) * len(subset)]
+    return probs
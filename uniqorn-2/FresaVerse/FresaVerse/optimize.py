@@ -0,0 +1,147 @@
+"""
+Peephole optimization of structured circuits before simulation.
+
+Generated circuits often hold chains such as several phase shifters on one
+mode or a phase shifter right before a beam splitter on the same pair. The
+pass below walks the element list once and merges every element into the
+latest operation on its modes whenever the two act on the same mode or
+neighbouring pair and nothing in between touches the modes being moved.
+Merged operations become a single "Fused Block" element carrying its small
+matrix (a unitary for linear optics, a Gaussian channel for Strawberry
+Fields), and elements that reduce to the identity, such as phi = 0, are
+dropped. Elements without a block (Lasers, Kerr gates, elements left out of
+the simulation) stay in place and act as barriers on their modes.
+"""
+
+import numpy as np
+
+from linear_optics import element_unitary
+from structured import FUSED, element_modes
+from symplectic import compose_channels, local_channel, local_indices
+
+
+def fused_element(support, block):
+    """
+    Structured element holding a merged block on `support`
+    """
+    return {'type': FUSED, 'mode': support[0], 'targets': support, 'parameters': {}, 'block': block}
+
+
+def optimize_circuit(circuit, block_of, embed, compose, is_identity):
+    """
+    Fuse neighbouring blocks and drop identities, returning the new circuit and a report.
+
+    `block_of(element)` gives an element's block on its modes (or None for a
+    barrier), `embed(block, support, union)` widens a block to more modes and
+    `compose(second, first)` multiplies two blocks on the same modes.
+    """
+    modes = circuit['modes']
+    slots = []  # {'element', 'support', 'block'}, or None once merged into a later slot
+    last = {}   # mode -> slot of the latest operation on it
+    report = {'elements_before': len(circuit['elements']), 'fused': 0, 'dropped': 0}
+
+    for element in circuit['elements']:
+        targets = element_modes(element, modes)
+        block = block_of(element) if targets is not None else None
+        if block is None:
+            slots.append({'element': element, 'support': None, 'block': None})
+            for mode in targets or (element['mode'],):
+                last[mode] = len(slots) - 1
+            continue
+        if is_identity(block):
+            report['dropped'] += 1
+            continue
+
+        support = tuple(targets)
+        current = element
+        placed = False
+        merging = True
+        while merging and not placed:
+            merging = False
+            for index in sorted({last[mode] for mode in support if mode in last}, reverse=True):
+                slot = slots[index]
+                if slot is None or slot['block'] is None:
+                    continue
+                if set(support) <= set(slot['support']) and all(last.get(mode) == index for mode in support):
+                    # Nothing touched these modes since the slot: fold the element into it
+                    merged = compose(embed(block, support, slot['support']), slot['block'])
+                    report['fused'] += 1
+                    if is_identity(merged):
+                        slots[index] = None
+                        report['dropped'] += 1
+                    else:
+                        slots[index] = {'element': fused_element(slot['support'], merged),
+                                        'support': slot['support'], 'block': merged}
+                    placed = True
+                    break
+                if set(slot['support']) < set(support) and all(last[mode] == index for mode in slot['support']):
+                    # The slot's modes stayed untouched: move it forward into this element
+                    block = compose(block, embed(slot['block'], slot['support'], support))
+                    current = fused_element(support, block)
+                    slots[index] = None
+                    report['fused'] += 1
+                    merging = True
+                    break
+        if not placed:
+            slots.append({'element': current, 'support': support, 'block': block})
+            for mode in support:
+                last[mode] = len(slots) - 1
+
+    elements = [slot['element'] for slot in slots if slot is not None]
+    report['elements_after'] = len(elements)
+    return dict(circuit, elements=elements), report
+
+
+def _positions(support, union):
+    """
+    Positions of the modes of `support` within `union`
+    """
+    return [list(union).index(mode) for mode in support]
+
+
+def optimize_unitary_circuit(circuit):
+    """
+    Optimization pass for linear-optics circuits, fusing small unitaries
+    """
+    def embed(block, support, union):
+        wide = np.identity(len(union), dtype=complex)
+        pos = _positions(support, union)
+        wide[np.ix_(pos, pos)] = block
+        return wide
+
+    return optimize_circuit(
+        circuit,
+        element_unitary,
+        embed,
+        lambda second, first: second @ first,
+        lambda block: np.allclose(block, np.identity(len(block))),
+    )
+
+
+def optimize_gaussian_circuit(circuit):
+    """
+    Optimization pass for Gaussian circuits, fusing gates into symplectic blocks with displacements
+    """
+    def gate(element):
+        # Preparations (Y != 0) and non-Gaussian elements are barriers
+        channel = local_channel(element)
+        if channel is None or np.any(channel[1]):
+            return None
+        return channel
+
+    def embed(block, support, union):
+        X, Y, d = block
+        size = 2 * len(union)
+        idx = local_indices(_positions(support, union), len(union))
+        wide_X, wide_d = np.identity(size), np.zeros(size)
+        wide_X[np.ix_(idx, idx)] = X
+        wide_d[idx] = d
+        return wide_X, np.zeros((size, size)), wide_d
+
+    return optimize_circuit(
+        circuit,
+        gate,
+        embed,
+        compose_channels,
+        lambda block: np.allclose(block[0], np.identity(len(block[0]))) and np.allclose(block[2], 0.0),
+    )
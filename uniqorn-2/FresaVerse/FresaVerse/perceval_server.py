@@ -5,6 +5,31 @@ import json
 import numpy as np
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
+import distinguishable
+from code_guard import guard_code
+from boson_sampling import sample_counts
+from gaussian_probs import pattern_key, photon_patterns
+from linear_optics import circuit_unitary, marginal_probs, output_probability
+from light_cone import expand_distribution, expand_unitary, light_cone_report, lit_modes, prune_circuit
+from optimize import optimize_unitary_circuit
+from permanents import output_probabilities, slos_memory
+from planner import (
+    DEFAULT_SHOTS, MAX_MEMORY, MAX_SECONDS, linear_optics_estimates, linear_optics_readout_estimates, plan_linear_optics,
+    plan_linear_optics_readouts,
+)
+from sessions import SessionStore, unitary_session
+from top_outcomes import distribution_top_k, top_k_outcomes
+from structured import format_distribution, marginal_key, parse_circuit, photon_detections, requested_marginals
+
+# Above this estimated SLOS footprint, full distributions come from the permanent engine
+SLOS_MEMORY_LIMIT = 2 * 1024 ** 3
+
+# Largest full distribution the permanent engine will enumerate
+MAX_DENSE_OUTCOMES = 2000000
+
+# Cached circuit unitaries for requests carrying a session_id
+SESSIONS = SessionStore(unitary_session)
+
 class PercevalHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         # Get the content length
@@ -14,10 +39,18 @@ class PercevalHandler(BaseHTTPRequestHandler):
         # Parse the JSON data
         try:
             data = json.loads(post_data.decode('utf-8'))
-            code = data.get('code', '')
             
-            # Execute the Perceval code
-            result = self.execute_perceval_code(code)
+            if self.path.rstrip('/') == '/structured':
+                # Simulate the element list directly, without generated code
+                result = self.run_structured(data)
+            elif self.path.rstrip('/') == '/estimate':
+                # Predict the cost of a structured request without running it
+                result = self.estimate(data)
+            else:
+                code = data.get('code', '')
+                
+                # Execute the Perceval code
+                result = self.execute_perceval_code(code)
             
             # Send response
             self.send_response(200)
@@ -57,6 +90,9 @@ class PercevalHandler(BaseHTTPRequestHandler):
                 'np': np,
             }
             
+            # Clamp oversized sample counts and cutoffs, and refuse programs that cannot fit, before running anything
+            code, guard_report = guard_code(code)
+            
             # Try to import Perceval
             try:
                 import perceval as pcvl
@@ -85,6 +121,116 @@ class PercevalHandler(BaseHTTPRequestHandler):
                     if not key.startswith('__') and key not in ['pcvl', 'np']:
                         results[key] = str(value)
             
+            results['resource_guard'] = guard_report
+            
+            return {
+                'success': True,
+                'results': results
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+
+    def run_structured(self, data):
+        """
+        Simulate a structured circuit and answer the requested outputs
+        """
+        try:
+            circuit = parse_circuit(data)
+            outputs = data.get('outputs', {})
+            modes = circuit['modes']
+            # Same default as the generated code: one photon in the first mode
+            input_state = circuit.get('input_state', [1] + [0] * (modes - 1))
+            
+            results = {}
+            kept = list(range(modes))
+            if 'session_id' in data:
+                # Parameter edits: only the changed elements are recomposed
+                session, results['session'] = SESSIONS.get(str(data['session_id']), circuit)
+                U, ignored = session.transfer(), session.ignored
+                results['session']['compositions'] = session.compositions
+            else:
+                simulated, kept = self.light_cone(circuit, input_state, data, results)
+                if data.get('optimize', True):
+                    simulated, results['optimization'] = optimize_unitary_circuit(simulated)
+                U, ignored = circuit_unitary(simulated)
+            # Kernels below see every mode; full distributions stay on the simulated ones
+            U_kept, input_kept = U, [input_state[mode] for mode in kept]
+            U = expand_unitary(U_kept, kept, modes)
+            if ignored:
+                results['ignored_elements'] = ignored
+            
+            # Every request is admitted on the cost of what it asks for, before any kernel runs
+            results['plan'] = self.plan(circuit, input_state, kept, outputs, data.get('engine'))
+            
+            if circuit['simulation'] == 'distinguishable':
+                # Classical baseline: photons walk independently over |U|^2
+                marginal, probability, probabilities, sampler = (
+                    distinguishable.marginal_probs, distinguishable.output_probability,
+                    distinguishable.output_probabilities, distinguishable.sample_counts,
+                )
+            else:
+                marginal, probability, probabilities, sampler = (
+                    marginal_probs, output_probability, output_probabilities, sample_counts,
+                )
+            
+            # Quantum marginals come from permanents on a roots-of-unity grid, never the joint distribution
+            cutoff = int(outputs['cutoff']) if 'cutoff' in outputs else None
+            marginals = {
+                subset: marginal(U, input_state, subset, cutoff)
+                for subset in requested_marginals(outputs, modes)
+            }
+            results['marginals'] = {
+                marginal_key(subset): format_distribution(probs) for subset, probs in marginals.items()
+            }
+            detections = photon_detections(marginals)
+            if detections:
+                results['photon_detections'] = detections
+            
+            if 'fock_patterns' in outputs:
+                patterns = [[int(n) for n in pattern] for pattern in outputs['fock_patterns']]
+                probs = probabilities(U, input_state, patterns)
+                results['fock_probabilities'] = {
+                    pattern_key(pattern): float(prob) for pattern, prob in zip(patterns, probs)
+                }
+            
+            if outputs.get('probabilities') and circuit['simulation'] == 'distinguishable':
+                distribution = distinguishable.output_distribution(U_kept, input_kept)
+                results['probabilities'] = expand_distribution(distribution, kept, modes)
+                results['engine'] = 'distinguishable'
+            elif outputs.get('probabilities'):
+                results['engine'] = results['plan']['engine']
+                distribution = self.full_distribution(U_kept, input_kept, results['engine'], outputs)
+                results['probabilities'] = expand_distribution(distribution, kept, modes)
+            
+            if 'top_k' in outputs and 'probabilities' in results and results.get('engine') != 'sampling':
+                # The exact distribution is already listed; rank it instead of searching
+                results['top_k'] = distribution_top_k(results['probabilities'], int(outputs['top_k']))
+            elif 'top_k' in outputs:
+                # Photon number is conserved, so the single input sector holds all the mass
+                mode_marginals = [
+                    marginals[(mode,)] if (mode,) in marginals and cutoff is None else
+                    marginal(U, input_state, (mode,))
+                    for mode in range(modes)
+                ]
+                top = top_k_outcomes(
+                    lambda pattern: probability(U, input_state, pattern),
+                    mode_marginals, [sum(input_state)], int(outputs['top_k']),
+                    max_evaluations=int(outputs.get('max_evaluations', 10000)),
+                    time_limit=outputs.get('time_limit'),
+                    sectors_complete=True,
+                )
+                results['top_k'] = top
+                if 'probabilities' not in results:
+                    results['probabilities'] = {item['pattern']: item['probability'] for item in top['outcomes']}
+            
+            if 'samples' in outputs:
+                # Exact samples drawn photon by photon, without the output distribution
+                results['counts'] = sampler(U, input_state, int(outputs['samples']), outputs.get('seed'))
+            
             return {
                 'success': True,
                 'results': results
@@ -95,6 +241,108 @@ class PercevalHandler(BaseHTTPRequestHandler):
                 'success': False,
                 'error': str(e)
             }
+    
+    def light_cone(self, circuit, input_state, data, results):
+        """
+        Circuit (with its input state) restricted to the modes photons can reach, and those modes
+        """
+        modes = circuit['modes']
+        simulated = dict(circuit, input_state=input_state)
+        if not data.get('prune', True):
+            return simulated, list(range(modes))
+        # Photons never reach modes outside the light cone of the occupied inputs
+        lit = lit_modes(simulated, sources=(), input_state=input_state)
+        if not 0 < len(lit) < modes:
+            return simulated, list(range(modes))
+        results['light_cone'] = light_cone_report(lit, modes)
+        return prune_circuit(simulated, lit), lit
+    
+    def plan(self, circuit, input_state, kept, outputs, engine=None):
+        """
+        Admitted plan for a structured request: the cheapest engine for a full
+        quantum distribution, or the cost of the other readouts alone
+        """
+        if outputs.get('probabilities') and circuit['simulation'] != 'distinguishable':
+            # Cheapest engine that can list this distribution, unless the request names one
+            return plan_linear_optics(*self.planner_inputs(kept, [input_state[mode] for mode in kept], outputs), engine)
+        return plan_linear_optics_readouts(
+            circuit['modes'], sum(input_state), outputs, circuit['simulation'] == 'distinguishable',
+        )
+    
+    def planner_inputs(self, kept, input_kept, outputs):
+        """
+        Arguments of the planner for the full distribution of the kept modes
+        """
+        photons = sum(input_kept)
+        return len(kept), photons, outputs, slos_memory(len(kept), photons), SLOS_MEMORY_LIMIT, MAX_DENSE_OUTCOMES
+    
+    def estimate(self, data):
+        """
+        Predicted runtime, peak memory and output size per engine, and whether the request would be admitted
+        """
+        try:
+            circuit = parse_circuit(data)
+            outputs = data.get('outputs', {})
+            input_state = circuit.get('input_state', [1] + [0] * (circuit['modes'] - 1))
+            results = {'limits': {'seconds': MAX_SECONDS, 'memory_bytes': MAX_MEMORY}}
+            _, kept = self.light_cone(circuit, input_state, data, results)
+            try:
+                results.update(self.plan(circuit, input_state, kept, outputs, data.get('engine')), admitted=True)
+            except ValueError as e:
+                if outputs.get('probabilities') and circuit['simulation'] != 'distinguishable':
+                    input_kept = [input_state[mode] for mode in kept]
+                    estimates = linear_optics_estimates(*self.planner_inputs(kept, input_kept, outputs))
+                else:
+                    estimates = linear_optics_readout_estimates(
+                        circuit['modes'], sum(input_state), outputs, circuit['simulation'] == 'distinguishable',
+                    )
+                results.update(estimates=estimates, admitted=False, reason=str(e))
+            return {
+                'success': True,
+                'results': results
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e)
+            }
+    
+    def full_distribution(self, U, input_state, engine, outputs):
+        """
+        Full output distribution from the engine chosen by the planner
+        """
+        modes = len(input_state)
+        photons = sum(input_state)
+        if engine == 'closed-form':
+            # At most one photon: it leaves input mode i through mode j with probability |U_ji|^2
+            if photons == 0:
+                return {pattern_key([0] * modes): 1.0}
+            column = np.abs(U[:, input_state.index(1)]) ** 2
+            return {
+                pattern_key([int(mode == j) for mode in range(modes)]): float(prob)
+                for j, prob in enumerate(column) if prob > 1e-12
+            }
+        
+        if engine == 'slos':
+            import perceval as pcvl
+            
+            processor = pcvl.Processor("SLOS", pcvl.Unitary(pcvl.Matrix(U)))
+            processor.with_input(pcvl.BasicState(input_state))
+            return {str(state): float(prob) for state, prob in processor.probs()['results'].items()}
+        
+        if engine == 'sampling':
+            # Too many outcomes to list: estimate the distribution from exact samples
+            shots = int(outputs.get('samples', DEFAULT_SHOTS))
+            counts = sample_counts(U, input_state, shots, outputs.get('seed'))
+            return {pattern: count / shots for pattern, count in counts.items()}
+        
+        # Too many photons for SLOS: evaluate every pattern with batched permanents
+        patterns = list(photon_patterns(photons, modes))
+        probs = output_probabilities(U, input_state, patterns)
+        return {
+            pattern_key(pattern): float(prob) for pattern, prob in zip(patterns, probs) if prob > 1e-12
+        }
 
 if __name__ == '__main__':
     port = 8081  # Different port from Strawberry Fields
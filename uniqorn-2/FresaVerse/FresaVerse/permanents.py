@@ -0,0 +1,185 @@
+"""
+Permanent kernels for linear-optics output probabilities.
+
+All kernels use Glynn's formula, perm(M) = 2^(1-n) sum_d (prod_i d_i) prod_j (sum_i d_i M_ij),
+walking the sign vectors d in Gray-code order so that consecutive row sums
+differ by a single row. The walk is vectorized in NumPy blocks (one cumulative
+sum per block) and large ranges are split across the shared process pool.
+
+Many output patterns of the same input share the row sums of the input
+columns, so ``output_amplitudes`` computes them once per sign vector and
+only gathers and multiplies per pattern.
+"""
+
+import math
+
+import numpy as np
+
+from workers import fill_parallel, get_pool, split_range, worker_count
+
+# Sign vectors handled per vectorized block
+BLOCK_SIZE = 4096
+
+# Matrices at least this large have their sign-vector range split across processes
+PARALLEL_MIN_SIZE = 20
+
+
+def _gray_block(start, stop, n):
+    """
+    Sign vectors d_1..d_{n-1} (d_0 = +1) of Gray codes start..stop-1, plus the flipped bit between them
+    """
+    k = np.arange(start, stop, dtype=np.int64)
+    codes = k ^ (k >> 1)
+    signs = 1 - 2 * ((codes[:, None] >> np.arange(n - 1)) & 1)
+    # Bit flipped going from code k-1 to code k is the lowest set bit of k
+    flipped = np.zeros(len(k), dtype=np.int64)
+    nonzero = k > 0
+    low = k[nonzero] & -k[nonzero]
+    flipped[nonzero] = np.log2(low).astype(np.int64)
+    return signs, flipped
+
+
+def _row_sums(columns, start, stop):
+    """
+    Row sums S_k = columns[:, 0] + sum_j d_j columns[:, j] and sign products for Gray codes start..stop-1
+    """
+    n = columns.shape[1]
+    signs, flipped = _gray_block(start, stop, n)
+    sums = np.empty((stop - start, columns.shape[0]), dtype=complex)
+    # First row sum computed directly, the rest by accumulating single-column flips
+    sums[0] = columns[:, 0] + columns[:, 1:] @ signs[0]
+    if stop - start > 1:
+        new_signs = signs[np.arange(1, stop - start), flipped[1:]]
+        steps = 2 * new_signs[:, None] * columns[:, flipped[1:] + 1].T
+        sums[1:] = sums[0] + np.cumsum(steps, axis=0)
+    return sums, np.prod(signs, axis=1)
+
+
+def _glynn_partial(columns, row_sets, start, stop):
+    """
+    Partial Glynn sums over Gray codes start..stop-1 for every set of output rows
+    """
+    total = np.zeros(len(row_sets), dtype=complex)
+    for block_start in range(start, stop, BLOCK_SIZE):
+        block_stop = min(block_start + BLOCK_SIZE, stop)
+        sums, sign = _row_sums(columns, block_start, block_stop)
+        # (block, patterns, photons) products of the row sums picked by each pattern
+        total += sign @ np.prod(sums[:, row_sets], axis=2)
+    return total
+
+
+def _glynn(columns, row_sets, parallel=None):
+    """
+    Permanents of columns[rows, :] for every row set in `row_sets`
+    """
+    n = columns.shape[1]
+    row_sets = np.asarray(row_sets, dtype=np.int64).reshape(-1, n)
+    if n == 0:
+        return np.ones(len(row_sets), dtype=complex)
+    if n == 1:
+        return columns[row_sets[:, 0], 0].astype(complex)
+
+    count = 2 ** (n - 1)
+    if parallel is None:
+        parallel = n >= PARALLEL_MIN_SIZE and worker_count() > 1
+    if not parallel:
+        total = _glynn_partial(columns, row_sets, 0, count)
+    else:
+        pool = get_pool()
+        futures = [
+            pool.submit(_glynn_partial, columns, row_sets, start, stop)
+            for start, stop in split_range(0, count, worker_count())
+        ]
+        total = sum(future.result() for future in futures)
+    return total / count
+
+
+def permanent(M, parallel=None):
+    """
+    Permanent of a square matrix
+    """
+    M = np.asarray(M, dtype=complex)
+    n = M.shape[0]
+    # perm(M) = perm(M^T): the columns of M^T are the rows of M
+    return _glynn(M.T, [list(range(n))], parallel)[0]
+
+
+def permanent_minors(B):
+    """
+    Permanents of B with each column removed, for an (n - 1) x n matrix B, from one Gray-code pass.
+
+    Every minor shares the sign vectors and row sums of Glynn's formula over
+    the rows of B; minor l only leaves out row sum l from the product, which
+    prefix and suffix products give for all l at once in O(n 2^n) total.
+    """
+    B = np.asarray(B, dtype=complex)
+    m, n = B.shape
+    count = 2 ** max(m - 1, 0)
+    total = np.zeros(n, dtype=complex)
+    for block_start in range(0, count, BLOCK_SIZE):
+        block_stop = min(block_start + BLOCK_SIZE, count)
+        # Row sums over the rows of B are the column sums of B^T
+        sums, sign = _row_sums(B.T, block_start, block_stop)
+        prefix = np.ones_like(sums)
+        suffix = np.ones_like(sums)
+        prefix[:, 1:] = np.cumprod(sums[:, :-1], axis=1)
+        suffix[:, :-1] = np.cumprod(sums[:, :0:-1], axis=1)[:, ::-1]
+        total += sign @ (prefix * suffix)
+    return total / count
+
+
+def output_amplitudes(U, input_state, output_states, parallel=None):
+    """
+    Permanents perm(U[out, in]) for many output patterns sharing one input
+    """
+    cols = [mode for mode, count in enumerate(input_state) for _ in range(count)]
+    row_sets = [
+        [mode for mode, count in enumerate(state) for _ in range(count)]
+        for state in output_states
+    ]
+    photons = len(cols)
+    if any(len(rows) != photons for rows in row_sets):
+        raise ValueError('Every output pattern needs as many photons as the input')
+    if not row_sets:
+        return np.zeros(0, dtype=complex)
+    return _glynn(np.asarray(U, dtype=complex)[:, cols], row_sets, parallel)
+
+
+def output_probabilities(U, input_state, output_states, parallel=None, chunk=None):
+    """
+    Output probabilities of indistinguishable photons for a batch of patterns
+    """
+    output_states = [list(state) for state in output_states]
+    in_norm = np.prod([math.factorial(n) for n in input_state])
+    out_norm = np.array([np.prod([math.factorial(n) for n in state]) for state in output_states])
+    photons = sum(input_state)
+
+    if chunk is None:
+        # Keep the (block, patterns, photons) gather below a few tens of megabytes
+        block = min(BLOCK_SIZE, 2 ** max(photons - 1, 0))
+        chunk = max(2 ** 21 // (block * max(photons, 1)), 1)
+    chunks = [output_states[i:i + chunk] for i in range(0, len(output_states), chunk)]
+    if parallel is None:
+        parallel = worker_count() > 1 and (photons >= PARALLEL_MIN_SIZE or len(chunks) > 1)
+
+    if parallel and photons < PARALLEL_MIN_SIZE and len(chunks) > 1:
+        # Small permanents: spread the patterns across processes, which write into shared memory
+        return fill_parallel(_probability_chunk, (U, input_state, chunk), output_states)
+    amplitudes = np.concatenate([output_amplitudes(U, input_state, part, parallel) for part in chunks])
+    return np.abs(amplitudes) ** 2 / (in_norm * out_norm)
+
+
+def _probability_chunk(payload, output_states):
+    """
+    Worker side of output_probabilities for one share of the patterns
+    """
+    U, input_state, chunk = payload
+    return output_probabilities(U, input_state, output_states, parallel=False, chunk=chunk)
+
+
+def slos_memory(modes, photons, bytes_per_state=64):
+    """
+    Rough memory needed by SLOS, which keeps every intermediate k-photon state for k <= photons
+    """
+    states = sum(math.comb(modes + k - 1, k) for k in range(1, photons + 1))
+    return states * bytes_per_state
@@ -0,0 +1,569 @@
+"""
+Engine selection for structured requests.
+
+The planner looks at the element set, mode count, photon number and the
+requested outputs, keeps the engines that give correct results for the
+circuit, estimates the cost of each and picks the fastest. A request may
+name an engine to override the choice; the plan returned with the results
+explains the decision either way.
+
+Strawberry Fields engines:
+    closed-form  coherent light through passive optics stays a product of
+                 coherent states, so every readout is a product of Poissons
+    symplectic   NumPy Gaussian propagation (symplectic.py)
+    gaussian     Strawberry Fields' Gaussian backend
+    fock         NumPy state vector for Kerr gates (fock.py), with Strawberry
+                 Fields' Fock backend as the fallback for mixed states
+
+Perceval engines (for the full output distribution):
+    closed-form  a single photon ends in mode j with probability |U_ji|^2
+    slos         Perceval's SLOS, while its intermediate states fit in memory
+    permanent    one permanent per output pattern (permanents.py)
+    sampling     exact samples (boson_sampling.py) when there are too many
+                 outcomes to list
+
+Every candidate gets an elementary-operation count, turned into seconds by
+per-engine coefficients that calibrate_planner.py fits on the benchmark
+circuits, plus peak memory and output size estimates. The same estimates gate admission: a plan over the
+limits is downgraded to a correct engine that fits, or rejected before it
+reaches a worker.
+"""
+
+import json
+import math
+import os
+
+from fock import DIAGONAL_ELEMENTS, split_circuit
+
+GAUSSIAN_ENGINES = ('closed-form', 'symplectic', 'gaussian', 'fock')
+LINEAR_OPTICS_ENGINES = ('closed-form', 'slos', 'permanent', 'sampling')
+
+# Fixed cost of building and running a Strawberry Fields or Perceval program, in the same units as the estimates
+LIBRARY_OVERHEAD = 2e5
+
+# Strawberry Fields' Fock backend, the fallback for mixed states, is about this many
+# times slower per amplitude update than the NumPy state vector
+STRAWBERRY_FOCK_FACTOR = 75
+
+# Shots drawn when a full distribution is too large and sampling is chosen instead
+DEFAULT_SHOTS = 1000
+
+# Fixed seconds per request and seconds per estimated operation, by engine.
+# calibrate_planner.py refits them on the serving machine into CALIBRATION_FILE.
+DEFAULT_CALIBRATION = {
+    'closed-form': {'seconds': 4e-3, 'seconds_per_operation': 5e-7},
+    'symplectic': {'seconds': 4e-3, 'seconds_per_operation': 1e-6},
+    'gaussian': {'seconds': 0.0, 'seconds_per_operation': 2.7e-6},
+    'fock': {'seconds': 1.5e-3, 'seconds_per_operation': 7e-8},
+    'slos': {'seconds': 0.0, 'seconds_per_operation': 9e-7},
+    'permanent': {'seconds': 6e-2, 'seconds_per_operation': 2e-6},
+    'sampling': {'seconds': 3e-2, 'seconds_per_operation': 4e-6},
+}
+CALIBRATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'planner_calibration.json')
+
+# Admission limits: a plan over either one is downgraded or rejected
+MAX_SECONDS = float(os.environ.get('UNIQORN_MAX_SECONDS', 300))
+MAX_MEMORY = int(os.environ.get('UNIQORN_MAX_MEMORY', 4 * 1024 ** 3))
+
+# Rough JSON size of one {pattern: probability} entry, plus two bytes per mode in the key
+BYTES_PER_ENTRY = 24
+
+_calibration = None
+
+
+def calibration():
+    """
+    Timing coefficients per engine, from CALIBRATION_FILE when it exists
+    """
+    global _calibration
+    if _calibration is None:
+        _calibration = {name: dict(values) for name, values in DEFAULT_CALIBRATION.items()}
+        if os.path.exists(CALIBRATION_FILE):
+            with open(CALIBRATION_FILE) as f:
+                for name, values in json.load(f).items():
+                    _calibration.setdefault(name, {}).update(values)
+    return _calibration
+
+
+def non_gaussian_elements(circuit):
+    """
+    Kerr gates that actually act (kappa != 0)
+    """
+    return [
+        element for element in circuit['elements']
+        if element['type'] == 'Kerr Gate' and element['parameters'].get('kappa', 0.0) != 0
+    ]
+
+
+def is_classical(circuit):
+    """
+    Whether the circuit keeps every mode in a coherent state (no squeezing, no Kerr)
+    """
+    squeezed = any(
+        element['type'] == 'Squeezing Gate' and element['parameters'].get('r', 0.0) != 0
+        for element in circuit['elements']
+    )
+    # Distinguishable light drops the Kerr phases, but squeezing still leaves thermal noise
+    if circuit.get('simulation') == 'distinguishable':
+        return not squeezed
+    return not non_gaussian_elements(circuit) and not squeezed
+
+
+def estimated_photons(circuit):
+    """
+    Rough total mean photon number from the sources, before any state is computed
+    """
+    total = 0.0
+    for element in circuit['elements']:
+        params = element['parameters']
+        if element['type'] == 'Laser':
+            total += 1.0
+        elif element['type'] == 'Displacement Gate':
+            total += params.get('r', 0.0) ** 2
+        elif element['type'] == 'Squeezing Gate':
+            total += math.sinh(params.get('r', 0.0)) ** 2
+    return total
+
+
+def estimated_cutoff(circuit, outputs):
+    """
+    Fock cutoff used for costing: the requested one, or mean + 4 sigma of a Poisson guess
+    """
+    if 'cutoff' in outputs:
+        return int(outputs['cutoff'])
+    mean = estimated_photons(circuit)
+    return max(int(math.ceil(mean + 4 * math.sqrt(mean))) + 2, 3)
+
+
+def readout_cost(outputs, modes, cutoff, closed_form=False):
+    """
+    Operations spent on the requested readouts: loop-hafnian tables, or products of Poissons
+    """
+    subsets = outputs.get('marginals', 'per_mode')
+    sizes = [1] * modes if subsets == 'per_mode' else [len(subset) for subset in subsets]
+    if closed_form:
+        cost = sum(cutoff ** size for size in sizes)
+        cost += sum(len(pattern) for pattern in outputs.get('fock_patterns', []))
+    else:
+        cost = sum(cutoff ** (2 * size) * size for size in sizes)
+        for pattern in outputs.get('fock_patterns', []):
+            cost += math.prod(n + 1 for n in pattern) ** 2 * max(len(pattern), 1)
+    if 'top_k' in outputs:
+        cost += int(outputs.get('max_evaluations', 10000)) * modes ** 2
+    return cost
+
+
+def tensor_cost(outputs, modes, cutoff, pure=True):
+    """
+    Operations and bytes of the outputs.tensor file of cutoff**modes entries.
+
+    A pure state takes one loop-hafnian step per entry; a mixed one takes a
+    loop hafnian of up to cutoff**modes terms per entry.
+    """
+    kind = outputs.get('tensor')
+    if kind is None:
+        return 0, 0
+    entries = cutoff ** modes
+    itemsize = 16 if kind == 'amplitudes' else 8
+    if outputs.get('precision') == 'single':
+        itemsize //= 2
+    operations = entries * modes if pure else entries ** 2 * modes
+    return operations, entries * itemsize
+
+
+def quadrature_cost(outputs, modes):
+    """
+    Operations and bytes of outputs.quadratures: one eigendecomposition of
+    the measured covariance, then a shots x measured draw times its factor,
+    kept as normals, outcomes and their float32 encoding
+    """
+    spec = outputs.get('quadratures')
+    if spec is None:
+        return 0, 0
+    shots = int(spec.get('shots', 1000))
+    measured = len(spec.get('modes', range(modes)))
+    if spec.get('measurement', 'homodyne') == 'heterodyne':
+        # x and p of every measured mode
+        measured *= 2
+    return measured ** 3 + shots * measured ** 2, 20 * shots * measured
+
+
+def click_cost(outputs, modes):
+    """
+    Operations and bytes of threshold-detector readouts, counted in vacuum
+    overlaps of one modes x modes determinant each: one per subset of the
+    clicking modes of a pattern, and 2**modes for the full click distribution
+    """
+    overlaps = sum(2 ** sum(1 for n in pattern if n) for pattern in outputs.get('click_patterns', []))
+    if outputs.get('clicks'):
+        return (overlaps + 2 ** modes) * modes ** 3, 8 * 2 ** modes
+    return overlaps * modes ** 3, 0
+
+
+def gaussian_sample_cost(outputs, modes, cutoff, photons):
+    """
+    Operations and bytes of chain-rule samples of a Gaussian state.
+
+    Step k evaluates the children of at most min(shots, distinct prefixes)
+    prefixes. Photon numbers take a loop-hafnian table per prefix, of
+    cutoff * (1 + mean)**(k - 1) entries per half for `photons` spread over
+    the modes; clicks take two k x k vacuum overlaps per prefix.
+    """
+    if 'samples' not in outputs:
+        return 0, 0
+    shots = int(outputs['samples'])
+    mean = photons / max(modes, 1)
+    threshold = outputs.get('detector', 'pnr') == 'threshold'
+    outcomes = 2 if threshold else cutoff
+    operations = 0
+    memory = 0
+    for k in range(1, modes + 1):
+        prefixes = min(shots, outcomes ** (k - 1))
+        if threshold:
+            operations += prefixes * 2 * k ** 3
+        else:
+            operations += prefixes * (cutoff * (1 + mean) ** (k - 1)) ** 2 * k
+        # Every prefix and the probabilities of its children
+        memory = max(memory, 8 * prefixes * (k + outcomes))
+    return operations, memory
+
+
+def output_entries(outputs, modes, cutoff, outcomes=None):
+    """
+    Number of {pattern: probability} entries the requested outputs return
+    """
+    subsets = outputs.get('marginals', 'per_mode')
+    sizes = [1] * modes if subsets == 'per_mode' else [len(subset) for subset in subsets]
+    entries = sum(cutoff ** size for size in sizes) + len(outputs.get('fock_patterns', []))
+    entries += int(outputs.get('top_k', 0))
+    if outputs.get('probabilities') and outcomes is not None:
+        entries += outcomes
+    if 'samples' in outputs:
+        entries += min(int(outputs['samples']), outcomes or int(outputs['samples']))
+    return entries
+
+
+def estimate(engine, operations, memory, entries, modes):
+    """
+    Runtime, peak memory and output size of one engine
+    """
+    timing = calibration()[engine]
+    return {
+        'operations': float(operations),
+        'seconds': float(timing['seconds'] + operations * timing['seconds_per_operation']),
+        'memory_bytes': int(memory),
+        'output_bytes': int(entries * (BYTES_PER_ENTRY + 2 * modes)),
+    }
+
+
+def gaussian_costs(circuit, outputs):
+    """
+    Estimated operations per Strawberry Fields engine that can run this circuit
+    """
+    modes = circuit['modes']
+    elements = len(circuit['elements'])
+    cutoff = estimated_cutoff(circuit, outputs)
+    propagation = elements * 4 * modes + 8 * modes ** 3
+    readout = readout_cost(outputs, modes, cutoff)
+
+    # Distinguishable light turns squeezing into thermal noise, and a mixed state needs a loop hafnian per entry
+    tensor, _ = tensor_cost(outputs, modes, cutoff, circuit.get('simulation') != 'distinguishable')
+    quadratures, _ = quadrature_cost(outputs, modes)
+    clicks, _ = click_cost(outputs, modes)
+    samples, _ = gaussian_sample_cost(outputs, modes, cutoff, estimated_photons(circuit))
+    readout += tensor + quadratures + clicks + samples
+
+    costs = {}
+    if is_classical(circuit):
+        costs['closed-form'] = (
+            propagation + tensor + quadratures + clicks + samples
+            + readout_cost(outputs, modes, cutoff, closed_form=True)
+        )
+    # The Gaussian engines leave Kerr gates out, so they only stay exact without them
+    costs['symplectic'] = propagation + readout
+    costs['gaussian'] = LIBRARY_OVERHEAD + propagation + readout
+    # The Fock engine copies its tensor out of the state it already holds
+    costs['fock'] = fock_cost(circuit, cutoff, outputs.get('tensor') == 'amplitudes') + (cutoff ** modes if tensor else 0)
+    return costs
+
+
+def fock_cost(circuit, cutoff, keep_phases=False):
+    """
+    Operations of the Fock engine: one loop-hafnian step per amplitude for the
+    Gaussian prefix, then cutoff**modes amplitudes times the matrix size of each remaining gate
+    """
+    modes = circuit['modes']
+    amplitudes = cutoff ** modes
+    _, fock_part, _ = split_circuit(circuit, keep_phases)
+    if any(element['type'] == 'Laser' for element in fock_part):
+        # Strawberry Fields' backend applies every gate to the truncated state
+        gates = len(circuit['elements']) * amplitudes * cutoff ** 2
+        return STRAWBERRY_FOCK_FACTOR * (LIBRARY_OVERHEAD + gates + amplitudes * modes)
+    cost = amplitudes * modes
+    for element in fock_part:
+        if element['type'] in DIAGONAL_ELEMENTS:
+            cost += amplitudes
+        elif element['type'] == 'Beam Splitter':
+            cost += amplitudes * cutoff ** 2 + cutoff ** 3
+        else:
+            cost += amplitudes * cutoff + cutoff ** 2
+    return cost
+
+
+def gaussian_estimates(circuit, outputs):
+    """
+    Runtime, memory and output size per Strawberry Fields engine that can run this circuit
+    """
+    modes = circuit['modes']
+    cutoff = estimated_cutoff(circuit, outputs)
+    subsets = outputs.get('marginals', 'per_mode')
+    largest = 1 if subsets == 'per_mode' else max((len(subset) for subset in subsets), default=1)
+    state = 8 * (2 * modes) ** 2
+    # A loop-hafnian table holds cutoff**(2 * size) complex entries for the largest subset
+    tables = 16 * cutoff ** (2 * largest)
+    entries = output_entries(outputs, modes, cutoff)
+    # The outputs.tensor file, counted against the memory limit like any other buffer
+    _, tensor = tensor_cost(outputs, modes, cutoff)
+    # Quadratures, clicks and samples from the covariance only come from the Gaussian engines
+    _, quadratures = quadrature_cost(outputs, modes)
+    _, clicks = click_cost(outputs, modes)
+    _, samples = gaussian_sample_cost(outputs, modes, cutoff, estimated_photons(circuit))
+
+    estimates = {}
+    for name, operations in gaussian_costs(circuit, outputs).items():
+        if name == 'closed-form':
+            memory = state + 8 * modes * cutoff + tensor + quadratures + clicks + samples
+        elif name == 'fock':
+            # Pure state amplitudes, a few working copies for the gates and the probability tensor,
+            # which the probabilities file replaces
+            amplitude = 8 if outputs.get('precision') == 'single' else 16
+            memory = (4 * amplitude + amplitude // 2) * cutoff ** modes
+            if outputs.get('tensor') == 'amplitudes':
+                memory += tensor
+        else:
+            memory = state + tables + tensor + quadratures + clicks + samples
+        estimates[name] = estimate(name, operations, memory, entries, modes)
+    return estimates
+
+
+def fits(estimate):
+    """
+    Whether an estimate is within the admission limits
+    """
+    return estimate['seconds'] <= MAX_SECONDS and estimate['memory_bytes'] <= MAX_MEMORY
+
+
+def over_limits(engine, estimate):
+    """
+    Error message for an engine that would not be admitted
+    """
+    return (
+        f'The {engine} engine needs about {estimate["seconds"]:.3g} s and '
+        f'{estimate["memory_bytes"] / 1024 ** 2:.3g} MiB, over the limits of '
+        f'{MAX_SECONDS:.3g} s and {MAX_MEMORY / 1024 ** 2:.3g} MiB'
+    )
+
+
+def admit(plan, estimates, fallbacks):
+    """
+    Apply the admission limits to a plan: keep it, downgrade it to the first of `fallbacks` that fits, or reject it
+    """
+    engine = plan['engine']
+    if fits(estimates[engine]):
+        return plan
+    admitted = [name for name in fallbacks if fits(estimates[name])]
+    if not admitted:
+        raise ValueError(over_limits(engine, estimates[engine]) + '; request fewer outputs, modes or photons')
+    fallback = admitted[0]
+    return dict(
+        plan, engine=fallback,
+        reason=f'{over_limits(engine, estimates[engine])}, so the {fallback} engine is used instead',
+        downgraded_from=engine,
+    )
+
+
+def explain(engine, estimates, reason):
+    """
+    Plan dict returned with the results
+    """
+    ranked = sorted(estimates.items(), key=lambda item: item[1]['seconds'])
+    return {
+        'engine': engine,
+        'reason': reason,
+        'estimates': dict(ranked),
+    }
+
+
+def plan_gaussian(circuit, outputs, engine=None):
+    """
+    Choose the Strawberry Fields engine for a structured circuit
+    """
+    estimates = gaussian_estimates(circuit, outputs)
+    kerr = non_gaussian_elements(circuit)
+    if engine is not None:
+        if engine not in GAUSSIAN_ENGINES:
+            raise ValueError(f'Unknown engine: {engine}')
+        if engine == 'closed-form' and not is_classical(circuit):
+            raise ValueError('The closed-form engine needs a circuit without squeezing or Kerr gates')
+        reason = 'requested'
+        if kerr and engine != 'fock' and circuit.get('simulation') != 'distinguishable':
+            reason += '; Kerr gates are not Gaussian, so they are left out and listed under ignored_elements'
+        return admit(explain(engine, estimates, reason), estimates, [])
+
+    # The Fock engine truncates the state, so it only runs when Kerr gates need it
+    correct = [name for name in estimates if name != 'fock']
+    if kerr and circuit.get('simulation') != 'distinguishable':
+        correct = ['fock']
+    correct.sort(key=lambda name: estimates[name]['seconds'])
+    cheapest = correct[0]
+    if cheapest == 'closed-form':
+        reason = 'coherent light through passive optics: every mode is an independent Poisson distribution'
+    elif cheapest == 'fock':
+        reason = f'{len(kerr)} Kerr gate(s) make the state non-Gaussian, so it is simulated in the Fock basis'
+    else:
+        reason = f'Gaussian circuit: the {cheapest} engine is predicted to be fastest'
+    return admit(explain(cheapest, estimates, reason), estimates, correct)
+
+
+def plan_fixed(circuit, outputs, engine, reason, points=1):
+    """
+    Admission check for requests that always run on one engine, such as sessions, or sweeps of `points` circuits
+    """
+    estimates = gaussian_estimates(circuit, outputs)
+    # Every sweep point holds its own state, loop-hafnian tables and readouts
+    for values in estimates.values():
+        for key in values:
+            values[key] = type(values[key])(values[key] * points)
+    return admit(explain(engine, estimates, reason), estimates, [])
+
+
+def sample_operations(modes, photons):
+    """
+    Operations of one Clifford-Clifford sample: the minors of step k take one
+    k 2^(k-1) Gray-code pass, O(n 2^n) over all steps, plus a modes x k product per step
+    """
+    return photons * 2 ** photons + modes * photons ** 2
+
+
+def linear_optics_readouts(modes, photons, outputs, distinguishable=False):
+    """
+    Operations and peak memory of the Perceval readouts other than the full distribution.
+
+    Quantum marginals take one permanent per point of a (photons + 1)**size
+    roots-of-unity grid, samples one Clifford-Clifford chain each, and the
+    top-k search one permanent per evaluation. Distinguishable photons walk
+    independently, so their marginals and samples take one step per photon.
+    """
+    per_permanent = photons * 2 ** max(photons - 1, 0)
+    subsets = outputs.get('marginals', 'per_mode')
+    sizes = [1] * modes if subsets == 'per_mode' else [len(subset) for subset in subsets]
+    shots = int(outputs.get('samples', 0))
+    if distinguishable:
+        operations = sum((photons + 1) ** size * photons * size for size in sizes) + shots * photons * modes
+        if outputs.get('probabilities'):
+            outcomes = math.comb(modes + photons - 1, photons)
+            operations += outcomes * photons * modes
+    else:
+        operations = sum((photons + 1) ** size * (per_permanent + photons ** 2 * size) for size in sizes)
+        operations += shots * sample_operations(modes, photons)
+    operations += len(outputs.get('fock_patterns', [])) * per_permanent
+    if 'top_k' in outputs:
+        operations += int(outputs.get('max_evaluations', 10000)) * (per_permanent + modes)
+    # The largest marginal grid, and every sampled pattern before it is counted
+    memory = 16 * max(((photons + 1) ** size for size in sizes), default=1) + shots * 8 * modes
+    if distinguishable and outputs.get('probabilities'):
+        memory += math.comb(modes + photons - 1, photons) * 8 * (modes + 1)
+    return operations, memory
+
+
+def linear_optics_costs(modes, photons, outputs, slos_bytes, slos_limit, max_outcomes):
+    """
+    Estimated operations per Perceval engine that can produce the full distribution
+    """
+    outcomes = math.comb(modes + photons - 1, photons)
+    per_permanent = photons * 2 ** max(photons - 1, 0)
+    costs = {}
+    if photons <= 1:
+        costs['closed-form'] = modes
+    if slos_bytes <= slos_limit:
+        costs['slos'] = LIBRARY_OVERHEAD + outcomes * photons * modes
+    if outcomes <= max_outcomes:
+        costs['permanent'] = outcomes * per_permanent
+    shots = int(outputs.get('samples', DEFAULT_SHOTS))
+    costs['sampling'] = shots * sample_operations(modes, photons)
+    readouts, _ = linear_optics_readouts(modes, photons, outputs)
+    return {name: operations + readouts for name, operations in costs.items()}
+
+
+def linear_optics_estimates(modes, photons, outputs, slos_bytes, slos_limit, max_outcomes):
+    """
+    Runtime, memory and output size per Perceval engine that can produce the full distribution
+    """
+    outcomes = math.comb(modes + photons - 1, photons)
+    shots = int(outputs.get('samples', DEFAULT_SHOTS))
+    entries = output_entries(dict(outputs, probabilities=True), modes, photons + 1, outcomes)
+    # A sampled distribution has at most one entry per shot
+    sampled = output_entries(dict(outputs, probabilities=False, samples=shots), modes, photons + 1, outcomes)
+    memory = {
+        'closed-form': 16 * modes ** 2,
+        'slos': slos_bytes,
+        # Every pattern and its probability are held at once
+        'permanent': outcomes * 8 * (modes + 1),
+        'sampling': 16 * modes ** 2 + shots * 8 * modes,
+    }
+    _, readouts = linear_optics_readouts(modes, photons, outputs)
+    return {
+        name: estimate(name, operations, memory[name] + readouts, sampled if name == 'sampling' else entries, modes)
+        for name, operations in linear_optics_costs(modes, photons, outputs, slos_bytes, slos_limit, max_outcomes).items()
+    }
+
+
+def plan_linear_optics(modes, photons, outputs, slos_bytes, slos_limit, max_outcomes, engine=None):
+    """
+    Choose how the Perceval server computes the full output distribution
+    """
+    estimates = linear_optics_estimates(modes, photons, outputs, slos_bytes, slos_limit, max_outcomes)
+    if engine is not None:
+        if engine not in LINEAR_OPTICS_ENGINES:
+            raise ValueError(f'Unknown engine: {engine}')
+        if engine not in estimates:
+            raise ValueError(f'The {engine} engine cannot list the distribution of {photons} photons in {modes} modes')
+        return admit(explain(engine, estimates, 'requested'), estimates, [])
+
+    # Sampling only estimates the distribution, so it is the fallback when nothing exact fits
+    exact = sorted(
+        (name for name in estimates if name != 'sampling'), key=lambda name: estimates[name]['seconds'],
+    )
+    cheapest = (exact or ['sampling'])[0]
+    reasons = {
+        'closed-form': 'at most one photon: the distribution is |U_ji|^2',
+        'slos': 'SLOS fits in memory and shares work between outcomes',
+        'permanent': (
+            'few enough outcomes that one permanent each is faster than SLOS' if 'slos' in estimates
+            else 'SLOS would not fit in memory, so each outcome is a permanent'
+        ),
+        'sampling': 'too many outcomes to list, so the distribution is estimated from exact samples',
+    }
+    return admit(explain(cheapest, estimates, reasons[cheapest]), estimates, exact + ['sampling'])
+
+
+def linear_optics_readout_estimates(modes, photons, outputs, distinguishable=False):
+    """
+    Runtime, memory and output size of Perceval requests that do not list the full quantum distribution
+    """
+    operations, memory = linear_optics_readouts(modes, photons, outputs, distinguishable)
+    outcomes = math.comb(modes + photons - 1, photons) if distinguishable and outputs.get('probabilities') else None
+    entries = output_entries(outputs, modes, photons + 1, outcomes)
+    return {'permanent': estimate('permanent', operations, memory, entries, modes)}
+
+
+def plan_linear_optics_readouts(modes, photons, outputs, distinguishable=False):
+    """
+    Admission check for Perceval requests that only ask for marginals, patterns, samples or top-k
+    """
+    estimates = linear_optics_readout_estimates(modes, photons, outputs, distinguishable)
+    reason = (
+        'distinguishable photons: every readout is built one independent photon at a time' if distinguishable
+        else 'no full distribution requested: marginals, patterns, samples and top-k run on the permanent kernels'
+    )
+    return admit(explain('permanent', estimates, reason), estimates, [])
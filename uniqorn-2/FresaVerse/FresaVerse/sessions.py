@@ -0,0 +1,152 @@
+"""
+Incremental re-simulation of a circuit whose parameters are being edited.
+
+While a slider in ParameterEditorView is dragged, the app re-posts the same
+circuit with one parameter changed. A session keeps the transfer of every
+element (the circuit unitary for Perceval, the Gaussian channel for
+Strawberry Fields) with prefix products P_k = T_{k-1} ... T_0 and suffix
+products S_k = T_{n-1} ... T_k. After elements a..b change, the circuit is
+S_{b+1} P_{b+1}, and P_{b+1} only needs the changed elements on top of the
+cached P_a, so each further tick on the same element costs one element
+product plus one product with the cached suffix.
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+import linear_optics
+import symplectic
+
+# Sessions kept per server; the least recently used one is dropped first
+MAX_SESSIONS = 32
+
+
+def circuit_structure(circuit):
+    """
+    Everything about a circuit except its parameters
+    """
+    return circuit['modes'], tuple((element['type'], element['mode']) for element in circuit['elements'])
+
+
+class CircuitSession:
+    """
+    Cached element transfers of one circuit, with prefix and suffix products
+    """
+
+    def __init__(self, circuit, element_transfer, compose, identity, ignored):
+        self.structure = circuit_structure(circuit)
+        self.element_transfer = element_transfer
+        self.compose = compose
+        self.identity = identity
+        self.ignored = ignored
+        self.parameters = [dict(element['parameters']) for element in circuit['elements']]
+        self.transfers = [element_transfer(element) for element in circuit['elements']]
+
+        # None stands for the identity (empty products and elements without a transfer)
+        count = len(self.transfers)
+        self.prefix = [None] * (count + 1)
+        self.suffix = [None] * (count + 1)
+        # prefix[:prefix_valid + 1] and suffix[suffix_valid:] are up to date
+        self.prefix_valid = 0
+        self.suffix_valid = count
+        # The circuit is read as suffix[split] after prefix[split]
+        self.split = count
+        self.compositions = 0
+
+    def update(self, circuit):
+        """
+        Take the parameters of `circuit` (same structure), returning the indices of changed elements
+        """
+        changed = []
+        for index, element in enumerate(circuit['elements']):
+            if element['parameters'] != self.parameters[index]:
+                self.parameters[index] = dict(element['parameters'])
+                self.transfers[index] = self.element_transfer(element)
+                changed.append(index)
+        if changed:
+            self.prefix_valid = min(self.prefix_valid, changed[0])
+            self.suffix_valid = max(self.suffix_valid, changed[-1] + 1)
+            self.split = changed[-1] + 1
+        return changed
+
+    def transfer(self):
+        """
+        Transfer of the whole circuit, recomposing only what changed
+        """
+        self.compositions = 0
+        while self.suffix_valid > self.split:
+            index = self.suffix_valid - 1
+            self.suffix[index] = self._then(self.suffix[index + 1], self.transfers[index])
+            self.suffix_valid = index
+        while self.prefix_valid < self.split:
+            index = self.prefix_valid
+            self.prefix[index + 1] = self._then(self.transfers[index], self.prefix[index])
+            self.prefix_valid = index + 1
+        total = self._then(self.suffix[self.split], self.prefix[self.split])
+        return self.identity if total is None else total
+
+    def _then(self, second, first):
+        """
+        Compose two transfers, skipping elements that have none
+        """
+        if second is None:
+            return first
+        if first is None:
+            return second
+        self.compositions += 1
+        return self.compose(second, first)
+
+
+def unitary_session(circuit):
+    """
+    Session over the circuit unitary, for linear optics
+    """
+    modes = circuit['modes']
+    return CircuitSession(
+        circuit,
+        lambda element: linear_optics.embedded_unitary(element, modes),
+        lambda second, first: second @ first,
+        np.identity(modes, dtype=complex),
+        linear_optics.ignored_elements(circuit),
+    )
+
+
+def gaussian_session(circuit):
+    """
+    Session over the Gaussian channel, for Gaussian circuits
+    """
+    modes = circuit['modes']
+    return CircuitSession(
+        circuit,
+        lambda element: symplectic.element_channel(element, modes),
+        symplectic.compose_channels,
+        symplectic.identity_channel(modes),
+        symplectic.ignored_elements(circuit),
+    )
+
+
+class SessionStore:
+    """
+    Sessions by id, rebuilt whenever the circuit structure changes
+    """
+
+    def __init__(self, factory, max_sessions=MAX_SESSIONS):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.sessions = OrderedDict()
+
+    def get(self, session_id, circuit):
+        """
+        Session for `circuit`, plus a report of what was reused
+        """
+        session = self.sessions.pop(session_id, None)
+        if session is not None and session.structure == circuit_structure(circuit):
+            report = {'reused': True, 'changed_elements': session.update(circuit)}
+        else:
+            session = self.factory(circuit)
+            report = {'reused': False, 'changed_elements': list(range(len(circuit['elements'])))}
+        self.sessions[session_id] = session
+        while len(self.sessions) > self.max_sessions:
+            self.sessions.popitem(last=False)
+        return session, report
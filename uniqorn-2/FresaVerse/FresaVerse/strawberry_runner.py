@@ -4,6 +4,8 @@ import sys
 import json
 import numpy as np
 
+from gaussian_probs import make_auto_cutoff
+
 def execute_strawberry_fields_code(code):
     """
     Execute Strawberry Fields code and return results
@@ -14,6 +16,10 @@ def execute_strawberry_fields_code(code):
             'np': np,
         }
         
+        # Let the code size its Fock cutoff from the state instead of hard-coding one
+        cutoff_reports = []
+        namespace['auto_cutoff'] = make_auto_cutoff(reports=cutoff_reports)
+        
         # Try to import Strawberry Fields
         try:
             import strawberryfields as sf
@@ -39,9 +45,16 @@ def execute_strawberry_fields_code(code):
         # If no specific results found, return the whole namespace (excluding built-ins)
         if not results:
             for key, value in namespace.items():
-                if not key.startswith('__') and key not in ['sf', 'np']:
+                if not key.startswith('__') and key not in ['sf', 'np', 'auto_cutoff']:
                     results[key] = str(value)
         
+        # Report the cutoff that was picked and how much probability mass it keeps
+        if cutoff_reports:
+            report = dict(cutoff_reports[-1])
+            if 'captured_mass' in namespace:
+                report['realized_mass'] = float(namespace['captured_mass'])
+            results['cutoff_report'] = report
+        
         return {
             'success': True,
             'results': results
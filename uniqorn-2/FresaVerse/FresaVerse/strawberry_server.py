@@ -1,11 +1,46 @@
 #!/usr/bin/env python3
 
+import os
 import sys
 import json
+import shutil
+import itertools
 import numpy as np
 import traceback
 from http.server import HTTPServer, BaseHTTPRequestHandler
 
+from code_guard import guard_code, max_cutoff
+from gaussian_probs import (
+    GaussianFockProbabilities, PoissonFockProbabilities, all_probs_batch, choose_cutoff, classical_state,
+    loop_hafnian_parameters, loop_hafnian_sectors, make_auto_cutoff, mode_photon_stats, pattern_key, pattern_sectors,
+    reduced_state, rounding_error,
+)
+from fock import (
+    MATRIX_CACHE, PRECISIONS, fock_ket, tensor_clicks, tensor_counts, tensor_marginal, tensor_probability, tensor_top_k,
+)
+from gaussian_sampling import DETECTORS, sample_counts, state_counts
+from planner import MAX_MEMORY, MAX_SECONDS, gaussian_estimates, non_gaussian_elements, plan_fixed, plan_gaussian
+from sessions import SessionStore, gaussian_session
+from light_cone import expand_state, light_cone_report, lit_modes, prune_circuit
+from optimize import optimize_gaussian_circuit
+from quadratures import quadrature_samples
+from tensor_store import TENSOR_KINDS, TensorStore, write_sectors
+from threshold_probs import GaussianClickProbabilities, click_patterns
+from wigner import gaussian_wigner, wigner_grid
+from workers import segment_stats
+from symplectic import HBAR, apply_channel, gaussian_state, swept_gaussian_state, vacuum_state
+from top_outcomes import top_k_outcomes
+from structured import (
+    FUSED, element_modes, encode_array, format_distribution, marginal_key, parse_circuit, parse_sweep,
+    photon_detections, requested_marginals,
+)
+
+# Cached Gaussian channels for requests carrying a session_id
+SESSIONS = SessionStore(gaussian_session)
+
+# Dense tensors requested with outputs.tensor, downloadable from GET /tensors/<handle>.npy
+TENSORS = TensorStore()
+
 class StrawberryFieldsHandler(BaseHTTPRequestHandler):
     def do_POST(self):
         # Get the content length
@@ -15,14 +50,31 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
         # Parse the JSON data
         try:
             data = json.loads(post_data.decode('utf-8'))
-            code = data.get('code', '')
             
-            # Log the received code for debugging
-            print("Received code:")
-            print(code)
-            
-            # Execute the Strawberry Fields code
-            result = self.execute_strawberry_fields_code(code)
+            if self.path.rstrip('/') == '/structured':
+                # Simulate the element list directly, without generated code
+                result = self.run_structured(data)
+            elif self.path.rstrip('/') == '/estimate':
+                # Predict the cost of a structured request without running it
+                result = self.estimate(data)
+            elif self.path.rstrip('/') == '/wigner':
+                # Phase-space plot of one mode: raw float32 bytes if asked for, else base64 in the JSON
+                result = self.wigner(data)
+                values = result.get('results', {}).pop('values', None)
+                if values is not None and 'application/octet-stream' in self.headers.get('Accept', ''):
+                    self.send_array(values, result['results'])
+                    return
+                if values is not None:
+                    result['results'].update(encode_array(values))
+            else:
+                code = data.get('code', '')
+                
+                # Log the received code for debugging
+                print("Received code:")
+                print(code)
+                
+                # Execute the Strawberry Fields code
+                result = self.execute_strawberry_fields_code(code, data)
             
             # Send response
             self.send_response(200)
@@ -46,6 +98,47 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
             }
             self.wfile.write(json.dumps(error_response).encode('utf-8'))
     
+    def do_GET(self):
+        path = self.path.rstrip('/')
+        if path.startswith('/tensors/') and path.endswith('.npy'):
+            # Dense tensors written by outputs.tensor, streamed straight from disk
+            tensor = TENSORS.open_file(path[len('/tensors/'):-len('.npy')])
+            if tensor is not None:
+                with tensor:
+                    self.send_response(200)
+                    self.send_header('Content-type', 'application/octet-stream')
+                    self.send_header('Content-Length', str(os.fstat(tensor.fileno()).st_size))
+                    self.send_header('Access-Control-Allow-Origin', '*')
+                    self.end_headers()
+                    shutil.copyfileobj(tensor, self.wfile)
+                return
+        if path == '/metrics':
+            self.send_response(200)
+            result = {'success': True, 'results': self.metrics()}
+        else:
+            self.send_response(404)
+            result = {'success': False, 'error': f'Unknown path: {self.path}'}
+        self.send_header('Content-type', 'application/json')
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.end_headers()
+        self.wfile.write(json.dumps(result).encode('utf-8'))
+    
+    def send_array(self, values, report):
+        """
+        Respond with the little-endian bytes of a float32 array; shape and metadata go in headers
+        """
+        body = np.ascontiguousarray(values, dtype='<f4').tobytes()
+        self.send_response(200)
+        self.send_header('Content-type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('X-Array-Dtype', 'float32')
+        self.send_header('X-Array-Shape', ','.join(str(size) for size in values.shape))
+        self.send_header('X-Array-Info', json.dumps(report))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'X-Array-Dtype, X-Array-Shape, X-Array-Info')
+        self.end_headers()
+        self.wfile.write(body)
+    
     def do_OPTIONS(self):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
@@ -53,7 +146,7 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
         self.send_header('Access-Control-Allow-Headers', 'Content-Type')
         self.end_headers()
     
-    def execute_strawberry_fields_code(self, code):
+    def execute_strawberry_fields_code(self, code, options=None):
         """
         Execute Strawberry Fields code and return results
         """
@@ -63,6 +156,16 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
                 'np': np,
             }
             
+            # Clamp oversized sample counts and cutoffs, and refuse programs that cannot fit, before running anything
+            code, guard_report = guard_code(code)
+            
+            # Let the code size its Fock cutoff from the state instead of hard-coding one
+            cutoff_reports = []
+            coverage = float(options.get('coverage', 0.999)) if options else 0.999
+            namespace['auto_cutoff'] = make_auto_cutoff(coverage, cutoff_reports, max_cutoff)
+            # Real shots from the final state instead of scaled probabilities
+            namespace['sample_counts'] = state_counts
+            
             # Try to import Strawberry Fields
             try:
                 import strawberryfields as sf
@@ -88,9 +191,26 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
             # If no specific results found, return the whole namespace (excluding built-ins)
             if not results:
                 for key, value in namespace.items():
-                    if not key.startswith('__') and key not in ['sf', 'np']:
+                    if not key.startswith('__') and key not in ['sf', 'np', 'auto_cutoff', 'sample_counts']:
                         results[key] = str(value)
             
+            # Evaluate only the requested Fock outcomes instead of the full cutoff**modes tensor
+            if options and ('fock_patterns' in options or 'max_photons' in options):
+                results['fock_probabilities'] = self.gaussian_fock_probabilities(namespace, options)
+            if options and 'click_patterns' in options:
+                state = self.final_gaussian_state(namespace)
+                clicks = GaussianClickProbabilities(state.cov(), state.means(), hbar=state.hbar)
+                results['click_probabilities'] = clicks.probs(options['click_patterns'])
+            
+            # Report the cutoff that was picked and how much probability mass it keeps
+            if cutoff_reports:
+                report = dict(cutoff_reports[-1])
+                if 'captured_mass' in namespace:
+                    report['realized_mass'] = float(namespace['captured_mass'])
+                results['cutoff_report'] = report
+            
+            results['resource_guard'] = guard_report
+            
             return {
                 'success': True,
                 'results': results
@@ -109,6 +229,606 @@ class StrawberryFieldsHandler(BaseHTTPRequestHandler):
                 'traceback': traceback.format_exc()
             }
 
+    def gaussian_fock_probabilities(self, namespace, options):
+        """
+        Compute Fock probabilities pattern by pattern from the final Gaussian state
+        """
+        state = self.final_gaussian_state(namespace)
+        engine = GaussianFockProbabilities(state.cov(), state.means(), hbar=state.hbar)
+        if 'fock_patterns' in options:
+            return engine.probs(options['fock_patterns'])
+        return {
+            pattern_key(pattern): prob
+            for pattern, prob in engine.iter_probs(max_photons=int(options['max_photons']))
+        }
+
+    def final_gaussian_state(self, namespace):
+        """
+        The Gaussian state the executed code ended with
+        """
+        state = namespace.get('state')
+        if state is None and 'result' in namespace:
+            state = namespace['result'].state
+        if not hasattr(state, 'cov') or not hasattr(state, 'means'):
+            raise ValueError('Direct Fock and click probabilities need a Gaussian state')
+        return state
+    
+    def metrics(self):
+        """
+        State of the caches this worker keeps between requests
+        """
+        return {
+            'fock_matrix_cache': MATRIX_CACHE.stats(),
+            'sessions': len(SESSIONS.sessions),
+            'tensors': TENSORS.stats(),
+            'shared_memory': segment_stats(),
+        }
+    
+    def run_structured(self, data):
+        """
+        Simulate a structured circuit and answer the requested outputs
+        """
+        try:
+            circuit = parse_circuit(data)
+            outputs = data.get('outputs', {})
+            
+            precision = outputs.get('precision', 'double')
+            if precision not in PRECISIONS:
+                raise ValueError(f'Unknown precision: {precision}; use one of {", ".join(PRECISIONS)}')
+            
+            # Kerr gates act unless the light is treated as classical
+            kerr = bool(non_gaussian_elements(circuit)) and circuit['simulation'] != 'distinguishable'
+            
+            if 'sweep' in data:
+                if kerr:
+                    raise ValueError('Sweeps are Gaussian-only and this circuit has Kerr gates; send one request per value')
+                return self.run_sweep(circuit, parse_sweep(data, circuit), outputs)
+            
+            results = {}
+            simulated, kept = self.light_cone(circuit, data, results)
+            # The session cache holds Gaussian channels; Kerr circuits are planned like any other request
+            use_session = 'session_id' in data and not kerr
+            if kerr and 'session_id' in data:
+                results['session'] = {
+                    'reused': False, 'skipped': 'Kerr gates need the Fock engine, which has no session cache',
+                }
+            if use_session:
+                # Sessions always recompose on the symplectic engine, under the same admission limits
+                results['plan'] = plan_fixed(
+                    simulated, outputs, 'symplectic', 'sessions recompose cached Gaussian channels',
+                )
+                engine_name = 'symplectic'
+            else:
+                # Cheapest engine that is correct for this circuit, unless the request names one
+                results['plan'] = plan_gaussian(simulated, outputs, data.get('engine'))
+                engine_name = results['plan']['engine']
+            if engine_name == 'fock':
+                # Kerr gates need the Fock basis; the readouts come from the joint tensor
+                results.update(self.run_fock(circuit, simulated, kept, outputs))
+                return {
+                    'success': True,
+                    'results': results
+                }
+            if not use_session and data.get('optimize', True):
+                # Fewer, larger elements for whichever engine runs the circuit
+                simulated, results['optimization'] = optimize_gaussian_circuit(simulated)
+            if use_session:
+                # Parameter edits: only the changed elements are recomposed
+                session, results['session'] = SESSIONS.get(str(data['session_id']), circuit)
+                hbar = HBAR
+                cov, means = apply_channel(session.transfer(), *vacuum_state(circuit['modes'], hbar))
+                ignored = session.ignored
+                results['session']['compositions'] = session.compositions
+            elif engine_name == 'gaussian':
+                cov, means, hbar, ignored = self.sf_gaussian_state(simulated)
+            else:
+                # Compose the Gaussian elements directly, without an sf.Program
+                hbar = HBAR
+                cov, means, ignored = gaussian_state(simulated, hbar)
+            results['engine'] = engine_name
+            dtype = PRECISIONS[precision]
+            # Coherent light only: products of Poissons instead of loop hafnians
+            probabilities = PoissonFockProbabilities if engine_name == 'closed-form' else GaussianFockProbabilities
+            if len(kept) < circuit['modes']:
+                cov, means = expand_state(cov, means, kept, circuit['modes'], hbar)
+            
+            if data.get('cross_check'):
+                # Compare with Strawberry Fields' own Gaussian backend on the original circuit
+                sf_cov, sf_means, _, _ = self.sf_gaussian_state(circuit)
+                results['cross_check'] = {
+                    'backend': 'gaussian',
+                    'max_cov_difference': float(np.max(np.abs(sf_cov - cov))),
+                    'max_means_difference': float(np.max(np.abs(sf_means - means))),
+                }
+            
+            if ignored:
+                results['ignored_elements'] = ignored
+            
+            if circuit['simulation'] == 'distinguishable':
+                # Classical light: keep the mean fields and turn squeezing into thermal
+                # noise, so every mode keeps its mean photon number without quantum correlations
+                cov, means = classical_state(cov, means, hbar)
+            
+            if 'cutoff' in outputs:
+                cutoff = int(outputs['cutoff'])
+            else:
+                coverage = float(outputs.get('coverage', 0.999))
+                cutoff, results['cutoff_report'] = choose_cutoff(cov, means, coverage, hbar)
+            
+            if 'tensor' in outputs:
+                results['tensor'] = self.gaussian_tensor(outputs['tensor'], cov, means, hbar, cutoff, kept, dtype)
+            
+            # Marginals come from the reduced covariance of each subset, never the joint tensor
+            marginals = {}
+            errors = []
+            for subset in requested_marginals(outputs, circuit['modes']):
+                engine = probabilities(*reduced_state(cov, means, subset), hbar=hbar, dtype=dtype)
+                marginals[subset] = engine.all_probs(cutoff)
+                if precision == 'single':
+                    # Spot-check the single-precision table against double-precision patterns
+                    exact = probabilities(*reduced_state(cov, means, subset), hbar=hbar)
+                    errors.append(rounding_error(marginals[subset], exact.prob))
+            if 'precision' in outputs:
+                results['precision'] = {'dtype': str(np.empty(0, dtype=dtype).real.dtype), 'applied': True}
+                if errors:
+                    results['precision']['rounding_error'] = max(errors)
+            results['marginals'] = {
+                marginal_key(subset): format_distribution(probs) for subset, probs in marginals.items()
+            }
+            detections = photon_detections(marginals)
+            if detections:
+                results['photon_detections'] = detections
+            
+            engine = probabilities(cov, means, hbar=hbar)
+            if 'fock_patterns' in outputs:
+                results['fock_probabilities'] = engine.probs(outputs['fock_patterns'])
+            
+            # Threshold detectors: click probabilities straight from the covariance, no Fock cutoff
+            clicks = GaussianClickProbabilities(cov, means, hbar=hbar)
+            if 'click_patterns' in outputs:
+                results['click_probabilities'] = clicks.probs(outputs['click_patterns'])
+            if outputs.get('clicks'):
+                results['click_distribution'] = format_distribution(clicks.all_probs())
+            
+            if 'samples' in outputs:
+                # Chain-rule samples drawn from the covariance, below the same cutoff as the readouts
+                results['counts'], results['sampling'] = sample_counts(
+                    cov, means, int(outputs['samples']), hbar, outputs.get('detector', 'pnr'), cutoff, outputs.get('seed'),
+                )
+            
+            if 'quadratures' in outputs:
+                results['quadratures'] = self.quadratures(outputs['quadratures'], cov, means, hbar)
+            
+            if 'top_k' in outputs:
+                # Per-mode marginals bound every pattern and prune the search
+                mode_marginals = [
+                    marginals[(mode,)] if (mode,) in marginals else
+                    probabilities(*reduced_state(cov, means, [mode]), hbar=hbar).all_probs(cutoff)
+                    for mode in range(circuit['modes'])
+                ]
+                top = top_k_outcomes(
+                    engine.prob, mode_marginals, itertools.count(), int(outputs['top_k']),
+                    max_evaluations=int(outputs.get('max_evaluations', 10000)),
+                    time_limit=outputs.get('time_limit'),
+                )
+                results['top_k'] = top
+                results['probabilities'] = {item['pattern']: item['probability'] for item in top['outcomes']}
+            
+            return {
+                'success': True,
+                'results': results
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'traceback': traceback.format_exc()
+            }
+    
+    def wigner(self, data):
+        """
+        Wigner function of one mode of the final state on a grid
+        """
+        try:
+            circuit = parse_circuit(data)
+            mode = int(data.get('mode', 0))
+            if not 0 <= mode < circuit['modes']:
+                raise ValueError(f'Mode {mode} is not in the circuit')
+            xvec, pvec = wigner_grid(data.get('grid', {}))
+            results = {
+                'mode': mode,
+                'x': [float(xvec[0]), float(xvec[-1]), len(xvec)],
+                'p': [float(pvec[0]), float(pvec[-1]), len(pvec)],
+                'hbar': HBAR,
+            }
+            if non_gaussian_elements(circuit):
+                # Kerr gates leave no closed form; Strawberry Fields' Fock backend evaluates the reduced density matrix
+                simulated, kept = self.light_cone(circuit, data, results)
+                if mode in kept:
+                    values = self.sf_fock_wigner(simulated, kept.index(mode), xvec, pvec, data, results)
+                else:
+                    values = gaussian_wigner(*vacuum_state(1, HBAR), 0, xvec, pvec)
+                results['backend'] = 'fock'
+            else:
+                cov, means, ignored = gaussian_state(circuit, HBAR)
+                if ignored:
+                    results['ignored_elements'] = ignored
+                values = gaussian_wigner(cov, means, mode, xvec, pvec)
+                results['backend'] = 'gaussian'
+            results['values'] = values.astype(np.float32)
+            return {
+                'success': True,
+                'results': results
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'traceback': traceback.format_exc()
+            }
+    
+    def sf_fock_wigner(self, circuit, mode, xvec, pvec, data, results):
+        """
+        Wigner function of one mode from Strawberry Fields' Fock backend, for circuits with Kerr gates
+        """
+        try:
+            import strawberryfields as sf
+        except ImportError as e:
+            raise ImportError(f'Strawberry Fields not available: {str(e)}')
+        
+        if 'cutoff' in data:
+            cutoff = int(data['cutoff'])
+        else:
+            # Kerr gates only add phases, so the Gaussian part sets the photon numbers to cover
+            cov, means, _ = gaussian_state(circuit, HBAR)
+            cutoff, results['cutoff_report'] = choose_cutoff(cov, means, float(data.get('coverage', 0.999)), HBAR)
+        prog, ignored = self.build_program(sf, circuit)
+        if ignored:
+            results['ignored_elements'] = ignored
+        state = sf.Engine("fock", backend_options={"cutoff_dim": cutoff}).run(prog).state
+        return state.wigner(mode, xvec, pvec)
+    
+    def light_cone(self, circuit, data, results):
+        """
+        Circuit restricted to the modes light can reach, and those modes
+        """
+        if 'session_id' in data or not data.get('prune', True):
+            return circuit, list(range(circuit['modes']))
+        # Modes no source can reach stay in vacuum and are filled in afterwards
+        lit = lit_modes(circuit)
+        if not 0 < len(lit) < circuit['modes']:
+            return circuit, list(range(circuit['modes']))
+        results['light_cone'] = light_cone_report(lit, circuit['modes'])
+        return prune_circuit(circuit, lit), lit
+    
+    def estimate(self, data):
+        """
+        Predicted runtime, peak memory and output size per engine, and whether the request would be admitted
+        """
+        try:
+            circuit = parse_circuit(data)
+            outputs = data.get('outputs', {})
+            results = {'limits': {'seconds': MAX_SECONDS, 'memory_bytes': MAX_MEMORY}}
+            simulated, _ = self.light_cone(circuit, data, results)
+            try:
+                results.update(plan_gaussian(simulated, outputs, data.get('engine')), admitted=True)
+            except ValueError as e:
+                results.update(estimates=gaussian_estimates(simulated, outputs), admitted=False, reason=str(e))
+            return {
+                'success': True,
+                'results': results
+            }
+            
+        except Exception as e:
+            return {
+                'success': False,
+                'error': str(e),
+                'traceback': traceback.format_exc()
+            }
+    
+    def run_sweep(self, circuit, sweep, outputs):
+        """
+        Evaluate a structured circuit for every value of one parameter in a single batched pass
+        """
+        index, parameter, values = sweep
+        results = {'sweep': {'element': index, 'parameter': parameter, 'values': values}}
+        # Cost the sweep at its largest value, which sets the photon number, once per point
+        element = circuit['elements'][index]
+        largest = dict(element, parameters=dict(element['parameters'], **{parameter: max(values, key=abs)}))
+        results['plan'] = plan_fixed(
+            dict(circuit, elements=circuit['elements'][:index] + [largest] + circuit['elements'][index + 1:]),
+            outputs, 'symplectic', 'sweeps evaluate every point in one batched symplectic pass', len(values),
+        )
+        cov, means, ignored = swept_gaussian_state(circuit, index, parameter, values, HBAR)
+        
+        if ignored:
+            results['ignored_elements'] = ignored
+        if circuit['simulation'] == 'distinguishable':
+            cov, means = classical_state(cov, means, HBAR)
+        
+        mean, var = mode_photon_stats(cov, means, HBAR)
+        results['mean_photons'] = mean.tolist()
+        results['photon_variance'] = var.tolist()
+        
+        if 'cutoff' in outputs:
+            cutoff = int(outputs['cutoff'])
+        else:
+            coverage = float(outputs.get('coverage', 0.999))
+            cutoff, results['cutoff_report'] = choose_cutoff(cov, means, coverage, HBAR)
+        
+        # One batched loop-hafnian table per subset, covering every sweep point
+        precision = outputs.get('precision', 'double')
+        marginals = {
+            subset: all_probs_batch(*reduced_state(cov, means, subset), cutoff, HBAR, PRECISIONS[precision])
+            for subset in requested_marginals(outputs, circuit['modes'])
+        }
+        if 'precision' in outputs:
+            results['precision'] = {'dtype': str(np.empty(0, dtype=PRECISIONS[precision]).real.dtype), 'applied': True}
+            if precision == 'single' and marginals:
+                # Spot-check the most probable entries of every point against double precision
+                results['precision']['rounding_error'] = max(
+                    rounding_error(batch, lambda index: GaussianFockProbabilities(
+                        *reduced_state(cov[index[0]], means[index[0]], subset), hbar=HBAR,
+                    ).prob(index[1:]))
+                    for subset, batch in marginals.items()
+                )
+        results['marginals'] = {
+            marginal_key(subset): [format_distribution(probs) for probs in batch]
+            for subset, batch in marginals.items()
+        }
+        results['photon_detections'] = {
+            f'Mode {subset[0]}': np.maximum(1.0 - batch[:, 0], 0.0).tolist()
+            for subset, batch in marginals.items()
+            if len(subset) == 1
+        }
+        return {
+            'success': True,
+            'results': results
+        }
+    
+    def run_fock(self, circuit, simulated, kept, outputs):
+        """
+        Simulate the kept modes in the Fock basis and read the outputs off the probability tensor
+        """
+        if 'quadratures' in outputs:
+            raise ValueError('Quadrature samples need a Gaussian state, and Kerr gates make it non-Gaussian')
+        results = {'engine': 'fock'}
+        if 'cutoff' in outputs:
+            cutoff = int(outputs['cutoff'])
+        else:
+            # Kerr gates only add phases, so the Gaussian part sets the photon numbers to cover
+            cov, means, _ = gaussian_state(simulated, HBAR)
+            coverage = float(outputs.get('coverage', 0.999))
+            cutoff, results['cutoff_report'] = choose_cutoff(cov, means, coverage, HBAR)
+        
+        precision = outputs.get('precision', 'double')
+        
+        tensor_kind = outputs.get('tensor')
+        if tensor_kind is not None and tensor_kind not in TENSOR_KINDS:
+            raise ValueError(f'Unknown tensor: {tensor_kind}; use one of {", ".join(TENSOR_KINDS)}')
+        
+        # Gaussian prefix converted once, then Kerr gates as phases on the state vector
+        # Phases left by trailing diagonal gates only matter to the amplitudes
+        simulation = fock_ket(simulated, cutoff, HBAR, PRECISIONS[precision], tensor_kind == 'amplitudes')
+        if simulation is not None:
+            ket, ignored, drift = simulation
+            sectors = pattern_sectors(ket.ndim, cutoff)
+            if tensor_kind == 'probabilities':
+                # The readouts below read the file rather than a second copy in memory
+                probs, results['tensor'] = self.write_tensor(
+                    tensor_kind, ket.shape, ket.real.dtype,
+                    ((p, np.abs(ket[tuple(p.T)]) ** 2) for p in sectors), kept,
+                )
+            else:
+                probs = np.abs(ket) ** 2
+            if tensor_kind == 'amplitudes':
+                _, results['tensor'] = self.write_tensor(
+                    tensor_kind, ket.shape, ket.dtype, ((p, ket[tuple(p.T)]) for p in sectors), kept,
+                )
+            results['fock_backend'] = 'numpy'
+            results['precision'] = {
+                'dtype': str(ket.dtype), 'applied': True, 'normalization_drift': drift, 'state_bytes': int(ket.nbytes),
+            }
+        else:
+            if tensor_kind == 'amplitudes':
+                raise ValueError('Amplitudes need a pure state, and this circuit runs on the mixed-state fallback')
+            # Strawberry Fields' Fock backend always runs in complex128
+            probs, ignored = self.sf_fock_probs(simulated, cutoff)
+            if tensor_kind == 'probabilities':
+                _, results['tensor'] = self.write_tensor(
+                    tensor_kind, probs.shape, probs.dtype,
+                    ((p, probs[tuple(p.T)]) for p in pattern_sectors(probs.ndim, cutoff)), kept,
+                )
+            results['fock_backend'] = 'strawberryfields'
+            results['precision'] = {'dtype': 'complex128', 'applied': precision == 'double'}
+        results['captured_mass'] = float(probs.sum(dtype=np.float64))
+        if ignored:
+            results['ignored_elements'] = ignored
+        
+        marginals = {
+            subset: tensor_marginal(probs, kept, subset)
+            for subset in requested_marginals(outputs, circuit['modes'])
+        }
+        results['marginals'] = {
+            marginal_key(subset): format_distribution(marginal) for subset, marginal in marginals.items()
+        }
+        detections = photon_detections(marginals)
+        if detections:
+            results['photon_detections'] = detections
+        
+        if 'fock_patterns' in outputs:
+            results['fock_probabilities'] = {
+                pattern_key(pattern): tensor_probability(probs, kept, pattern) for pattern in outputs['fock_patterns']
+            }
+        
+        if 'click_patterns' in outputs or outputs.get('clicks'):
+            # Kerr gates leave no Gaussian covariance; fold every axis of the tensor into no click / click
+            clicks = tensor_clicks(probs)
+            if 'click_patterns' in outputs:
+                patterns = click_patterns(outputs['click_patterns'], circuit['modes'])
+                results['click_probabilities'] = {
+                    pattern_key(pattern): tensor_probability(clicks, kept, pattern) for pattern in patterns.astype(int)
+                }
+            if outputs.get('clicks'):
+                results['click_distribution'] = format_distribution(tensor_marginal(clicks, kept, range(circuit['modes'])))
+        
+        if 'samples' in outputs:
+            detector = outputs.get('detector', 'pnr')
+            if detector not in DETECTORS:
+                raise ValueError(f'Unknown detector: {detector}; use one of {", ".join(DETECTORS)}')
+            # The joint tensor is already in memory, so shots are one multinomial draw over it
+            results['counts'] = tensor_counts(
+                tensor_clicks(probs) if detector == 'threshold' else probs, kept, circuit['modes'],
+                int(outputs['samples']), outputs.get('seed'),
+            )
+        
+        if 'top_k' in outputs:
+            top = tensor_top_k(probs, kept, circuit['modes'], int(outputs['top_k']))
+            results['top_k'] = top
+            results['probabilities'] = {item['pattern']: item['probability'] for item in top['outcomes']}
+        return results
+    
+    def quadratures(self, spec, cov, means, hbar):
+        """
+        Homodyne or heterodyne samples of the final state as a base64 float32 array
+        """
+        measurement = spec.get('measurement', 'homodyne')
+        modes = spec.get('modes', list(range(len(means) // 2)))
+        phi = spec.get('phi', 0.0)
+        samples = quadrature_samples(cov, means, int(spec.get('shots', 1000)), modes, measurement, phi, hbar, spec.get('seed'))
+        report = {'measurement': measurement, 'modes': [int(mode) for mode in modes], 'hbar': hbar}
+        if measurement == 'homodyne':
+            report['phi'] = phi
+        report.update(encode_array(samples))
+        return report
+    
+    def gaussian_tensor(self, kind, cov, means, hbar, cutoff, kept, dtype=np.complex128):
+        """
+        Write the probability or amplitude tensor of the kept modes of a Gaussian state, one sector at a time.
+
+        `dtype` is the amplitude type; probabilities are stored in its real counterpart.
+        """
+        real = np.empty(0, dtype=dtype).real.dtype
+        if kind not in TENSOR_KINDS:
+            raise ValueError(f'Unknown tensor: {kind}; use one of {", ".join(TENSOR_KINDS)}')
+        cov, means = reduced_state(cov, means, kept)
+        modes = len(kept)
+        A, gamma, prefactor = loop_hafnian_parameters(cov, means, hbar)
+        if np.allclose(A[:modes, modes:], 0, atol=1e-12):
+            # Pure state: amplitudes from the lower block of A, as in fock.gaussian_ket
+            norms = 1 / np.sqrt(np.cumprod([1.0] + list(range(1, cutoff))))
+            amplitudes = (
+                (p, values * np.sqrt(prefactor) * np.prod(norms[p], axis=1))
+                for p, values in loop_hafnian_sectors(A[modes:, modes:], gamma[modes:], cutoff)
+            )
+            if kind == 'amplitudes':
+                return self.write_tensor(kind, (cutoff,) * modes, dtype, amplitudes, kept)[1]
+            chunks = ((p, np.abs(values) ** 2) for p, values in amplitudes)
+        elif kind == 'amplitudes':
+            raise ValueError('Amplitudes need a pure state')
+        else:
+            # Mixed state: one loop hafnian per pattern, spread over the worker processes,
+            # each writing its share of the file directly
+            tensor, report = self.write_tensor(kind, (cutoff,) * modes, real, [], kept)
+            GaussianFockProbabilities(cov, means, hbar=hbar, dtype=dtype).dense_probs(cutoff, out=tensor)
+            return report
+        return self.write_tensor(kind, (cutoff,) * modes, real, chunks, kept)[1]
+    
+    def write_tensor(self, kind, shape, dtype, chunks, kept):
+        """
+        Write a dense tensor of the kept modes to the scratch directory, returning it and how to download it
+        """
+        handle, tensor = TENSORS.create(shape, dtype)
+        write_sectors(tensor, chunks)
+        return tensor, {
+            'kind': kind,
+            'handle': handle,
+            'url': f'/tensors/{handle}.npy',
+            'shape': list(tensor.shape),
+            'dtype': str(tensor.dtype),
+            'bytes': int(tensor.nbytes),
+            'modes': list(kept),
+            'expires_in': TENSORS.ttl,
+        }
+    
+    def sf_fock_probs(self, circuit, cutoff):
+        """
+        Probability tensor and ignored elements from Strawberry Fields' Fock backend, for mixed states
+        """
+        try:
+            import strawberryfields as sf
+        except ImportError as e:
+            raise ImportError(f'Strawberry Fields not available: {str(e)}')
+        
+        prog, ignored = self.build_program(sf, circuit)
+        state = sf.Engine("fock", backend_options={"cutoff_dim": cutoff}).run(prog).state
+        return np.real(state.all_fock_probs()).reshape((cutoff,) * circuit['modes']), ignored
+    
+    def sf_gaussian_state(self, circuit):
+        """
+        Covariance matrix, means, hbar and ignored elements from Strawberry Fields' Gaussian backend
+        """
+        try:
+            import strawberryfields as sf
+        except ImportError as e:
+            raise ImportError(f'Strawberry Fields not available: {str(e)}')
+        
+        # Kerr gates have no Gaussian form, so they are left out as on the symplectic engine
+        prog, ignored = self.build_program(sf, circuit, gaussian_only=True)
+        state = sf.Engine("gaussian").run(prog).state
+        return state.cov(), state.means(), state.hbar, ignored
+    
+    def build_program(self, sf, circuit, gaussian_only=False):
+        """
+        Translate structured elements into the operations the app generates for Strawberry Fields.
+
+        With `gaussian_only`, Kerr gates are listed as ignored instead of emitted.
+        """
+        from strawberryfields import ops
+        
+        modes = circuit['modes']
+        prog = sf.Program(modes)
+        ignored = []
+        with prog.context as q:
+            for element in circuit['elements']:
+                kind = element['type']
+                params = element['parameters']
+                targets = element_modes(element, modes)
+                if targets is None:
+                    ignored.append(kind)
+                    continue
+                
+                if kind == 'Laser':
+                    ops.Coherent(1.0) | q[targets[0]]
+                elif kind == 'Phase Shifter':
+                    ops.Rgate(params['phi']) | q[targets[0]]
+                elif kind == 'Squeezing Gate':
+                    ops.Sgate(params['r'], params['theta']) | q[targets[0]]
+                elif kind == 'Displacement Gate':
+                    ops.Dgate(params['r'], params['phi']) | q[targets[0]]
+                elif kind == 'Kerr Gate' and gaussian_only:
+                    ignored.append(kind)
+                elif kind == 'Kerr Gate':
+                    ops.Kgate(params['kappa']) | q[targets[0]]
+                elif kind == 'Beam Splitter':
+                    ops.BSgate(params['theta'], params['phi']) | (q[targets[0]], q[targets[1]])
+                elif kind == FUSED:
+                    # Merged gates from optimize.py: one symplectic, then the displacement it carries
+                    X, _, d = element['block']
+                    ops.GaussianTransform(X) | tuple(q[mode] for mode in targets)
+                    for pos, mode in enumerate(targets):
+                        alpha = (d[pos] + 1j * d[pos + len(targets)]) / np.sqrt(2 * HBAR)
+                        if abs(alpha) > 0:
+                            ops.Dgate(abs(alpha), np.angle(alpha)) | q[mode]
+                elif kind == 'Photonic Measurement':
+                    # Every mode is read out from the final state
+                    continue
+                else:
+                    ignored.append(kind)
+        return prog, ignored
+
 if __name__ == '__main__':
     port = 8080
     if len(sys.argv) > 1:
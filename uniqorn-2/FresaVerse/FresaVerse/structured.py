@@ -0,0 +1,179 @@
+"""
+Structured circuit requests shared by both servers.
+
+Instead of generated code, the app can POST the circuit it draws to
+``/structured``:
+
+    {
+        "modes": 2,
+        "elements": [
+            {"type": "Laser", "mode": 0},
+            {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.5, "phi": 0.785}}
+        ],
+        "input_state": [1, 0],
+        "simulation": "quantum",
+        "outputs": {"marginals": [[0], [1], [0, 1]], "cutoff": 4}
+    }
+
+Element types are the OpticalElementType raw values and missing parameters
+take the same defaults as OpticalElement.defaultParameters. Elements are
+applied in list order (the app keeps them sorted by position).
+``simulation`` is "quantum" (default) or "distinguishable", the classical
+baseline without interference.
+"""
+
+import base64
+import math
+
+import numpy as np
+
+from gaussian_probs import pattern_key
+
+# Default parameters per element type, mirroring OpticalElement.swift
+ELEMENT_DEFAULTS = {
+    'Laser': {},
+    'Beam Splitter': {'theta': 0.5, 'phi': math.pi / 4},
+    'Phase Shifter': {'phi': 0.5},
+    'Squeezing Gate': {'r': 0.5, 'theta': 0.0},
+    'Displacement Gate': {'r': 0.5, 'phi': 0.0},
+    'Kerr Gate': {'kappa': 0.1},
+    'Photonic Measurement': {},
+    'Half Wave Plate': {'theta': 0.0},
+    'Quarter Wave Plate': {'theta': 0.0},
+    'Permutation': {},
+    'Polarizing Beam Splitter': {},
+    'Time Delay': {'delay': 1.0},
+    'Unitary': {},
+}
+
+# Values of the "simulation" field
+SIMULATION_MODES = ('quantum', 'distinguishable')
+
+# Elements that connect a mode to the next one
+TWO_MODE_ELEMENTS = ('Beam Splitter', 'Polarizing Beam Splitter')
+
+# Merged elements produced by optimize.py; they carry their modes and matrix
+FUSED = 'Fused Block'
+
+
+def parse_circuit(data):
+    """
+    Validate a structured circuit and fill in default parameters
+    """
+    modes = int(data.get('modes', 0))
+    if modes < 1:
+        raise ValueError('Circuit needs at least one mode')
+
+    elements = []
+    for index, raw in enumerate(data.get('elements', [])):
+        kind = raw.get('type')
+        if kind not in ELEMENT_DEFAULTS:
+            raise ValueError(f'Unknown element type at position {index}: {kind}')
+        mode = int(raw.get('mode', 0))
+        if not 0 <= mode < modes:
+            raise ValueError(f'Element {kind} at position {index} is on mode {mode}, circuit has {modes} modes')
+        parameters = dict(ELEMENT_DEFAULTS[kind])
+        parameters.update({key: float(value) for key, value in raw.get('parameters', {}).items()})
+        elements.append({'type': kind, 'mode': mode, 'parameters': parameters})
+
+    simulation = data.get('simulation', 'quantum')
+    if simulation not in SIMULATION_MODES:
+        raise ValueError(f'Unknown simulation mode: {simulation}')
+
+    circuit = {'modes': modes, 'elements': elements, 'simulation': simulation}
+    if 'input_state' in data:
+        input_state = [int(n) for n in data['input_state']]
+        if len(input_state) != modes or min(input_state) < 0:
+            raise ValueError('input_state needs one non-negative photon number per mode')
+        circuit['input_state'] = input_state
+    return circuit
+
+
+def parse_sweep(data, circuit):
+    """
+    Validate a parameter sweep {"element": index, "parameter": name, "values": [...]}
+    """
+    sweep = data['sweep']
+    index = int(sweep.get('element', -1))
+    if not 0 <= index < len(circuit['elements']):
+        raise ValueError(f'Sweep element {index} is not in the circuit')
+    element = circuit['elements'][index]
+    parameter = sweep.get('parameter')
+    if parameter not in element['parameters']:
+        raise ValueError(f'{element["type"]} has no parameter {parameter}')
+    values = [float(value) for value in sweep.get('values', [])]
+    if not values:
+        raise ValueError('Sweep needs at least one value')
+    return index, parameter, values
+
+
+def element_modes(element, modes):
+    """
+    Modes an element acts on, or None for a two-mode element on the last mode
+    """
+    if element['type'] == FUSED:
+        return tuple(element['targets'])
+    mode = element['mode']
+    if element['type'] in TWO_MODE_ELEMENTS:
+        if mode >= modes - 1:
+            return None
+        return (mode, mode + 1)
+    return (mode,)
+
+
+def requested_marginals(outputs, modes):
+    """
+    Mode subsets whose marginal distributions were asked for (every single mode by default)
+    """
+    subsets = outputs.get('marginals', 'per_mode')
+    if subsets == 'per_mode':
+        return [(mode,) for mode in range(modes)]
+    requested = []
+    for subset in subsets:
+        subset = tuple(int(mode) for mode in subset)
+        if not subset or len(set(subset)) != len(subset) or min(subset) < 0 or max(subset) >= modes:
+            raise ValueError(f'Invalid marginal mode subset: {list(subset)}')
+        requested.append(subset)
+    return requested
+
+
+def marginal_key(subset):
+    """
+    Key of a marginal distribution in the response, e.g. '0,2'
+    """
+    return ','.join(str(mode) for mode in subset)
+
+
+def format_distribution(probs, threshold=1e-12):
+    """
+    Turn a dense probability array into a {pattern: probability} dict
+    """
+    return {
+        pattern_key(pattern): float(probs[pattern])
+        for pattern in np.ndindex(*probs.shape)
+        if probs[pattern] > threshold
+    }
+
+
+def photon_detections(marginals):
+    """
+    Probability of detecting at least one photon in each mode, for SimulationResultsView
+    """
+    return {
+        f'Mode {subset[0]}': float(max(1.0 - probs[0], 0.0))
+        for subset, probs in marginals.items()
+        if len(subset) == 1
+    }
+
+
+def encode_array(array, dtype=np.float32):
+    """
+    Compact binary form of a numeric array for a JSON response: little-endian bytes in base64
+    """
+    array = np.ascontiguousarray(array, dtype=np.dtype(dtype).newbyteorder('<'))
+    return {
+        'dtype': array.dtype.name,
+        'shape': list(array.shape),
+        'encoding': 'base64',
+        'data': base64.b64encode(array.tobytes()).decode('ascii'),
+    }
@@ -0,0 +1,227 @@
+"""
+Gaussian channels of structured elements, in Strawberry Fields' conventions.
+
+Every Gaussian element maps the covariance matrix and means as
+
+    cov -> X cov X^T + Y,    means -> X means + d
+
+in xxpp ordering with hbar = 2 by default. Gates have a symplectic X, Y = 0
+and a displacement d; the Laser prepares a fresh coherent state, so it
+clears its mode in X and puts vacuum noise back through Y. Channels compose
+into one channel, so a whole circuit (or any part of it) is a single
+(X, Y, d) triple.
+"""
+
+import numpy as np
+
+from structured import FUSED, element_modes
+
+# Strawberry Fields' default convention
+HBAR = 2
+
+# Amplitude of the coherent state the generated code prepares for a Laser
+LASER_AMPLITUDE = 1.0
+
+
+def rotation(phi):
+    """
+    Symplectic of Rgate(phi) on one mode (x, p)
+    """
+    c, s = np.cos(phi), np.sin(phi)
+    return np.array([[c, -s], [s, c]])
+
+
+def squeezing(r, theta):
+    """
+    Symplectic of Sgate(r, theta) on one mode (x, p)
+    """
+    ch, sh = np.cosh(r), np.sinh(r)
+    cp, sp = np.cos(theta), np.sin(theta)
+    return np.array([[ch - cp * sh, -sp * sh], [-sp * sh, ch + cp * sh]])
+
+
+def beamsplitter(theta, phi):
+    """
+    Symplectic of BSgate(theta, phi) on two modes (x1, x2, p1, p2)
+    """
+    c, s = np.cos(theta), np.sin(theta)
+    U = np.array([[c, -np.exp(-1j * phi) * s], [np.exp(1j * phi) * s, c]])
+    return passive_symplectic(U)
+
+
+def passive_symplectic(U):
+    """
+    Symplectic of a passive linear-optics unitary acting on the mode operators
+    """
+    return np.block([[U.real, -U.imag], [U.imag, U.real]])
+
+
+def displacement(alpha, hbar=HBAR):
+    """
+    Means (x, p) of a displacement by the complex amplitude alpha
+    """
+    return np.sqrt(2 * hbar) * np.array([alpha.real, alpha.imag])
+
+
+def local_indices(targets, modes):
+    """
+    Positions of the x and p quadratures of `targets` in xxpp ordering
+    """
+    targets = list(targets)
+    return targets + [mode + modes for mode in targets]
+
+
+def identity_channel(modes):
+    """
+    Channel that leaves every state unchanged
+    """
+    return np.identity(2 * modes), np.zeros((2 * modes, 2 * modes)), np.zeros(2 * modes)
+
+
+def local_channel(element, hbar=HBAR):
+    """
+    Channel (X, Y, d) of one element restricted to the quadratures of its modes, or None if it is not Gaussian
+    """
+    kind = element['type']
+    if kind == FUSED:
+        return element['block']
+    params = element['parameters']
+    size = 4 if kind == 'Beam Splitter' else 2
+    X, Y, d = np.identity(size), np.zeros((size, size)), np.zeros(size)
+    if kind == 'Laser':
+        # Coherent(1.0) replaces the mode by a fresh coherent state
+        X[:] = 0.0
+        Y[:] = hbar / 2 * np.identity(2)
+        d[:] = displacement(complex(LASER_AMPLITUDE), hbar)
+    elif kind == 'Phase Shifter':
+        X = rotation(params['phi'])
+    elif kind == 'Squeezing Gate':
+        X = squeezing(params['r'], params['theta'])
+    elif kind == 'Displacement Gate':
+        d = displacement(params['r'] * np.exp(1j * params['phi']), hbar)
+    elif kind == 'Beam Splitter':
+        X = beamsplitter(params['theta'], params['phi'])
+    elif kind == 'Photonic Measurement':
+        # Every mode is read out from the final state
+        pass
+    else:
+        return None
+    return X, Y, d
+
+
+def element_channel(element, modes, hbar=HBAR):
+    """
+    Channel (X, Y, d) of one element on the full circuit, or None if it is not Gaussian
+    """
+    targets = element_modes(element, modes)
+    local = local_channel(element, hbar)
+    if targets is None or local is None:
+        return None
+
+    X, Y, d = identity_channel(modes)
+    idx = local_indices(targets, modes)
+    X[np.ix_(idx, idx)] = local[0]
+    Y[np.ix_(idx, idx)] = local[1]
+    d[idx] = local[2]
+    return X, Y, d
+
+
+def compose_channels(second, first):
+    """
+    Channel applying `first`, then `second`
+    """
+    X2, Y2, d2 = second
+    X1, Y1, d1 = first
+    return X2 @ X1, X2 @ Y1 @ X2.T + Y2, X2 @ d1 + d2
+
+
+def vacuum_state(modes, hbar=HBAR):
+    """
+    Covariance matrix and means of the multimode vacuum
+    """
+    return hbar / 2 * np.identity(2 * modes), np.zeros(2 * modes)
+
+
+def apply_channel(channel, cov, means):
+    """
+    Covariance matrix and means after a channel
+    """
+    X, Y, d = channel
+    return X @ cov @ X.T + Y, X @ means + d
+
+
+def apply_local(cov, means, channel, idx):
+    """
+    Apply a local channel to the quadratures `idx` in place, for one state or a leading batch of states
+    """
+    X, Y, d = channel
+    cov[..., idx, :] = X @ cov[..., idx, :]
+    cov[..., :, idx] = cov[..., :, idx] @ np.swapaxes(X, -1, -2)
+    cov[..., idx[:, None], idx[None, :]] += Y
+    means[..., idx] = np.einsum('...ij,...j->...i', X, means[..., idx]) + d
+
+
+def gaussian_state(circuit, hbar=HBAR):
+    """
+    Covariance matrix and means at the end of the circuit, plus the elements left out.
+
+    Each element only touches the rows and columns of its own modes, so a
+    circuit costs O(modes) per element instead of full matrix products.
+    """
+    modes = circuit['modes']
+    cov, means = vacuum_state(modes, hbar)
+    ignored = []
+    for element in circuit['elements']:
+        targets = element_modes(element, modes)
+        local = local_channel(element, hbar)
+        if targets is None or local is None:
+            ignored.append(element['type'])
+            continue
+        apply_local(cov, means, local, np.array(local_indices(targets, modes)))
+    return cov, means, ignored
+
+
+def swept_gaussian_state(circuit, index, parameter, values, hbar=HBAR):
+    """
+    Covariance matrices and means for every value of one element parameter, stacked along a leading axis.
+
+    The elements before the swept one are shared and applied once; from the
+    swept element on, each step is a single broadcast matmul over the batch.
+    """
+    modes = circuit['modes']
+    elements = circuit['elements']
+    cov, means, ignored = gaussian_state({'modes': modes, 'elements': elements[:index]}, hbar)
+
+    swept = elements[index]
+    targets = element_modes(swept, modes)
+    if targets is None or local_channel(swept, hbar) is None:
+        raise ValueError(f'Only Gaussian elements can be swept, not {swept["type"]}')
+    channels = [
+        local_channel(dict(swept, parameters=dict(swept['parameters'], **{parameter: value})), hbar)
+        for value in values
+    ]
+    batch = len(values)
+    cov = np.repeat(cov[None], batch, axis=0)
+    means = np.repeat(means[None], batch, axis=0)
+    stacked = tuple(np.stack([channel[part] for channel in channels]) for part in range(3))
+    apply_local(cov, means, stacked, np.array(local_indices(targets, modes)))
+
+    for element in elements[index + 1:]:
+        targets = element_modes(element, modes)
+        local = local_channel(element, hbar)
+        if targets is None or local is None:
+            ignored.append(element['type'])
+            continue
+        apply_local(cov, means, local, np.array(local_indices(targets, modes)))
+    return cov, means, ignored
+
+
+def ignored_elements(circuit):
+    """
+    Element types that have no Gaussian channel and are left out of the simulation
+    """
+    modes = circuit['modes']
+    return [
+        element['type'] for element in circuit['elements']
+        if element_modes(element, modes) is None or local_channel(element) is None
+    ]
@@ -0,0 +1,98 @@
+"""
+Dense result tensors written to disk instead of the JSON response.
+
+With outputs.tensor, the probability (or amplitude) tensor of the simulated
+modes goes to an NPY file in a scratch directory. The file is memory-mapped
+and filled one photon-number sector at a time, so only one sector of
+patterns and values is ever held in the heap besides the state itself. The
+response carries a handle, and GET /tensors/<handle>.npy streams the file
+back. Files are deleted TENSOR_TTL seconds after they were written.
+"""
+
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+
+import numpy as np
+
+SCRATCH_DIR = os.environ.get('UNIQORN_SCRATCH_DIR', os.path.join(tempfile.gettempdir(), 'uniqorn-tensors'))
+TENSOR_TTL = float(os.environ.get('UNIQORN_TENSOR_TTL', 3600))
+
+# What outputs.tensor can ask for
+TENSOR_KINDS = ('probabilities', 'amplitudes')
+
+# Handles are uuid4 hex strings; anything else is never turned into a path
+HANDLE = re.compile(r'[0-9a-f]{32}$')
+
+
+def write_sectors(target, chunks):
+    """
+    Fill a (cutoff,) * modes array from (patterns, values) chunks, one value per pattern row
+    """
+    for patterns, values in chunks:
+        target[tuple(patterns.T)] = values
+    target.flush()
+    return target
+
+
+class TensorStore:
+    """
+    Memory-mapped NPY files by handle, removed after a time to live
+    """
+
+    def __init__(self, directory=SCRATCH_DIR, ttl=TENSOR_TTL):
+        self.directory = directory
+        self.ttl = ttl
+
+    def create(self, shape, dtype):
+        """
+        New handle and a writable memory map of an NPY file of that shape
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.expire()
+        size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        free = shutil.disk_usage(self.directory).free
+        if size > free:
+            raise ValueError(f'The tensor needs {size} bytes but only {free} are free in {self.directory}')
+        handle = uuid.uuid4().hex
+        tensor = np.lib.format.open_memmap(self.path(handle), mode='w+', dtype=dtype, shape=tuple(shape))
+        return handle, tensor
+
+    def path(self, handle):
+        """
+        File name of a handle, or None if the handle is malformed
+        """
+        if not HANDLE.match(handle):
+            return None
+        return os.path.join(self.directory, handle + '.npy')
+
+    def open_file(self, handle):
+        """
+        The file of an existing handle opened for reading, or None
+        """
+        path = self.path(handle)
+        if path is None or not os.path.exists(path):
+            return None
+        return open(path, 'rb')
+
+    def expire(self):
+        """
+        Delete the files older than the time to live
+        """
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.endswith('.npy') and HANDLE.match(name[:-4]) and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+
+    def stats(self):
+        """
+        Files and bytes currently on disk
+        """
+        if not os.path.isdir(self.directory):
+            return {'files': 0, 'bytes': 0}
+        paths = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.npy')]
+        return {'files': len(paths), 'bytes': sum(os.path.getsize(path) for path in paths)}
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Offline checks of the resource guard on raw code submissions.
+
+Like test_kernels.py these need no running server; run them with
+python test_code_guard.py, or with pytest.
+"""
+
+import pytest
+
+from code_guard import MAX_SAMPLES, guard_code, max_cutoff
+
+# Stand-ins for the simulator calls the guard looks for, so guarded code can be executed
+PRELUDE = """
+def Program(modes):
+    return modes
+
+class Engine:
+    def run(self, prog, shots=1, cutoff=None):
+        return {"shots": shots, "cutoff": cutoff}
+
+eng = Engine()
+prog = Program(4)
+"""
+
+def run(code):
+    """Namespace left by executing guarded code"""
+    guarded, report = guard_code(PRELUDE + code)
+    namespace = {}
+    exec(guarded, namespace)
+    return namespace, report
+
+def test_small_program_untouched():
+    """Code within the limits comes back unchanged"""
+    code = PRELUDE + "result = eng.run(prog, shots=100, cutoff=5)\n"
+    guarded, report = guard_code(code)
+    assert guarded == code and report["modes"] == 4 and report["clamped"] == []
+
+def test_clamp_keeps_the_rest_of_the_line():
+    """Only the clamped values are rewritten; comments and other arguments survive"""
+    N = 10 ** 9
+    namespace, report = run(f"N = {N}\nresult = eng.run(prog, shots=N, cutoff=10 ** 3)  # shots=N, é\n")
+    assert namespace["result"] == {"shots": MAX_SAMPLES, "cutoff": max_cutoff(4)}
+    assert report["clamped"] == [{"samples": N, "to": MAX_SAMPLES}, {"cutoff": 1000, "to": max_cutoff(4)}]
+    guarded, _ = guard_code(PRELUDE + "result = eng.run(prog, shots=10 ** 9)  # keep me\n")
+    assert guarded.endswith(f"result = eng.run(prog, shots={MAX_SAMPLES})  # keep me\n")
+
+def test_semicolon_statements_still_run():
+    """Statements sharing a line with a clamped call are kept"""
+    namespace, report = run("result = eng.run(prog, shots=10 ** 9); after = result['shots'] + 1; done = True\n")
+    assert namespace["result"]["shots"] == MAX_SAMPLES
+    assert namespace["after"] == MAX_SAMPLES + 1 and namespace["done"]
+    assert report["clamped"] == [{"samples": 10 ** 9, "to": MAX_SAMPLES}]
+
+def test_clamp_inside_block():
+    """Clamping in an indented block header and body keeps the block intact"""
+    namespace, _ = run("if eng.run(prog, shots=10 ** 8):\n    result = eng.run(prog, cutoff=500)\n    done = True\n")
+    assert namespace["result"]["cutoff"] == max_cutoff(4) and namespace["done"]
+
+def test_triple_quoted_program_keeps_comments():
+    """Docstrings are skipped, and clamping keeps comments whichever path parses the code"""
+    docstring = '"""\nRuns eng.run(prog, shots=10 ** 9) on the chip\n"""\n'
+    code = PRELUDE + docstring + "# many shots\nresult = eng.run(prog, shots=10 ** 9)  # keep me\n"
+    guarded, report = guard_code(code)
+    assert guarded == code.replace("shots=10 ** 9)  #", f"shots={MAX_SAMPLES})  #")
+    assert report["clamped"] == [{"samples": 10 ** 9, "to": MAX_SAMPLES}]
+    # A call over several lines needs the full tree
+    code = PRELUDE + docstring + "result = eng.run(\n    prog,  # the circuit\n    shots=10 ** 9,  # many shots\n)\n"
+    guarded, _ = guard_code(code)
+    assert guarded == code.replace("shots=10 ** 9,", f"shots={MAX_SAMPLES},")
+    namespace = {}
+    exec(guarded, namespace)
+    assert namespace["result"]["shots"] == MAX_SAMPLES
+
+def test_strings_hiding_calls_are_still_guarded():
+    """Triple quotes inside ordinary strings cannot hide a call from the guard"""
+    code = PRELUDE + "a = \"'''\"\nresult = eng.run(prog, shots=10 ** 9)\nb = \"'''\"\n"
+    guarded, _ = guard_code(code)
+    namespace = {}
+    exec(guarded, namespace)
+    assert namespace["result"]["shots"] == MAX_SAMPLES
+
+def test_reject_oversized_programs():
+    """Mode counts whose covariance cannot fit are rejected before exec"""
+    with pytest.raises(ValueError):
+        guard_code("prog = Program(10 ** 5)\n")
+    with pytest.raises(ValueError):
+        guard_code("circuit = Circuit(60)\nstate = BasicState([1] * 30)\n")
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__} passed")
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__} failed: {e!r}")
+    raise SystemExit(1 if failed else 0)
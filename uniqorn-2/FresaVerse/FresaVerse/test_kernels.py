@@ -0,0 +1,338 @@
+#!/usr/bin/env python3
+"""
+Offline checks of the simulation kernels against closed forms and brute force.
+
+Unlike the other test scripts these need no running server; run them with
+python test_kernels.py, or with pytest.
+"""
+
+import itertools
+import math
+
+import numpy as np
+
+from boson_sampling import sample_counts as boson_sample_counts
+from fock import fock_ket, split_circuit
+from gaussian_probs import (
+    GaussianFockProbabilities, all_probs_batch, choose_cutoff, reduced_state, rounding_error,
+)
+from gaussian_sampling import sample_counts
+from light_cone import expand_state, expand_unitary, lit_modes, prune_circuit
+from linear_optics import circuit_unitary
+from optimize import optimize_gaussian_circuit, optimize_unitary_circuit
+from permanents import output_probabilities, permanent, permanent_minors
+from sessions import SessionStore, gaussian_session, unitary_session
+from structured import parse_circuit
+from symplectic import HBAR, apply_channel, gaussian_state, vacuum_state
+from threshold_probs import GaussianClickProbabilities
+from top_outcomes import distribution_top_k, top_k_outcomes
+from wigner import gaussian_wigner, wigner_grid
+
+def circuit_state(modes, elements):
+    """Covariance and means of a structured circuit"""
+    cov, means, _ = gaussian_state(parse_circuit({"modes": modes, "elements": elements}), HBAR)
+    return cov, means
+
+def mixed_circuit():
+    """Three modes, squeezed, displaced and mixed by beam splitters, so every reduced state is mixed"""
+    return circuit_state(3, [
+        {"type": "Squeezing Gate", "mode": 0, "parameters": {"r": 0.4, "theta": 0.3}},
+        {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": 0.3, "theta": 1.2}},
+        {"type": "Displacement Gate", "mode": 2, "parameters": {"r": 0.6, "phi": 0.4}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.7, "phi": 0.2}},
+        {"type": "Beam Splitter", "mode": 1, "parameters": {"theta": 0.5, "phi": 1.1}},
+    ])
+
+def parse_key(key):
+    """Photon pattern of a '|n0,n1,...>' key"""
+    return tuple(int(n) for n in key[1:-1].split(","))
+
+def test_coherent_poisson():
+    """A displaced vacuum has Poisson photon numbers with mean |alpha|^2"""
+    r = 0.9
+    cov, means = circuit_state(1, [{"type": "Displacement Gate", "mode": 0, "parameters": {"r": r, "phi": 0.7}}])
+    probs = GaussianFockProbabilities(cov, means).all_probs(12)
+    poisson = [math.exp(-r ** 2) * r ** (2 * n) / math.factorial(n) for n in range(12)]
+    assert np.allclose(probs, poisson, atol=1e-12)
+
+def test_squeezed_even_photons():
+    """A squeezed vacuum only holds even photon numbers, P(2n) = tanh(r)^2n (2n)! / (2^n n!)^2 / cosh(r)"""
+    r = 0.8
+    cov, means = circuit_state(1, [{"type": "Squeezing Gate", "mode": 0, "parameters": {"r": r, "theta": 0.5}}])
+    probs = GaussianFockProbabilities(cov, means).all_probs(16)
+    expected = np.zeros(16)
+    for n in range(8):
+        expected[2 * n] = math.tanh(r) ** (2 * n) * math.factorial(2 * n) / (2 ** n * math.factorial(n)) ** 2 / math.cosh(r)
+    assert np.allclose(probs, expected, atol=1e-12)
+
+def test_two_mode_squeezed_thermal_marginal():
+    """Either half of a two-mode squeezed vacuum is thermal, and both modes always hold equal photon numbers"""
+    r = 0.6
+    cov, means = circuit_state(2, [
+        {"type": "Squeezing Gate", "mode": 0, "parameters": {"r": r, "theta": 0.0}},
+        {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": r, "theta": math.pi}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": math.pi / 4, "phi": 0.0}},
+    ])
+    mean = math.sinh(r) ** 2
+    thermal = [mean ** n / (1 + mean) ** (n + 1) for n in range(10)]
+    marginal = GaussianFockProbabilities(*reduced_state(cov, means, [0])).all_probs(10)
+    assert np.allclose(marginal, thermal, atol=1e-12)
+    joint = GaussianFockProbabilities(cov, means).all_probs(10)
+    assert np.allclose(joint, np.diag(thermal), atol=1e-12)
+
+def test_patterns_match_table():
+    """Pattern-by-pattern probabilities agree with the dense table of a mixed state"""
+    cov, means = mixed_circuit()
+    engine = GaussianFockProbabilities(cov, means)
+    table = engine.all_probs(4)
+    patterns = list(itertools.product(range(4), repeat=3))
+    probs = engine.probs(patterns)
+    assert all(abs(probs["|" + ",".join(map(str, p)) + ">"] - table[p]) < 1e-12 for p in patterns)
+
+def test_single_precision_tables():
+    """complex64 loop-hafnian tables give float32 probabilities within single-precision rounding of double"""
+    cov, means = mixed_circuit()
+    double = GaussianFockProbabilities(cov, means).all_probs(4)
+    single = GaussianFockProbabilities(cov, means, dtype=np.complex64).all_probs(4)
+    assert single.dtype == np.float32 and np.allclose(single, double, atol=1e-6)
+    batch = all_probs_batch(np.stack([cov, cov]), np.stack([means, means]), 4, dtype=np.complex64)
+    assert batch.dtype == np.float32 and np.allclose(batch[1], double, atol=1e-6)
+    assert rounding_error(single, lambda index: double[index]) < 1e-5
+
+def test_permanent_brute_force():
+    """Glynn's formula agrees with the sum over permutations"""
+    rng = np.random.default_rng(7)
+    for n in range(1, 7):
+        M = rng.normal(size=(n, n)) + 1j * rng.normal(size=(n, n))
+        brute = sum(np.prod(M[np.arange(n), list(p)]) for p in itertools.permutations(range(n)))
+        assert abs(permanent(M) - brute) < 1e-9 * max(abs(brute), 1)
+
+def test_permanent_minors():
+    """All column-deleted minors from one pass agree with separate permanents"""
+    rng = np.random.default_rng(4)
+    for n in range(2, 8):
+        B = rng.normal(size=(n - 1, n)) + 1j * rng.normal(size=(n - 1, n))
+        separate = [permanent(np.delete(B, l, axis=1)) for l in range(n)]
+        assert np.allclose(permanent_minors(B), separate, atol=1e-9)
+
+def test_linear_optics_distribution():
+    """Output probabilities of photons through a random unitary sum to 1"""
+    rng = np.random.default_rng(3)
+    U, _ = np.linalg.qr(rng.normal(size=(4, 4)) + 1j * rng.normal(size=(4, 4)))
+    outputs = [p for p in itertools.product(range(4), repeat=4) if sum(p) == 3]
+    assert abs(output_probabilities(U, [1, 1, 1, 0], outputs).sum() - 1) < 1e-12
+
+def test_top_k_search_matches_ranking():
+    """The pruned top-k search finds the same outcomes as ranking the full distribution"""
+    rng = np.random.default_rng(9)
+    U, _ = np.linalg.qr(rng.normal(size=(4, 4)) + 1j * rng.normal(size=(4, 4)))
+    outputs = [p for p in itertools.product(range(4), repeat=4) if sum(p) == 3]
+    probs = output_probabilities(U, [1, 1, 1, 0], outputs)
+    distribution = {"|" + ",".join(map(str, p)) + ">": float(v) for p, v in zip(outputs, probs)}
+    mode_marginals = [np.bincount([p[mode] for p in outputs], weights=probs, minlength=4) for mode in range(4)]
+    lookup = dict(zip(outputs, probs))
+    top = top_k_outcomes(lambda p: lookup[tuple(p)], mode_marginals, [3], 5, sectors_complete=True)
+    ranked = distribution_top_k(distribution, 5)
+    assert top["certified"] and ranked["certified"]
+    assert [item["pattern"] for item in top["outcomes"]] == [item["pattern"] for item in ranked["outcomes"]]
+
+def test_click_probabilities_sum_to_one():
+    """The click distribution sums to 1, matches pattern-by-pattern evaluation, and folds the Fock distribution"""
+    cov, means = mixed_circuit()
+    clicks = GaussianClickProbabilities(cov, means)
+    dist = clicks.all_probs()
+    assert abs(dist.sum() - 1) < 1e-12
+    patterns = list(itertools.product(range(2), repeat=3))
+    probs = clicks.probs(patterns)
+    assert all(abs(probs["|" + ",".join(map(str, p)) + ">"] - dist[p]) < 1e-12 for p in patterns)
+    # No click anywhere is the vacuum probability
+    assert abs(dist[0, 0, 0] - GaussianFockProbabilities(cov, means).prob([0, 0, 0])) < 1e-12
+
+def test_sampler_marginals():
+    """Photon-number and click samples follow the exact per-mode marginals"""
+    cov, means = mixed_circuit()
+    shots = 20000
+    cutoff, _ = choose_cutoff(cov, means, 0.9999)
+    counts, report = sample_counts(cov, means, shots, detector="pnr", cutoff=cutoff, seed=11)
+    assert sum(counts.values()) == shots and report["dropped_mass"] < 1e-3
+    for mode in range(3):
+        exact = GaussianFockProbabilities(*reduced_state(cov, means, [mode])).all_probs(cutoff)
+        observed = np.zeros(cutoff)
+        for key, count in counts.items():
+            observed[parse_key(key)[mode]] += count / shots
+        # Total variation distance, well above the ~sqrt(cutoff / shots) sampling noise
+        assert 0.5 * np.abs(observed - exact).sum() < 0.02
+    counts, _ = sample_counts(cov, means, shots, detector="threshold", seed=11)
+    exact = GaussianClickProbabilities(cov, means).all_probs()
+    observed = np.zeros((2, 2, 2))
+    for key, count in counts.items():
+        observed[parse_key(key)] += count / shots
+    assert 0.5 * np.abs(observed - exact).sum() < 0.02
+
+def test_sampler_seed():
+    """A seed gives the same samples"""
+    cov, means = mixed_circuit()
+    assert sample_counts(cov, means, 500, cutoff=5, seed=5) == sample_counts(cov, means, 500, cutoff=5, seed=5)
+
+def test_boson_sampler_distribution():
+    """Exact boson samples follow the permanent probabilities"""
+    rng = np.random.default_rng(5)
+    U, _ = np.linalg.qr(rng.normal(size=(3, 3)) + 1j * rng.normal(size=(3, 3)))
+    shots = 20000
+    counts = boson_sample_counts(U, [1, 1, 0], shots, seed=2, parallel=False)
+    outputs = [p for p in itertools.product(range(3), repeat=3) if sum(p) == 2]
+    exact = output_probabilities(U, [1, 1, 0], outputs)
+    observed = np.array([counts.get("|" + ",".join(map(str, p)) + ">", 0) / shots for p in outputs])
+    assert 0.5 * np.abs(observed - exact).sum() < 0.02
+
+def session_circuit(modes, elements):
+    """Parsed structured circuit, as a session receives it"""
+    return parse_circuit({"modes": modes, "elements": elements})
+
+def test_session_matches_fresh_run():
+    """Session recompositions after edits in the middle, at either end and across elements equal a fresh composition"""
+    elements = [
+        {"type": "Squeezing Gate", "mode": 0, "parameters": {"r": 0.4, "theta": 0.3}},
+        {"type": "Displacement Gate", "mode": 1, "parameters": {"r": 0.6, "phi": 0.4}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.7, "phi": 0.2}},
+        {"type": "Phase Shifter", "mode": 2, "parameters": {"phi": 0.9}},
+        {"type": "Beam Splitter", "mode": 1, "parameters": {"theta": 0.5, "phi": 1.1}},
+    ]
+    gaussian, unitary = SessionStore(gaussian_session), SessionStore(unitary_session)
+    # Repeated ticks on one element, then edits that move the prefix and suffix split both ways
+    edits = [(2, "theta", 0.8), (2, "theta", 0.9), (4, "phi", 0.3), (0, "r", 0.2), (3, "phi", 0.1), (0, "theta", 1.4)]
+    for step, edit in enumerate([None] + edits):
+        if edit:
+            index, name, value = edit
+            elements[index] = dict(elements[index], parameters=dict(elements[index]["parameters"], **{name: value}))
+        circuit = session_circuit(3, elements)
+        session, report = gaussian.get("s", circuit)
+        assert report["reused"] == bool(step)
+        cov, means = apply_channel(session.transfer(), *vacuum_state(3, HBAR))
+        fresh_cov, fresh_means, _ = gaussian_state(circuit, HBAR)
+        assert np.allclose(cov, fresh_cov, atol=1e-12) and np.allclose(means, fresh_means, atol=1e-12)
+        session, _ = unitary.get("s", circuit)
+        assert np.allclose(session.transfer(), circuit_unitary(circuit)[0], atol=1e-12)
+    # A new structure starts a new session
+    elements.append({"type": "Phase Shifter", "mode": 1, "parameters": {"phi": 0.5}})
+    session, report = gaussian.get("s", session_circuit(3, elements))
+    assert not report["reused"]
+
+def test_optimized_circuit_equivalent():
+    """Fusing gates and dropping identities leaves the Gaussian state and the circuit unitary unchanged"""
+    circuit = session_circuit(3, [
+        {"type": "Phase Shifter", "mode": 0, "parameters": {"phi": 0.3}},
+        {"type": "Phase Shifter", "mode": 0, "parameters": {"phi": 0.4}},
+        {"type": "Phase Shifter", "mode": 2, "parameters": {"phi": 0.0}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.7, "phi": 0.2}},
+        {"type": "Displacement Gate", "mode": 1, "parameters": {"r": 0.5, "phi": 0.1}},
+        {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": 0.3, "theta": 0.6}},
+        {"type": "Beam Splitter", "mode": 1, "parameters": {"theta": 0.4, "phi": 0.9}},
+        {"type": "Phase Shifter", "mode": 2, "parameters": {"phi": 1.2}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.2, "phi": 0.0}},
+    ])
+    optimized, report = optimize_gaussian_circuit(circuit)
+    assert report["fused"] and report["dropped"] and report["elements_after"] < report["elements_before"]
+    cov, means, _ = gaussian_state(circuit, HBAR)
+    fused_cov, fused_means, _ = gaussian_state(optimized, HBAR)
+    assert np.allclose(cov, fused_cov, atol=1e-12) and np.allclose(means, fused_means, atol=1e-12)
+    optimized, report = optimize_unitary_circuit(circuit)
+    assert report["elements_after"] < report["elements_before"]
+    assert np.allclose(circuit_unitary(optimized)[0], circuit_unitary(circuit)[0], atol=1e-12)
+
+def test_pruned_circuit_equivalent():
+    """Simulating only the lit modes and refilling the rest with vacuum gives the unpruned result"""
+    circuit = session_circuit(5, [
+        {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": 0.4, "theta": 0.3}},
+        {"type": "Phase Shifter", "mode": 4, "parameters": {"phi": 0.7}},
+        {"type": "Beam Splitter", "mode": 1, "parameters": {"theta": 0.6, "phi": 0.2}},
+        {"type": "Beam Splitter", "mode": 3, "parameters": {"theta": 0.5, "phi": 0.8}},
+        {"type": "Displacement Gate", "mode": 2, "parameters": {"r": 0.5, "phi": 0.1}},
+    ])
+    lit = lit_modes(circuit)
+    assert lit == [1, 2]
+    cov, means, _ = gaussian_state(prune_circuit(circuit, lit), HBAR)
+    full_cov, full_means, _ = gaussian_state(circuit, HBAR)
+    pruned_cov, pruned_means = expand_state(cov, means, lit, 5, HBAR)
+    assert np.allclose(pruned_cov, full_cov, atol=1e-12) and np.allclose(pruned_means, full_means, atol=1e-12)
+    # Photons entering modes 3 and 4 only ever reach those two
+    photons = dict(circuit, input_state=[0, 0, 0, 1, 1])
+    lit = lit_modes(photons, sources=(), input_state=photons["input_state"])
+    assert lit == [3, 4]
+    U = expand_unitary(circuit_unitary(prune_circuit(photons, lit))[0], lit, 5)
+    outputs = [p for p in itertools.product(range(3), repeat=5) if sum(p) == 2]
+    assert np.allclose(
+        output_probabilities(U, photons["input_state"], outputs),
+        output_probabilities(circuit_unitary(circuit)[0], photons["input_state"], outputs), atol=1e-12,
+    )
+
+def test_fock_engine_matches_gaussian():
+    """Without acting Kerr phases the Fock engine reproduces the Gaussian probabilities"""
+    circuit = session_circuit(2, [
+        {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": 0.3, "theta": 0.4}},
+        # exp(i 2pi n^2) = 1, but the gate still moves every later gate on mode 0 into the Fock part
+        {"type": "Kerr Gate", "mode": 0, "parameters": {"kappa": 2 * math.pi}},
+        {"type": "Displacement Gate", "mode": 0, "parameters": {"r": 0.4, "phi": 0.2}},
+        {"type": "Squeezing Gate", "mode": 0, "parameters": {"r": 0.2, "theta": 1.0}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.6, "phi": 0.3}},
+        {"type": "Phase Shifter", "mode": 1, "parameters": {"phi": 0.5}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.3, "phi": 0.1}},
+    ])
+    assert len(split_circuit(circuit)[1]) == 6
+    cov, means, _ = gaussian_state(circuit, HBAR)
+    exact = GaussianFockProbabilities(cov, means).all_probs(20)
+    ket, ignored, drift = fock_ket(circuit, 20)
+    # Truncated gate matrices only lose mass near the cutoff
+    assert not ignored and np.allclose(np.abs(ket[:8, :8]) ** 2, exact[:8, :8], atol=1e-12)
+    double = ket
+    ket, _, drift = fock_ket(circuit, 20, dtype=np.complex64)
+    # Single precision reports a bound on its rounding, never zero
+    error = abs(np.sum(np.abs(ket.astype(np.complex128)) ** 2) - np.sum(np.abs(double) ** 2))
+    assert ket.dtype == np.complex64 and error <= drift < 1e-3
+    assert np.allclose(np.abs(ket[:8, :8]) ** 2, exact[:8, :8], atol=1e-6)
+
+def test_fock_amplitudes_keep_trailing_phases():
+    """Trailing Kerr and phase gates only change the phases, which amplitudes must still carry"""
+    head = [
+        {"type": "Squeezing Gate", "mode": 0, "parameters": {"r": 0.3, "theta": 0.4}},
+        {"type": "Kerr Gate", "mode": 0, "parameters": {"kappa": 0.3}},
+        {"type": "Beam Splitter", "mode": 0, "parameters": {"theta": 0.6, "phi": 0.3}},
+    ]
+    tail = [
+        {"type": "Kerr Gate", "mode": 1, "parameters": {"kappa": 0.2}},
+        {"type": "Phase Shifter", "mode": 0, "parameters": {"phi": 0.7}},
+    ]
+    before, _, _ = fock_ket(session_circuit(2, head), 12)
+    n = np.arange(12)
+    expected = before * np.exp(1j * 0.7 * n)[:, None] * np.exp(1j * 0.2 * n ** 2)[None, :]
+    circuit = session_circuit(2, head + tail)
+    assert len(split_circuit(circuit)[1]) == 2 and len(split_circuit(circuit, keep_phases=True)[1]) == 4
+    ket, _, _ = fock_ket(circuit, 12, keep_phases=True)
+    assert np.allclose(ket, expected, atol=1e-12)
+    # Probabilities alone do not need them
+    ket, _, _ = fock_ket(circuit, 12)
+    assert np.allclose(ket, before) and not np.allclose(ket, expected)
+
+def test_wigner_closed_forms():
+    """Vacuum and coherent-state Wigner functions match W = exp(-|z - mean|^2 / hbar) / (pi hbar), rows along p"""
+    xvec, pvec = wigner_grid({"x": [-4, 6, 101], "p": [-5, 5, 81]})
+    r, phi = 0.8, 0.6
+    cov, means = circuit_state(2, [{"type": "Displacement Gate", "mode": 1, "parameters": {"r": r, "phi": phi}}])
+    for mode, (x0, p0) in [(0, (0.0, 0.0)), (1, (math.sqrt(2 * HBAR) * r * math.cos(phi), math.sqrt(2 * HBAR) * r * math.sin(phi)))]:
+        values = gaussian_wigner(cov, means, mode, xvec, pvec)
+        expected = np.exp(-((xvec[None, :] - x0) ** 2 + (pvec[:, None] - p0) ** 2) / HBAR) / (math.pi * HBAR)
+        assert values.shape == (81, 101) and np.allclose(values, expected, atol=1e-12)
+        # The grid covers nearly all of the quasi-probability
+        assert abs(values.sum() * (xvec[1] - xvec[0]) * (pvec[1] - pvec[0]) - 1) < 1e-3
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__} passed")
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__} failed: {e!r}")
+    raise SystemExit(1 if failed else 0)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Offline checks of the planner's admission limits through the /estimate handlers.
+
+Like test_kernels.py these need no running server; run them with
+python test_planner.py, or with pytest.
+"""
+
+from perceval_server import PercevalHandler
+from strawberry_server import StrawberryFieldsHandler
+
+# The handlers' request methods only read their arguments, so no socket is needed
+PERCEVAL = object.__new__(PercevalHandler)
+STRAWBERRY = object.__new__(StrawberryFieldsHandler)
+
+def linear_optics_request(outputs, simulation="quantum"):
+    """Three photons through a chain of beam splitters on six modes"""
+    return {
+        "modes": 6,
+        "elements": [{"type": "Beam Splitter", "mode": mode, "parameters": {"theta": 0.6}} for mode in range(5)],
+        "input_state": [1, 1, 1, 0, 0, 0],
+        "simulation": simulation,
+        "outputs": outputs,
+    }
+
+def gaussian_request(outputs, modes=6):
+    """Squeezed light on every mode, mixed by a chain of beam splitters"""
+    elements = [{"type": "Squeezing Gate", "mode": mode, "parameters": {"r": 0.3}} for mode in range(modes)]
+    elements += [{"type": "Beam Splitter", "mode": mode, "parameters": {"theta": 0.6}} for mode in range(modes - 1)]
+    return {"modes": modes, "elements": elements, "outputs": outputs}
+
+def assert_rejected(request):
+    """/estimate turns the request down on the admission limits"""
+    estimate = STRAWBERRY.estimate(request)["results"]
+    assert not estimate["admitted"] and "over the limits" in estimate["reason"]
+
+def test_gaussian_tensor_file_costed():
+    """A cutoff**modes tensor file counts against the limits, while a small one is admitted"""
+    assert STRAWBERRY.estimate(gaussian_request({"tensor": "probabilities", "cutoff": 4}))["results"]["admitted"]
+    assert STRAWBERRY.estimate(gaussian_request({"cutoff": 40}))["results"]["admitted"]
+    for kind in ("probabilities", "amplitudes"):
+        assert_rejected(gaussian_request({"tensor": kind, "cutoff": 40}))
+
+def test_gaussian_quadrature_shots_costed():
+    """Quadrature shots are costed, so a trillion of them are rejected before any draw"""
+    for measurement in ("homodyne", "heterodyne"):
+        spec = {"measurement": measurement, "shots": 1000, "seed": 1}
+        assert STRAWBERRY.estimate(gaussian_request({"quadratures": spec}))["results"]["admitted"]
+        assert_rejected(gaussian_request({"quadratures": dict(spec, shots=10 ** 12)}))
+        response = STRAWBERRY.run_structured(gaussian_request({"quadratures": dict(spec, shots=10 ** 12)}))
+        assert not response["success"] and "over the limits" in response["error"]
+
+def test_gaussian_click_distribution_costed():
+    """The full click distribution takes 2**modes determinants, so it is rejected on many modes"""
+    assert STRAWBERRY.estimate(gaussian_request({"clicks": True}))["results"]["admitted"]
+    assert_rejected(gaussian_request({"clicks": True, "cutoff": 3}, modes=30))
+    assert STRAWBERRY.estimate(gaussian_request({"cutoff": 3}, modes=30))["results"]["admitted"]
+
+def test_gaussian_samples_costed():
+    """Chain-rule samples are costed per mode step, so a billion shots over many outcomes are rejected"""
+    for detector, modes in (("pnr", 12), ("threshold", 30)):
+        outputs = {"samples": 1000, "detector": detector, "seed": 1}
+        assert STRAWBERRY.estimate(gaussian_request(outputs))["results"]["admitted"]
+        assert_rejected(gaussian_request(dict(outputs, samples=10 ** 9, cutoff=10), modes=modes))
+
+def test_perceval_readouts_admitted():
+    """Marginals, samples and top-k without the full distribution are planned and admitted"""
+    for simulation in ("quantum", "distinguishable"):
+        response = PERCEVAL.run_structured(linear_optics_request({"top_k": 3, "samples": 50, "seed": 1}, simulation))
+        assert response["success"] and response["results"]["plan"]["estimates"]["permanent"]["seconds"] > 0
+        estimate = PERCEVAL.estimate(linear_optics_request({"marginals": [[0, 1]]}, simulation))["results"]
+        assert estimate["admitted"]
+
+def test_perceval_huge_samples_rejected():
+    """A billion samples are rejected before running, with or without the full distribution"""
+    for outputs in ({"samples": 10 ** 9}, {"samples": 10 ** 9, "probabilities": True}):
+        for simulation in ("quantum", "distinguishable"):
+            estimate = PERCEVAL.estimate(linear_optics_request(outputs, simulation))["results"]
+            assert not estimate["admitted"] and "over the limits" in estimate["reason"]
+            response = PERCEVAL.run_structured(linear_optics_request(outputs, simulation))
+            assert not response["success"] and "over the limits" in response["error"]
+
+if __name__ == "__main__":
+    tests = [value for name, value in list(globals().items()) if name.startswith("test_")]
+    failed = 0
+    for test in tests:
+        try:
+            test()
+            print(f"✓ {test.__name__} passed")
+        except Exception as e:
+            failed += 1
+            print(f"✗ {test.__name__} failed: {e!r}")
+    raise SystemExit(1 if failed else 0)
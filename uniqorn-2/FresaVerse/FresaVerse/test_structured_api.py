@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+import requests
+
+def test_strawberry_fields_marginals():
+    """Test per-mode marginals from the Strawberry Fields structured endpoint"""
+    print("Testing Strawberry Fields structured endpoint...")
+    
+    circuit = {
+        "modes": 3,
+        "elements": [
+            {"type": "Laser", "mode": 0},
+            {"type": "Squeezing Gate", "mode": 1, "parameters": {"r": 0.5, "theta": 0.0}},
+            {"type": "Beam Splitter", "mode": 0},
+            {"type": "Beam Splitter", "mode": 1}
+        ],
+        "outputs": {"marginals": [[0], [1], [2], [0, 2]]}
+    }
+    
+    try:
+        response = requests.post(
+            "http://localhost:8080/structured",
+            json=circuit,
+            headers={"Content-Type": "application/json"},
+            timeout=10
+        )
+        
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        
+        if response.status_code == 200 and response.json().get("success"):
+            print("✓ Strawberry Fields structured test passed")
+        else:
+            print("✗ Strawberry Fields structured test failed")
+            
+    except Exception as e:
+        print(f"✗ Strawberry Fields structured test failed with error: {e}")
+
+def test_perceval_marginals():
+    """Test per-mode marginals from the Perceval structured endpoint"""
+    print("\nTesting Perceval structured endpoint...")
+    
+    circuit = {
+        "modes": 3,
+        "elements": [
+            {"type": "Beam Splitter", "mode": 0},
+            {"type": "Phase Shifter", "mode": 1, "parameters": {"phi": 0.5}},
+            {"type": "Beam Splitter", "mode": 1}
+        ],
+        "input_state": [1, 1, 0],
+        "outputs": {"marginals": [[0], [1], [2], [1, 2]], "probabilities": True}
+    }
+    
+    try:
+        response = requests.post(
+            "http://localhost:8081/structured",
+            json=circuit,
+            headers={"Content-Type": "application/json"},
+            timeout=10
+        )
+        
+        print(f"Status Code: {response.status_code}")
+        print(f"Response: {response.text}")
+        
+        if response.status_code == 200 and response.json().get("success"):
+            print("✓ Perceval structured test passed")
+        else:
+            print("✗ Perceval structured test failed")
+            
+    except Exception as e:
+        print(f"✗ Perceval structured test failed with error: {e}")
+
+if __name__ == "__main__":
+    test_strawberry_fields_marginals()
+    test_perceval_marginals()
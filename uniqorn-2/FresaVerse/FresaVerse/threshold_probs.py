@@ -0,0 +1,159 @@
+"""
+Threshold (click / no-click) detection probabilities of Gaussian states.
+
+A threshold detector only tells whether a mode holds any photons, so the
+probability of a click pattern follows from vacuum probabilities alone. The
+chance that every mode of a set Z is empty is a Gaussian overlap with the
+vacuum,
+
+    p0(Z) = exp(-r_Z^T (V_Z + hbar/2)^-1 r_Z / 2) / sqrt(det((V_Z + hbar/2) / hbar)),
+
+and the probability of clicks exactly on the modes S is the inclusion-exclusion
+sum over subsets T of S of (-1)^|T| p0(rest of the modes + T). For states
+without displacement this is the torontonian. Patterns are evaluated in
+batches, with the determinants of equally sized subsets stacked, and long
+pattern lists are split across processes. The full click distribution of all
+2**modes patterns takes one vacuum probability per subset and a single
+subset Moebius transform, instead of summing Fock probabilities.
+
+States use the Strawberry Fields conventions of gaussian_probs (xxpp ordering,
+hbar=2 by default).
+"""
+
+import numpy as np
+
+from gaussian_probs import PARALLEL_MIN_PATTERNS, pattern_key
+from workers import fill_parallel
+
+# Most clicks in one pattern; each one doubles the vacuum probabilities it needs
+MAX_CLICKS = 24
+
+# Most modes for a full click distribution of 2**modes patterns
+MAX_CLICK_MODES = 22
+
+
+def vacuum_probabilities(state, vacuum):
+    """
+    Probability that all modes marked True in each row of `vacuum` are empty, for state = (cov, means, hbar).
+
+    Rows with the same number of empty modes share one batched determinant and solve.
+    """
+    cov, means, hbar = state
+    n = len(means) // 2
+    vacuum = np.asarray(vacuum, dtype=bool).reshape(-1, n)
+    values = np.ones(len(vacuum))
+    sizes = vacuum.sum(axis=1)
+    for size in np.unique(sizes):
+        if size == 0:
+            continue
+        rows = np.flatnonzero(sizes == size)
+        modes = np.nonzero(vacuum[rows])[1].reshape(len(rows), size)
+        idx = np.concatenate([modes, modes + n], axis=1)
+        Q = cov[idx[:, :, None], idx[:, None, :]] + hbar / 2 * np.identity(2 * size)
+        r = means[idx]
+        _, logdet = np.linalg.slogdet(Q / hbar)
+        exponent = np.einsum('bi,bi->b', r, np.linalg.solve(Q, r[..., None])[..., 0])
+        values[rows] = np.exp(-0.5 * exponent - 0.5 * logdet)
+    return values
+
+
+def index_vacuum_probabilities(state, indices):
+    """
+    Vacuum probabilities at a range of flat indices into the (2,) * modes click tensor; zeros mark the empty modes
+    """
+    n = len(state[1]) // 2
+    clicks = np.stack(np.unravel_index(np.arange(indices.start, indices.stop), (2,) * n), axis=-1)
+    return vacuum_probabilities(state, clicks == 0)
+
+
+def click_patterns(patterns, modes):
+    """
+    Validate click patterns (one 0/1 entry per mode) into a boolean array
+    """
+    patterns = np.asarray(patterns, dtype=int).reshape(-1, modes)
+    if np.any((patterns != 0) & (patterns != 1)):
+        raise ValueError('Click patterns hold 0 (no click) or 1 (click) per mode')
+    clicks = patterns.sum(axis=1, initial=0)
+    if len(clicks) and clicks.max() > MAX_CLICKS:
+        raise ValueError(f'A click pattern with {clicks.max()} clicks needs 2**{clicks.max()} terms; at most {MAX_CLICKS} are supported')
+    return patterns.astype(bool)
+
+
+def click_probabilities(state, patterns):
+    """
+    Probability of each click pattern (row), by inclusion-exclusion over the vacuum probabilities.
+
+    The subsets of all patterns in the batch are evaluated together, and
+    each distinct subset only once.
+    """
+    n = len(state[1]) // 2
+    patterns = np.asarray(patterns, dtype=bool).reshape(-1, n)
+    vacuum, signs, owners = [], [], []
+    for row, pattern in enumerate(patterns):
+        clicks = np.flatnonzero(pattern)
+        # Every subset T of the clicking modes, as the rows 'empty unless clicking and outside T'
+        subsets = (np.arange(2 ** len(clicks))[:, None] >> np.arange(len(clicks))) & 1
+        empty = np.ones((len(subsets), n), dtype=bool)
+        empty[:, clicks] = subsets == 0
+        vacuum.append(empty)
+        signs.append((-1.0) ** (len(clicks) - subsets.sum(axis=1)))
+        owners.append(np.full(len(subsets), row))
+    if not vacuum:
+        return np.zeros(0)
+    vacuum = np.concatenate(vacuum)
+    if n < 63:
+        # Deduplicate bitmask codes rather than rows, which sorts far faster
+        codes, inverse = np.unique(vacuum @ (1 << np.arange(n)), return_inverse=True)
+        distinct = (codes[:, None] >> np.arange(n)) & 1
+    else:
+        distinct, inverse = np.unique(vacuum, axis=0, return_inverse=True)
+    terms = np.concatenate(signs) * vacuum_probabilities(state, distinct)[inverse.reshape(-1)]
+    return np.maximum(np.bincount(np.concatenate(owners), weights=terms, minlength=len(patterns)), 0.0)
+
+
+class GaussianClickProbabilities:
+    """
+    Threshold-detector probabilities of a Gaussian state, with the pattern interface of GaussianFockProbabilities
+    """
+
+    def __init__(self, cov, means=None, hbar=2):
+        cov = np.asarray(cov, dtype=float)
+        self.modes = cov.shape[0] // 2
+        means = np.zeros(2 * self.modes) if means is None else np.asarray(means, dtype=float)
+        self.state = cov, means, hbar
+
+    def prob(self, pattern):
+        """
+        Probability of clicks exactly on the modes where `pattern` is 1
+        """
+        return float(click_probabilities(self.state, click_patterns([pattern], self.modes))[0])
+
+    def probs(self, patterns):
+        """
+        Probabilities of a list of click patterns, keyed by pattern_key; long lists are split across processes
+        """
+        patterns = click_patterns(patterns, self.modes)
+        values = fill_parallel(click_probabilities, self.state, patterns, min_items=PARALLEL_MIN_PATTERNS)
+        return {pattern_key(pattern): float(value) for pattern, value in zip(patterns, values)}
+
+    def all_probs(self):
+        """
+        Dense (2,) * modes tensor of click-pattern probabilities
+        """
+        if self.modes > MAX_CLICK_MODES:
+            raise ValueError(
+                f'The click distribution of {self.modes} modes has 2**{self.modes} patterns; '
+                f'ask for click_patterns or at most {MAX_CLICK_MODES} modes'
+            )
+        # Entry c holds the chance that the modes with c_i = 0 are empty
+        probs = fill_parallel(
+            index_vacuum_probabilities, self.state, range(2 ** self.modes), min_items=PARALLEL_MIN_PATTERNS,
+        ).reshape((2,) * self.modes)
+        # Moebius transform over subsets: remove the chance of staying empty, one mode at a time
+        for axis in range(self.modes):
+            index = [slice(None)] * self.modes
+            index[axis] = 1
+            empty = list(index)
+            empty[axis] = 0
+            probs[tuple(index)] -= probs[tuple(empty)]
+        return np.maximum(probs, 0.0)
@@ -0,0 +1,140 @@
+"""
+Most probable output patterns found by bounded search, without enumerating the output space.
+
+Patterns are searched sector by sector (total photon number), building each
+pattern mode by mode. A partial pattern is pruned as soon as the smallest
+single-mode marginal probability among its assigned modes cannot beat the
+current k-th best outcome, since p(n) <= P_j(n_j) for every mode j.
+"""
+
+import heapq
+import itertools
+import time
+
+import numpy as np
+
+from gaussian_probs import pattern_key
+
+
+def marginal_bound(marginal, n):
+    """
+    Upper bound on P_j(n) from a (possibly truncated) single-mode marginal
+    """
+    if n < len(marginal):
+        return marginal[n]
+    # Outside the cutoff all we know is the leftover tail mass
+    return max(1.0 - float(np.sum(marginal)), 0.0)
+
+
+def sector_bound(mode_marginals, total):
+    """
+    Upper bound on any pattern with `total` photons: some mode holds at least total / modes of them
+    """
+    least = -(-total // len(mode_marginals))
+    bound = 0.0
+    for marginal in mode_marginals:
+        tail = float(np.sum(marginal[least:])) + marginal_bound(marginal, len(marginal))
+        bound = max(bound, min(tail, 1.0))
+    return bound
+
+
+def top_k_outcomes(prob, mode_marginals, sectors, k, max_evaluations=10000, time_limit=None, sectors_complete=False):
+    """
+    Find the k most probable patterns.
+
+    `prob(pattern)` evaluates one outcome, `mode_marginals[j][n]` is the
+    probability of n photons in mode j and `sectors` lists the total photon
+    numbers to search, in order; `sectors_complete` says they hold all the
+    probability mass (photon-number conserving circuits). The returned
+    `max_unseen_probability` bounds every pattern that was not evaluated; the
+    ranking is certified when that bound does not exceed the k-th returned
+    probability.
+    """
+    modes = len(mode_marginals)
+    best = []  # min-heap of (probability, tiebreak, pattern)
+    counter = itertools.count()
+    evaluated_mass = 0.0
+    evaluations = 0
+    max_pruned = 0.0
+    deadline = None if time_limit is None else time.monotonic() + time_limit
+
+    def threshold():
+        return best[0][0] if len(best) == k else 0.0
+
+    def search(prefix, remaining, bound):
+        nonlocal evaluated_mass, evaluations, max_pruned
+        mode = len(prefix)
+        if mode == modes - 1:
+            choices = [remaining]
+        else:
+            # Try the most likely photon numbers first so the threshold rises early
+            choices = sorted(range(remaining + 1), key=lambda n: -marginal_bound(mode_marginals[mode], n))
+        for n in choices:
+            child_bound = min(bound, marginal_bound(mode_marginals[mode], n))
+            if child_bound <= threshold():
+                max_pruned = max(max_pruned, child_bound)
+                continue
+            if mode < modes - 1:
+                if not search(prefix + (n,), remaining - n, child_bound):
+                    return False
+                continue
+            if evaluations >= max_evaluations or (deadline is not None and time.monotonic() > deadline):
+                return False
+            pattern = prefix + (n,)
+            p = prob(pattern)
+            evaluations += 1
+            evaluated_mass += p
+            entry = (p, next(counter), pattern)
+            if len(best) < k:
+                heapq.heappush(best, entry)
+            elif p > best[0][0]:
+                heapq.heapreplace(best, entry)
+        return True
+
+    finished = True
+    for total in sectors:
+        # Sector bounds only shrink with the photon number, so nothing further can make the top k
+        bound = sector_bound(mode_marginals, total)
+        if bound <= threshold():
+            max_pruned = max(max_pruned, bound)
+            sectors_complete = True
+            break
+        if not search((), total, 1.0):
+            finished = False
+            break
+        # Every outcome in later sectors is bounded by the mass not seen yet
+        if len(best) == k and 1.0 - evaluated_mass <= threshold():
+            finished = False
+            break
+    if not (finished and sectors_complete):
+        max_pruned = max(max_pruned, 1.0 - evaluated_mass)
+
+    ranked = sorted(best, reverse=True)
+    returned_mass = sum(p for p, _, _ in ranked)
+    kth = ranked[-1][0] if len(ranked) == k else 0.0
+    max_unseen = min(max(max_pruned, 0.0), 1.0)
+    return {
+        'outcomes': [{'pattern': pattern_key(pattern), 'probability': float(p)} for p, _, pattern in ranked],
+        'remaining_mass': float(max(1.0 - returned_mass, 0.0)),
+        'max_unseen_probability': float(max_unseen),
+        'certified': bool(max_unseen <= kth),
+        'evaluations': evaluations,
+    }
+
+
+def distribution_top_k(distribution, k):
+    """
+    The k most probable patterns of an exact {pattern key: probability} distribution, in the format of top_k_outcomes
+    """
+    ranked = sorted(distribution.items(), key=lambda item: -item[1])[:k]
+    returned_mass = sum(p for _, p in ranked)
+    kth = ranked[-1][1] if len(ranked) == k else 0.0
+    # Every listed pattern was evaluated; only mass missing from the distribution is unseen
+    max_unseen = max(1.0 - float(sum(distribution.values())), 0.0)
+    return {
+        'outcomes': [{'pattern': key, 'probability': float(p)} for key, p in ranked],
+        'remaining_mass': float(max(1.0 - returned_mass, 0.0)),
+        'max_unseen_probability': float(max_unseen),
+        'certified': bool(max_unseen <= kth),
+        'evaluations': len(distribution),
+    }
@@ -0,0 +1,231 @@
+"""
+Process pool shared by the simulation kernels.
+
+The HTTP servers handle one request at a time, so a single long-lived pool
+is enough; it is created on first use so that importing the kernels stays
+cheap. Set UNIQORN_WORKERS to limit the number of processes.
+
+fill_parallel fills an outcome space of independent evaluations: the items
+are split into chunks, and every worker writes its values straight into one
+shared result (a shared-memory segment, or a memory-mapped NPY file), so
+large results are never pickled back through the pool.
+
+Only this process creates segments; workers attach to them by name, so a
+worker that crashes cannot leak one. A segment is unlinked as soon as the
+array on it is garbage collected, so callers read the result in place
+without a copy. Segments of a server that was killed are removed by
+multiprocessing's resource tracker, and any left behind by dead processes
+are swept when the next pool starts.
+"""
+
+import os
+import uuid
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker, shared_memory
+
+import numpy as np
+
+# Chunks per worker, so uneven chunk costs still balance out
+CHUNKS_PER_WORKER = 4
+
+# Results smaller than this are pickled back; larger ones go through shared memory
+SHARED_MIN_BYTES = 1024 ** 2
+
+# Segment names are SEGMENT_PREFIX + owner pid + '_' + random hex
+SEGMENT_PREFIX = 'uniqorn_'
+SEGMENT_DIR = '/dev/shm'
+
+# Live segments of this process by name, with their sizes
+_segments = {}
+
+_pool = None
+
+
+def worker_count():
+    """
+    Number of worker processes to use
+    """
+    return max(int(os.environ.get('UNIQORN_WORKERS', os.cpu_count() or 1)), 1)
+
+
+def get_pool():
+    """
+    Return the shared process pool, starting it if needed
+    """
+    global _pool
+    # A worker that died leaves the pool broken; start a fresh one
+    if _pool is None or getattr(_pool, '_broken', False):
+        if _pool is None:
+            reclaim_segments()
+        # Workers forked after this share one resource tracker, which unlinks what a killed server leaves
+        resource_tracker.ensure_running()
+        _pool = ProcessPoolExecutor(max_workers=worker_count())
+    return _pool
+
+
+def split_range(start, stop, parts):
+    """
+    Split [start, stop) into at most `parts` contiguous chunks of similar size
+    """
+    parts = max(min(parts, stop - start), 1)
+    bounds = [start + (stop - start) * i // parts for i in range(parts + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(parts) if bounds[i] < bounds[i + 1]]
+
+
+def shared_array(shape, dtype):
+    """
+    New array backed by a shared-memory segment, and the segment.
+
+    The segment is unlinked when the array (and every view of it) is garbage collected.
+    """
+    dtype = np.dtype(dtype)
+    name = f'{SEGMENT_PREFIX}{os.getpid()}_{uuid.uuid4().hex[:16]}'
+    segment = shared_memory.SharedMemory(name=name, create=True, size=max(int(np.prod(shape)) * dtype.itemsize, 1))
+    array = np.ndarray(shape, dtype=dtype, buffer=segment.buf)
+    _segments[segment.name] = segment.size
+    weakref.finalize(array, release_segment, segment)
+    return segment, array
+
+
+def release_segment(segment):
+    """
+    Unlink a segment this process created and unmap it
+    """
+    _segments.pop(segment.name, None)
+    try:
+        segment.unlink()
+    except FileNotFoundError:
+        pass
+    segment.close()
+
+
+def reclaim_segments():
+    """
+    Unlink the segments left behind by processes that no longer exist, returning how many
+    """
+    if not os.path.isdir(SEGMENT_DIR):
+        return 0
+    reclaimed = 0
+    for name in os.listdir(SEGMENT_DIR):
+        if not name.startswith(SEGMENT_PREFIX):
+            continue
+        owner = name[len(SEGMENT_PREFIX):].split('_')[0]
+        if not owner.isdigit() or process_alive(int(owner)):
+            continue
+        try:
+            os.remove(os.path.join(SEGMENT_DIR, name))
+            reclaimed += 1
+        except OSError:
+            pass
+    return reclaimed
+
+
+def process_alive(pid):
+    """
+    Whether a process with this id exists
+    """
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def segment_stats():
+    """
+    Shared-memory segments this process holds, for the metrics endpoint
+    """
+    return {'segments': len(_segments), 'bytes': sum(_segments.values())}
+
+
+def describe(array, segment=None):
+    """
+    Picklable description of a shared result that another process can open
+    """
+    if segment is not None:
+        return 'segment', segment.name, array.shape, array.dtype.str, 0
+    return 'file', array.filename, array.shape, array.dtype.str, array.offset
+
+
+def open_shared(description):
+    """
+    Array described by describe(), plus the segment to close after use (None for files)
+    """
+    kind, name, shape, dtype, offset = description
+    if kind == 'segment':
+        segment = shared_memory.SharedMemory(name=name)
+        return np.ndarray(shape, dtype=dtype, buffer=segment.buf), segment
+    return np.memmap(name, dtype=dtype, mode='r+', offset=offset, shape=shape), None
+
+
+def fill_chunk(kernel, payload, items, start, description):
+    """
+    Worker side: write kernel(payload, items) into result[start:start + len(items)],
+    or return the values when there is no shared result
+    """
+    if description is None:
+        return kernel(payload, items)
+    result, segment = open_shared(description)
+    try:
+        result[start:start + len(items)] = kernel(payload, items)
+        if segment is None:
+            result.flush()
+    finally:
+        del result
+        if segment is not None:
+            # Attached, not owned: the creating process unlinks it
+            segment.close()
+
+
+def fill_parallel(kernel, payload, items, dtype=float, out=None, min_items=1, row_shape=()):
+    """
+    Evaluate kernel(payload, chunk) -> one value per item over `items`, in parallel, into a flat result.
+
+    With a `row_shape`, every item gives an array of that shape instead, and
+    the result has shape (len(items),) + row_shape.
+
+    `items` is anything that slices into chunks, e.g. a list of patterns or
+    range(count) for an index space. `out` may be a flat memory map of an NPY
+    file, which the workers then write directly. Otherwise results of at
+    least SHARED_MIN_BYTES are written into a shared-memory segment and
+    returned on it without a copy, and smaller ones are pickled back. Fewer
+    than `min_items` items, or a single worker, run in this process.
+    """
+    dtype = np.dtype(dtype)
+    count = len(items)
+    if worker_count() == 1 or count < max(min_items, 2):
+        values = np.asarray(kernel(payload, items), dtype=dtype) if count else np.zeros((0,) + row_shape, dtype=dtype)
+        if out is None:
+            return values
+        out[:] = values
+        return out
+
+    chunks = split_range(0, count, worker_count() * CHUNKS_PER_WORKER)
+    if out is not None:
+        out.flush()
+        result, description = out, describe(out)
+    elif count * int(np.prod(row_shape)) * dtype.itemsize >= SHARED_MIN_BYTES:
+        segment, result = shared_array((count,) + row_shape, dtype)
+        description = describe(result, segment)
+    else:
+        result, description = np.empty((count,) + row_shape, dtype=dtype), None
+
+    futures = []
+    try:
+        pool = get_pool()
+        for start, stop in chunks:
+            futures.append(pool.submit(fill_chunk, kernel, payload, items[start:stop], start, description))
+        for (start, stop), future in zip(chunks, futures):
+            values = future.result()
+            if description is None:
+                result[start:stop] = values
+    except BrokenProcessPool:
+        raise RuntimeError('A worker process died while filling the result; the pool is restarted on the next request')
+    finally:
+        for future in futures:
+            future.cancel()
+    return result